@@ -0,0 +1,78 @@
+"""add deck search profiles
+
+Revision ID: 3b9d0f6c2a71
+Revises: ef4a0e644933
+Create Date: 2026-10-17 21:10:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "3b9d0f6c2a71"
+down_revision = "ef4a0e644933"
+branch_labels = None
+depends_on = None
+
+DEFAULT_PROFILE_ID = 1
+COLUMN_NAME = "deck_search_profile_id"
+
+
+def upgrade():
+    op.create_table(
+        "deck_search_profiles",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("name", sa.String(length=40), nullable=True),
+        # The enum types already exist for the decks table.
+        sa.Column("deck_type", postgresql.ENUM(name="decktype", create_type=False)),
+        sa.Column("archetype", postgresql.ENUM(name="archetype", create_type=False)),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute(
+        "INSERT INTO deck_search_profiles (id, name) "
+        f"VALUES ({DEFAULT_PROFILE_ID}, 'Default')"
+    )
+    op.execute(
+        "SELECT setval('deck_search_profiles_id_seq', "
+        "(SELECT MAX(id) FROM deck_search_profiles))"
+    )
+    op.add_column(
+        "users",
+        sa.Column(
+            COLUMN_NAME,
+            sa.Integer(),
+            sa.ForeignKey("deck_search_profiles.id"),
+            nullable=True,
+        ),
+    )
+
+    # Profiles may share windows, so the profile is part of the key.
+    op.execute(
+        "UPDATE weighted_deck_search SET profile_id = "
+        f"{DEFAULT_PROFILE_ID} WHERE profile_id IS NULL"
+    )
+    op.drop_constraint(
+        "weighted_deck_search_pkey", "weighted_deck_search", type_="primary"
+    )
+    op.create_primary_key(
+        "weighted_deck_search_pkey",
+        "weighted_deck_search",
+        ["deck_search_id", "profile_id", "name"],
+    )
+
+
+def downgrade():
+    op.execute(
+        f"DELETE FROM weighted_deck_search WHERE profile_id != {DEFAULT_PROFILE_ID}"
+    )
+    op.drop_constraint(
+        "weighted_deck_search_pkey", "weighted_deck_search", type_="primary"
+    )
+    op.create_primary_key(
+        "weighted_deck_search_pkey", "weighted_deck_search", ["deck_search_id", "name"]
+    )
+    op.drop_column("users", COLUMN_NAME)
+    op.drop_table("deck_search_profiles")
@@ -0,0 +1,25 @@
+"""add half life to deck searches
+
+Revision ID: 8c41e7a5d2f0
+Revises: 3b9d0f6c2a71
+Create Date: 2026-10-17 21:30:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8c41e7a5d2f0"
+down_revision = "3b9d0f6c2a71"
+branch_labels = None
+depends_on = None
+
+COLUMN_NAME = "half_life_days"
+
+
+def upgrade():
+    op.add_column("deck_searches", sa.Column(COLUMN_NAME, sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("deck_searches", COLUMN_NAME)
@@ -70,7 +70,10 @@ def setup_application(app):
 def _register_views(app):
     logging.info("Registering views")
     from infiltrate.views.card_values.cards_view import CardsView
+    from infiltrate.views.deck_search_profiles import DeckSearchProfilesView
+    from infiltrate.views.decks_view import DecksView
     from infiltrate.views.update_api import UpdateAPI
+    from infiltrate.views.instrumentation_api import InstrumentationAPI
     from infiltrate.views.login import LoginView, RegisterView
     from infiltrate.views.purchases_view import PurchasesView
     from infiltrate.views.update_collection import UpdateCollectionView
@@ -79,10 +82,13 @@ def _register_views(app):
     from infiltrate.views.raw_data import RawDataView
 
     CardsView.register(app)
+    DeckSearchProfilesView.register(app)
+    DecksView.register(app)
     PurchasesView.register(app)
     LoginView.register(app)
     RegisterView.register(app)
     UpdateAPI.register(app)
+    InstrumentationAPI.register(app)
     UpdateCollectionView.register(app)
     UpdateKeyView.register(app)
     FaqView.register(app)
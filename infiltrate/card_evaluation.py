@@ -1,320 +1,935 @@
-"""Contains Dataframe wrappers for additional analysis on card data.
+"""Contains the pipeline for additional analysis on card data.
 
-Class Dependencies:
+Stage Dependencies:
 Play Counts (Weighted Deck Searches)
 Play Rates (Play Counts)
 Play Value (Play Rates, Collection Fit)
 Play Craft Efficiency (Play Value, Findability, Cost)
-Own Value (Play Value, Play Craft Efficiency)
+Own Value (Play Value, Play Craft Efficiency, Collection)
+Collection Fit (Play Value, Card Neighbours, Collection)
 
 Own Craft Efficiency (Own Value, Findability, Cost)
 Purchase Efficiency (Own Value, Cost)
+
+Everything up to Play Craft Efficiency is the same for every user, so it is
+stored after each deck search update and only the collection is applied per user.
+
+Stages add their columns in place to the pipeline's CardPlaysets, with a row per card.
+The long OwnValueFrame with a row per card copy is only made for the views.
 """
+import functools
+import logging
 import typing as t
 
+import flask_login
 import numpy as np
 import pandas as pd
 import werkzeug.local
 
 import infiltrate.card_frame_bases as card_frame_bases
-import infiltrate.df_types as df_types
-import infiltrate.models.card_set as card_set
+import infiltrate.deck_store as deck_store
+import infiltrate.instrumentation as instrumentation
+import infiltrate.models.card_play_value as card_play_value
 import infiltrate.models.deck_constants as deck_constants
+import infiltrate.models.rarity as rarities
 import infiltrate.rewards as rewards
-from infiltrate.models.deck_search import WeightedDeckSearch, get_weighted_deck_searches
-from infiltrate.models.rarity import Rarity
+from infiltrate.models.deck_search import (
+    DEFAULT_PROFILE_ID,
+    WeightedDeckSearch,
+    get_weighted_deck_searches,
+    get_weighted_play_counts,
+)
+from infiltrate.models.card import CardId
+from infiltrate.models.deck import DeckType
 from infiltrate.models.user import User, collection
 
 
-# TODO Important. Add card values to the database as a column on cards. Everyone has the
-#   same basic card values. Later mask with ownership to make individual.
+def _count_cards(pipeline: "CardValuePipeline", *args, **kwargs) -> int:
+    return len(pipeline.playsets)
 
 
-class PlayCountFrame(card_frame_bases.CardCopy):
-    """Has column play_count representing the number of decks containing
-     the weighted count of that card in decks of all deck searches"""
+def _count_cards_after(_, pipeline: "CardValuePipeline", *args, **kwargs) -> int:
+    return len(pipeline.playsets)
 
-    PLAY_COUNT_NAME = "num_decks_with_count_or_less"
 
+# Records a pipeline stage in the instrumentation registry.
+_measured_stage = instrumentation.measured(
+    count_rows_in=_count_cards, count_rows_out=_count_cards_after
+)
+
+
+class _Stage(t.NamedTuple):
+    """A step of the card value pipeline."""
+
+    method_name: str
+    input_names: t.Tuple[str, ...]
+    output_names: t.Tuple[str, ...]
+    argument_names: t.Tuple[str, ...] = ()
+
+
+class CardValuePipeline:
+    """Calculates card values by adding columns in place to one CardPlaysets.
+
+    Stages must be run after the stages they depend on,
+    and record the columns they add in derived_columns.
+    evaluate runs only the stages needed for the requested columns."""
+
+    SET_NUM_NAME = card_frame_bases.CardPlaysets.SET_NUM_NAME
+    CARD_NUM_NAME = card_frame_bases.CardPlaysets.CARD_NUM_NAME
+    COUNT_IN_DECK_NAME = card_frame_bases.CardPlaysets.COUNT_IN_DECK_NAME
     RARITY_NAME = "rarity"
     IMAGE_URL_NAME = "image_url"
     DETAILS_URL_NAME = "details_url"
     IS_IN_DRAFT_PACK_NAME = "is_in_draft_pack"
 
-    def __init__(self, *args):
-        card_frame_bases.CardCopy.__init__(self, *args)
-        self.num_decks_with_count_or_less = self.num_decks_with_count_or_less
-
-    @classmethod
-    def from_weighted_deck_searches(
-        cls,
-        weighted_deck_searches: t.List[WeightedDeckSearch],
-        card_details: card_frame_bases.CardDetails,
-    ):
-        """Build the dataframe from the list of weighted deck searches."""
-        play_count_dfs: t.List[pd.DataFrame] = []
-        for weighted_deck_search in weighted_deck_searches:
-            play_count_dfs.append(cls._get_count_df(weighted_deck_search))
-
-        play_count_dfs.append(PlayCountFrame._make_empty_base_frame(card_details))
-
-        index_keys = [cls.SET_NUM_NAME, cls.CARD_NUM_NAME]
-        combined_df = cls._sum_count_dfs(play_count_dfs).set_index(index_keys)
+    PLAY_COUNT_NAME = "num_decks_with_count_or_less"
+    PLAY_RATE_NAME = "play_rate"
+    PLAY_VALUE_NAME = "play_value"
+    CRAFT_COST_NAME = "craft_cost"
+    FINDABILITY_NAME = "findability"
+    PLAY_CRAFT_EFFICIENCY_NAME = "play_craft_efficiency"
+    PLAY_CRAFT_EFFICIENCY_RANK_NAME = "play_craft_efficiency_rank"
 
-        added_card_data_df = combined_df.join(card_details)
+    IS_OWNED_NAME = "is_owned"
+    SELL_COST_NAME = "sell_cost"
+    RESELL_VALUE_NAME = "resell_value"
+    OWN_VALUE_NAME = "own_value"
+    COLLECTION_FIT_NAME = "collection_fit"
+    FIT_PLAY_VALUE_NAME = "fit_play_value"
 
-        return cls(added_card_data_df)
+    VALUE_SCALE = 100
+    # The most play value is increased by for cards fitting the collection.
+    FIT_WEIGHT = 0.5
+
+    # In an order where each stage follows the stages it depends on.
+    STAGES = [
+        _Stage(
+            "add_play_counts",
+            (),
+            (PLAY_COUNT_NAME,),
+            ("weighted_deck_searches", "deck_type"),
+        ),
+        _Stage("add_play_rates", (PLAY_COUNT_NAME,), (PLAY_RATE_NAME,)),
+        _Stage("add_play_values", (PLAY_COUNT_NAME,), (PLAY_VALUE_NAME,)),
+        _Stage(
+            "add_play_craft_efficiencies",
+            (RARITY_NAME, PLAY_VALUE_NAME),
+            (CRAFT_COST_NAME, FINDABILITY_NAME, PLAY_CRAFT_EFFICIENCY_NAME),
+        ),
+        _Stage(
+            "add_play_craft_efficiency_ranks",
+            (PLAY_CRAFT_EFFICIENCY_NAME,),
+            (PLAY_CRAFT_EFFICIENCY_RANK_NAME,),
+        ),
+        _Stage("add_ownership", (), (IS_OWNED_NAME,), ("card_counts",)),
+        _Stage(
+            "add_own_values",
+            (
+                RARITY_NAME,
+                PLAY_VALUE_NAME,
+                PLAY_CRAFT_EFFICIENCY_NAME,
+                PLAY_CRAFT_EFFICIENCY_RANK_NAME,
+                IS_OWNED_NAME,
+            ),
+            (SELL_COST_NAME, RESELL_VALUE_NAME, OWN_VALUE_NAME),
+            ("num_options_considered",),
+        ),
+        _Stage(
+            "add_collection_fit",
+            (PLAY_VALUE_NAME, IS_OWNED_NAME),
+            (COLLECTION_FIT_NAME, FIT_PLAY_VALUE_NAME),
+            ("card_neighbours",),
+        ),
+    ]
+
+    # Card details the stages need. Others are joined when making frames.
+    CARD_DETAIL_NAMES = [RARITY_NAME]
+
+    def __init__(
+        self,
+        playsets: card_frame_bases.CardPlaysets,
+        derived_columns: t.Iterable[str] = (),
+    ):
+        self.playsets = playsets
+        self.derived_columns: t.List[str] = list(derived_columns)
+        self.top_craft_options: t.Optional[TopCraftOptions] = None
+        self.card_neighbours: t.Optional[deck_store.CardNeighbours] = None
 
     @classmethod
-    def _make_empty_base_frame(cls, card_details):
-        base_frame_rows = []
-        for index, card in card_details.iterrows():
-            for copy_num in range(1, 5):
-                base_frame_rows.append(
-                    [0, card["set_num"], card["card_num"], copy_num, 0]
+    def from_card_details(cls, card_details: card_frame_bases.CardDetails):
+        """Starts a pipeline with the card details the stages need."""
+        playsets = card_frame_bases.CardPlaysets.from_card_details(
+            card_details, cls.CARD_DETAIL_NAMES
+        )
+        return cls(playsets)
+
+    def branch(self) -> "CardValuePipeline":
+        """A pipeline sharing this one's columns, which can have columns added
+        without changing this one. Shared arrays must not be modified in place."""
+        return CardValuePipeline(self.playsets.copy(), self.derived_columns)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.playsets[name]
+
+    def __contains__(self, name: str):
+        return name in self.playsets
+
+    def evaluate(self, column_names: t.Iterable[str], **stage_arguments):
+        """Runs only the stages needed to add the given columns,
+        giving each the stage_arguments it takes.
+        Columns no stage adds, such as card details, are ignored."""
+        for stage in self._get_stages_for(column_names):
+            arguments = {
+                name: stage_arguments[name]
+                for name in stage.argument_names
+                if name in stage_arguments
+            }
+            getattr(self, stage.method_name)(**arguments)
+
+    def _get_stages_for(self, column_names: t.Iterable[str]) -> t.List[_Stage]:
+        """Gets the stages adding the missing columns, and those they depend on,
+        in the order to run them."""
+        needed_names = {name for name in column_names if name not in self}
+        stages = []
+        for stage in reversed(self.STAGES):
+            if needed_names.intersection(stage.output_names):
+                stages.append(stage)
+                needed_names.difference_update(stage.output_names)
+                needed_names.update(
+                    name for name in stage.input_names if name not in self
                 )
-        empty_base_frame = pd.DataFrame(
-            base_frame_rows,
-            columns=[
-                "decksearch_id",
-                "set_num",
-                "card_num",
-                "count_in_deck",
-                "num_decks_with_count_or_less",
-            ],
-        )
-        return empty_base_frame
+        return stages[::-1]
+
+    def _add_column(self, name: str, values):
+        self.playsets[name] = values
+        if name not in self.derived_columns:
+            self.derived_columns.append(name)
+
+    def _require(self, *names: str):
+        missing = [name for name in names if name not in self.playsets]
+        if missing:
+            raise ValueError(
+                f"Columns {missing} are needed. Run the stages adding them first."
+            )
 
-    @classmethod
-    def _get_count_df(cls, weighted_deck_search: WeightedDeckSearch):
-        """Get a dataframe representing the number of times a card is seen in
-        decks in the deck search, times its weight."""
-        play_count_df = df_types.sqlalchemy_objects_to_df(
-            weighted_deck_search.deck_search.cards
+    @_measured_stage
+    def add_play_counts(
+        self,
+        weighted_deck_searches: t.List[WeightedDeckSearch],
+        deck_type: t.Optional[DeckType] = None,
+    ):
+        """Adds play_count representing the number of decks containing
+        the weighted count of that card in decks of all deck searches,
+        counting only decks of the deck type if given."""
+        play_counts = np.zeros((len(self.playsets), self.playsets.MAX_COPIES))
+        count_df = get_weighted_play_counts(weighted_deck_searches, deck_type)
+        rows = self.playsets.get_rows(
+            count_df[self.SET_NUM_NAME].values, count_df[self.CARD_NUM_NAME].values
         )
-        play_count_df.num_decks_with_count_or_less *= weighted_deck_search.weight
-        return play_count_df
-
-    @classmethod
-    def _sum_count_dfs(cls, play_count_dfs: t.List[pd.DataFrame]) -> pd.DataFrame:
-        combined = pd.concat(play_count_dfs).copy()
-        summed = (
-            combined.groupby(
-                [combined.set_num, combined.card_num, combined.count_in_deck]
-            )
-            .sum()
-            .reset_index()
+        is_known = rows >= 0
+        np.add.at(
+            play_counts,
+            (
+                rows[is_known],
+                count_df[self.COUNT_IN_DECK_NAME].values[is_known].astype(int) - 1,
+            ),
+            count_df[self.PLAY_COUNT_NAME].values[is_known],
         )
-        return summed
-
-
-class PlayRateFrame(PlayCountFrame):
-    """Has column play_rate representing the fraction of decks containing the card
- in relevant deck searches."""
-
-    PLAY_RATE_NAME = "play_rate"
-
-    def __init__(self, *args):
-        PlayCountFrame.__init__(self, *args)
-        self.play_rate = self.play_rate
-
-    @classmethod
-    def from_play_counts(cls, play_count_frame: PlayCountFrame):
-        """Constructor deriving play rates from play counts"""
-        df = play_count_frame.copy()
-        total_card_inclusions = sum(df[cls.PLAY_COUNT_NAME])
-        df[cls.PLAY_RATE_NAME] = (
-            df[cls.PLAY_COUNT_NAME]
+        self._add_column(self.PLAY_COUNT_NAME, play_counts)
+
+    @_measured_stage
+    def add_play_rates(self):
+        """Adds play_rate representing the fraction of decks containing the card
+        in relevant deck searches."""
+        self._require(self.PLAY_COUNT_NAME)
+        play_counts = self[self.PLAY_COUNT_NAME]
+        total_card_inclusions = play_counts.sum()
+        self._add_column(
+            self.PLAY_RATE_NAME,
+            play_counts
             * deck_constants.AVG_COLLECTABLE_CARDS_IN_DECK
-            / total_card_inclusions
+            / total_card_inclusions,
         )
-        return cls(df)
 
+    @_measured_stage
+    def add_play_values(self):
+        """Adds play_value representing how good it is to be able to play that card,
+        on a scale of 0-100.
+        This is very similar to own value, but doesn't account for reselling."""
+        # Collection fit is per user, so it is added by add_collection_fit.
+        self._require(self.PLAY_COUNT_NAME)
+        play_counts = self[self.PLAY_COUNT_NAME]
+        self._add_column(
+            self.PLAY_VALUE_NAME, play_counts * self.VALUE_SCALE / play_counts.max()
+        )
 
-class PlayValueFrame(PlayRateFrame):
-    """Has column play_value representing how good it is to be able to play that card,
-    on a scale of 0-100.
-    This is very similar to own value, but doesn't account for reselling."""
-
-    VALUE_SCALE = 100
+    @_measured_stage
+    def add_play_craft_efficiencies(self):
+        """Adds craft_cost, findability and play_craft_efficiency representing the
+        card's shiftstone cost to craft, its chance to be found, and its play value
+        divided by that cost.
+        This is very similar to own crafting efficiency,
+        but doesn't account for reselling."""
+        self._require(self.RARITY_NAME, self.PLAY_VALUE_NAME)
 
-    PLAY_VALUE_NAME = "play_value"
-    IS_OWNED_NAME = "is_owned"
-    _metadata = ["user"]
+        craft_cost = rarities.ENCHANTS[self[self.RARITY_NAME]]
+        self._add_column(self.CRAFT_COST_NAME, craft_cost)
 
-    def __init__(self, user: User, *args):
-        PlayRateFrame.__init__(self, *args)
-        self.user = user
-        self.play_value = self.play_value
+        findability = self.get_findability(
+            rarity_codes=self[self.RARITY_NAME], set_nums=self.playsets.set_nums
+        )
+        self._add_column(self.FINDABILITY_NAME, findability)
+
+        self._add_column(
+            self.PLAY_CRAFT_EFFICIENCY_NAME,
+            self.findability_scalar(
+                findability=findability[:, np.newaxis],
+                craft_efficiency=(
+                    self[self.PLAY_VALUE_NAME] / craft_cost[:, np.newaxis]
+                ),
+            ),
+        )
 
-    def __hash__(self):
-        return hash(self.user)
+    @_measured_stage
+    def add_play_craft_efficiency_ranks(self):
+        """Adds play_craft_efficiency_rank, the position of each card copy
+        when all copies are sorted by descending play craft efficiency.
+        This lets users' top crafting options be found without sorting."""
+        self._require(self.PLAY_CRAFT_EFFICIENCY_NAME)
+        efficiencies = self[self.PLAY_CRAFT_EFFICIENCY_NAME]
+        order = np.argsort(-efficiencies.ravel(), kind="stable")
+        ranks = np.empty_like(order)
+        ranks[order] = np.arange(len(order))
+        self._add_column(
+            self.PLAY_CRAFT_EFFICIENCY_RANK_NAME, ranks.reshape(efficiencies.shape)
+        )
 
-    @classmethod
-    def from_play_rates(
-        cls, user: User, play_rate_frame: PlayRateFrame, ownership: pd.DataFrame,
+    def add_shared_values(
+        self,
+        weighted_deck_searches: t.List[WeightedDeckSearch],
+        deck_type: t.Optional[DeckType] = None,
     ):
-        """Constructor deriving values from play rates."""
-        # todo account for collection fit.
-        df: pd.DataFrame = play_rate_frame.copy()
-        df[cls.PLAY_VALUE_NAME] = (
-            df["num_decks_with_count_or_less"]
-            * cls.VALUE_SCALE
-            / df["num_decks_with_count_or_less"].max()
+        """Runs the stages which are the same for every user."""
+        self.add_play_counts(weighted_deck_searches, deck_type)
+        self.add_play_rates()
+        self.add_play_values()
+        self.add_play_craft_efficiencies()
+        self.add_play_craft_efficiency_ranks()
+
+    @_measured_stage
+    def add_ownership(self, card_counts: t.Dict[CardId, int]):
+        """Adds is_owned, if the user owns at least that many copies of the card."""
+        owned_counts = self.playsets.get_counts(card_counts)
+        self._add_column(
+            self.IS_OWNED_NAME,
+            owned_counts[:, np.newaxis] >= self.playsets.COPY_COUNTS[np.newaxis, :],
         )
 
-        ownership_frame = collection.create_is_owned_series(play_rate_frame, ownership)
+    @_measured_stage
+    def add_own_values(self, num_options_considered=20):
+        """Adds
+        -sell_cost: the amount of shiftstone from disenchanting,
+        -resell_value: the amount of expected value the shiftstone from disenchanting
+            has,
+        -own_value: the value of owning a card,
+            including the possibility of reselling it."""
+        self._require(
+            self.RARITY_NAME,
+            self.PLAY_VALUE_NAME,
+            self.PLAY_CRAFT_EFFICIENCY_NAME,
+            self.PLAY_CRAFT_EFFICIENCY_RANK_NAME,
+            self.IS_OWNED_NAME,
+        )
+        sell_cost = rarities.DISENCHANTS[self[self.RARITY_NAME]]
+        self._add_column(self.SELL_COST_NAME, sell_cost)
 
-        df = df.join(
-            ownership_frame.drop(
-                [cls.SET_NUM_NAME, cls.CARD_NUM_NAME, cls.COUNT_IN_DECK_NAME], axis=1
-            )
+        self.top_craft_options = TopCraftOptions(
+            efficiencies=self[self.PLAY_CRAFT_EFFICIENCY_NAME],
+            ranks=self[self.PLAY_CRAFT_EFFICIENCY_RANK_NAME],
+            is_owned=self[self.IS_OWNED_NAME],
         )
+        self.update_own_values(num_options_considered)
 
-        return cls(user, df)
+    @_measured_stage
+    def update_own_values(self, num_options_considered=20):
+        """Recalculates resell_value and own_value from the current top craft options."""
+        value_of_shiftstone = self.top_craft_options.get_value_of_shiftstone(
+            num_options_considered
+        )
 
+        resell_value = self[self.SELL_COST_NAME] * value_of_shiftstone
+        self._add_column(self.RESELL_VALUE_NAME, resell_value)
 
-class PlayCraftEfficiencyFrame(PlayValueFrame):
-    """Has columns craft_cost and play_craft_efficiency representing the card's
-    shiftstone cost to craft, and its play value divided by that cost.
-    This is very similar to own crafting efficiency, but doesn't account for reselling.
-    """
+        self._add_column(
+            self.OWN_VALUE_NAME,
+            np.maximum(self[self.PLAY_VALUE_NAME], resell_value[:, np.newaxis]),
+        )
 
-    PLAY_CRAFT_EFFICIENCY_NAME = "play_craft_efficiency"
-    CRAFT_COST_NAME = "craft_cost"
-    FINDABILITY_NAME = "findability"
+    @_measured_stage
+    def add_collection_fit(
+        self, card_neighbours: t.Optional[deck_store.CardNeighbours] = None
+    ):
+        """Adds
+        -collection_fit: the share of the cards most played alongside each card
+            that the user owns, weighted by how often they are played together,
+        -fit_play_value: the play value, increased by up to FIT_WEIGHT of itself
+            for cards fitting the collection.
+
+        Uses the stored card neighbours if not given them,
+        and gives every card no fit if they have not been built."""
+        self._require(self.PLAY_VALUE_NAME, self.IS_OWNED_NAME)
+        if card_neighbours is None:
+            card_neighbours = deck_store.get_card_neighbours()
+        self.card_neighbours = card_neighbours
+
+        fit = np.zeros(len(self.playsets))
+        if card_neighbours is not None:
+            rows = self.playsets.get_rows(
+                card_neighbours.set_nums, card_neighbours.card_nums
+            )
+            is_known = rows >= 0
+            # A neighbour is owned if any copy of it is.
+            is_owned = np.zeros(len(rows), dtype=bool)
+            is_owned[is_known] = self[self.IS_OWNED_NAME][rows[is_known], 0]
+            fit[rows[is_known]] = card_neighbours.get_fit(is_owned)[is_known]
+        self._add_column(self.COLLECTION_FIT_NAME, fit)
+        self._add_column(
+            self.FIT_PLAY_VALUE_NAME,
+            self[self.PLAY_VALUE_NAME] * (1 + self.FIT_WEIGHT * fit[:, np.newaxis]),
+        )
 
-    def __init__(self, user: User, *args):
-        PlayValueFrame.__init__(self, user, *args)
+    @_measured_stage
+    def update_ownership(
+        self,
+        old_card_counts: t.Dict[CardId, int],
+        new_card_counts: t.Dict[CardId, int],
+        num_options_considered=20,
+    ) -> t.Tuple[np.ndarray, bool]:
+        """Flips is_owned for only the copies whose ownership changed, and updates the
+        own values only if that changed the top craft options.
+
+        Collection fit is recalculated if it was added and any copies flipped.
+
+        Returns the positions of the flipped copies in the long frame,
+        and if the own values were updated."""
+        self._require(self.IS_OWNED_NAME, self.OWN_VALUE_NAME)
+        changed_counts = {
+            card_id: new_card_counts.get(card_id, 0)
+            for card_id in set(old_card_counts) | set(new_card_counts)
+            if old_card_counts.get(card_id, 0) != new_card_counts.get(card_id, 0)
+        }
+        rows = self.playsets.get_rows(
+            [card_id.set_num for card_id in changed_counts],
+            [card_id.card_num for card_id in changed_counts],
+        )
+        counts = np.fromiter(changed_counts.values(), dtype=int, count=len(rows))
+        is_known = rows >= 0
+        rows = rows[is_known]
+        new_is_owned = counts[is_known, np.newaxis] >= self.playsets.COPY_COUNTS
+
+        # This branch made is_owned, so it can be changed in place.
+        is_owned = self[self.IS_OWNED_NAME]
+        flipped_rows, flipped_copies = np.nonzero(is_owned[rows] != new_is_owned)
+        flipped_rows = rows[flipped_rows]
+        is_owned[rows] = new_is_owned
+
+        is_top_changed = False
+        for row, copy_index in zip(flipped_rows, flipped_copies):
+            is_top_changed |= self.top_craft_options.set_owned(
+                row, copy_index, is_owned[row, copy_index], num_options_considered
+            )
+        if is_top_changed:
+            self.update_own_values(num_options_considered)
+        if len(flipped_rows) and self.COLLECTION_FIT_NAME in self:
+            self.add_collection_fit(self.card_neighbours)
+
+        flipped_positions = flipped_rows * self.playsets.MAX_COPIES + flipped_copies
+        return flipped_positions, is_top_changed
+
+    def to_own_value_frame(
+        self,
+        user: User,
+        column_names: t.Optional[t.List[str]] = None,
+        card_details: t.Optional[card_frame_bases.CardDetails] = None,
+    ) -> "OwnValueFrame":
+        """Makes the long frame for the views, with a row per card copy.
+
+        Has the given columns or all of the pipeline's columns. Given columns the
+        pipeline doesn't have, such as urls, are joined from the card details."""
+        if column_names is None:
+            return OwnValueFrame(user, self.playsets.to_frame())
+
+        value_names = [name for name in column_names if name in self]
+        detail_names = [
+            name
+            for name in column_names
+            if name not in self and name not in OwnValueFrame.INDEX_NAMES
+        ]
+        frame = self.playsets.to_frame(value_names)
+        if detail_names:
+            rows = card_details.index.get_indexer(self.playsets.index)
+            for name in detail_names:
+                frame[name] = np.repeat(
+                    card_details[name].values[rows], self.playsets.MAX_COPIES
+                )
+        return OwnValueFrame(user, frame)
 
-        self.play_craft_efficiency = self.play_craft_efficiency
+    @classmethod
+    def from_weighted_deck_searches(
+        cls,
+        card_details: card_frame_bases.CardDetails,
+        weighted_deck_searches: t.Optional[t.List[WeightedDeckSearch]] = None,
+        deck_type: t.Optional[DeckType] = None,
+    ):
+        """Performs the user independent part of the pipeline."""
+        if weighted_deck_searches is None:
+            weighted_deck_searches = get_weighted_deck_searches()
+        pipeline = cls.from_card_details(card_details)
+        pipeline.add_shared_values(weighted_deck_searches, deck_type)
+        return pipeline
 
     @classmethod
-    def from_play_value(cls, play_value_frame: PlayValueFrame):
-        """Constructor for getting play craft efficiency from play value and cost."""
-        df: pd.DataFrame = play_value_frame.copy()
+    def from_stored(
+        cls, card_details: card_frame_bases.CardDetails, stored: pd.DataFrame
+    ):
+        """Constructor from the values saved by update_play_craft_efficiencies.
+        Cards added since then are given no value."""
+        pipeline = cls.from_card_details(card_details)
+        playsets = pipeline.playsets
 
-        df[cls.CRAFT_COST_NAME] = df[cls.RARITY_NAME].apply(
-            lambda rarity: rarity.enchant
+        rows = playsets.get_rows(
+            stored[cls.SET_NUM_NAME].values, stored[cls.CARD_NUM_NAME].values
         )
-
-        df[cls.FINDABILITY_NAME] = cls.get_findability(
-            rarity=df[cls.RARITY_NAME], set_num=df[cls.SET_NUM_NAME]
+        is_known = rows >= 0
+        rows = rows[is_known]
+        copies = stored[cls.COUNT_IN_DECK_NAME].values[is_known] - 1
+
+        per_copy_names = [
+            cls.PLAY_COUNT_NAME,
+            cls.PLAY_RATE_NAME,
+            cls.PLAY_VALUE_NAME,
+            cls.PLAY_CRAFT_EFFICIENCY_NAME,
+        ]
+        for name in per_copy_names:
+            values = np.zeros((len(playsets), playsets.MAX_COPIES))
+            values[rows, copies] = stored[name].values[is_known]
+            pipeline._add_column(name, values)
+
+        findability = np.zeros(len(playsets))
+        findability[rows] = stored[cls.FINDABILITY_NAME].values[is_known]
+        pipeline._add_column(cls.FINDABILITY_NAME, findability)
+        pipeline._add_column(
+            cls.CRAFT_COST_NAME, rarities.ENCHANTS[pipeline[cls.RARITY_NAME]]
         )
+        pipeline.add_play_craft_efficiency_ranks()
 
-        df[cls.PLAY_CRAFT_EFFICIENCY_NAME] = cls.findability_scalar(
-            findability=df[cls.FINDABILITY_NAME],
-            craft_efficiency=df[cls.PLAY_VALUE_NAME] / df[cls.CRAFT_COST_NAME],
-        )
+        return pipeline
+
+    @classmethod
+    @functools.lru_cache(maxsize=1)
+    @instrumentation.measured()
+    def get_shared(cls, card_details: card_frame_bases.CardDetails):
+        """Gets the stored user independent values, cached until they are updated.
+
+        The pipeline is shared between users, so branch it before adding columns."""
+        stored = card_play_value.CardPlayValue.as_df()
+        if stored.empty:
+            logging.warning("No stored card play values. Calculating them instead.")
+            return cls.from_weighted_deck_searches(card_details)
+        return cls.from_stored(card_details, stored)
 
-        return cls(play_value_frame.user, df)
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    @instrumentation.measured()
+    def get_shared_for_profile(
+        cls,
+        card_details: card_frame_bases.CardDetails,
+        profile_id: int,
+        deck_type: t.Optional[DeckType] = None,
+    ):
+        """Gets the user independent values of a deck search profile,
+        from only decks of the deck type if given,
+        cached until they are updated or the profile changes.
+
+        The pipeline is shared between users, so branch it before adding columns."""
+        if profile_id == DEFAULT_PROFILE_ID and deck_type is None:
+            return cls.get_shared(card_details)
+        return cls.from_weighted_deck_searches(
+            card_details, get_weighted_deck_searches(profile_id), deck_type
+        )
 
     @staticmethod
-    @np.vectorize
-    def get_findability(rarity: Rarity, set_num: int):
-        """Get the chance that a player will find the given card."""
-        # todo cost could be calculated once per card rather than once per count
+    def get_findability(rarity_codes, set_nums) -> np.ndarray:
+        """Get the chance that a player will find each of the given cards."""
         # TODO allow custom player profiles to override this.
         player: rewards.PlayerRewards = rewards.DEFAULT_PLAYER_REWARD_RATE
-        findability = player.get_chance_of_specific_card_drop_in_a_week(
-            rarity=rarity, card_set=card_set.CardSet(set_num)
+        findability = player.get_findabilities(
+            set_nums=set_nums, rarity_codes=rarity_codes
         )
         return findability
 
     @staticmethod
-    @np.vectorize
-    def findability_scalar(craft_efficiency: float, findability: float):
+    def findability_scalar(craft_efficiency, findability):
         """Scales the craft efficiency based on the findability."""
         return (1 - findability) * craft_efficiency
 
 
-class OwnValueFrame(PlayCraftEfficiencyFrame):
-    """Has columns
-    -sell_cost: the amount of shiftstone from disenchanting,
-    -resell_value: the amount of expected value the shiftstone from disenchanting has,
-    -own_value: the value of owning a card, including the possibility of reselling it.
-    """
+class TopCraftOptions:
+    """The card copies a user doesn't own, in descending order of play craft
+    efficiency, for finding what their shiftstone is best spent on.
 
-    SELL_COST_NAME = "sell_cost"
-    RESELL_VALUE_NAME = "resell_value"
-    OWN_VALUE_NAME = "own_value"
+    Built in linear time from the shared ranks, and kept up to date as single copies
+    change ownership, so any number of top options can be read without sorting."""
 
-    def __init__(self, user: User, *args):
-        if not (isinstance(user, User) or isinstance(user, werkzeug.local.LocalProxy)):
-            raise ValueError("Must be given user parameter of type User")
+    def __init__(
+        self, efficiencies: np.ndarray, ranks: np.ndarray, is_owned: np.ndarray
+    ):
+        self._num_copies = efficiencies.shape[1]
+        flat_ranks = ranks.ravel()
+        order = np.empty_like(flat_ranks)
+        order[flat_ranks] = np.arange(len(flat_ranks))
 
-        PlayCraftEfficiencyFrame.__init__(self, user, *args)
+        self._ranks = flat_ranks
+        self._efficiencies_by_rank = efficiencies.ravel()[order]
+        self._unowned_ranks = np.flatnonzero(~is_owned.ravel()[order])
 
-        self.sell_cost = self.sell_cost
-        self.resell_value = self.resell_value
-        self.own_value = self.own_value
+    def get_value_of_shiftstone(self, num_options_considered=20) -> float:
+        """Gets the top num_options crafting efficiencies and averages them to predict
+        how much value the user will get from crafting."""
+        top_ranks = self._unowned_ranks[:num_options_considered]
+        top_efficiencies = self._efficiencies_by_rank[top_ranks]
+        avg_top_efficiency = top_efficiencies.sum() / num_options_considered
+        return avg_top_efficiency
 
-    def __eq__(self, other):
-        return self.user == other.user
+    def set_owned(
+        self, row: int, copy_index: int, is_owned: bool, num_options_considered=20
+    ) -> bool:
+        """Updates for a single card copy changing ownership.
+        Returns if that changed the top num_options_considered options."""
+        rank = self._ranks[row * self._num_copies + copy_index]
+        position = np.searchsorted(self._unowned_ranks, rank)
+        was_owned = not (
+            position < len(self._unowned_ranks)
+            and self._unowned_ranks[position] == rank
+        )
+        if was_owned == is_owned:
+            return False
+
+        if is_owned:
+            self._unowned_ranks = np.delete(self._unowned_ranks, position)
+        else:
+            self._unowned_ranks = np.insert(self._unowned_ranks, position, rank)
+        return bool(position < num_options_considered)
 
-    def __hash__(self):
-        return hash(self.user)
 
-    def copy(self):
-        copy = super(OwnValueFrame, self).copy()
-        copy.__dict__ = self.__dict__.copy()
-        return copy
+class BatchOwnValues:
+    """Own values for many users at once, calculated with matrix operations over
+    the shared values.
+
+    Each array has a first axis of users, followed by the pipeline's axes."""
+
+    def __init__(
+        self,
+        is_owned: np.ndarray,
+        value_of_shiftstone: np.ndarray,
+        resell_value: np.ndarray,
+        own_value: np.ndarray,
+    ):
+        self.is_owned = is_owned
+        self.value_of_shiftstone = value_of_shiftstone
+        self.resell_value = resell_value
+        self.own_value = own_value
+
+    def __len__(self):
+        return len(self.value_of_shiftstone)
 
     @classmethod
-    def from_play_craft_efficiency(
-        cls, play_craft_efficiency: PlayCraftEfficiencyFrame, num_options_considered=20
+    def from_collections(
+        cls,
+        pipeline: CardValuePipeline,
+        card_counts_list: t.List[t.Dict[CardId, int]],
+        num_options_considered=20,
     ):
-        """Constructs the own_value """
+        """Creates from the users' collections and the shared values."""
+        return cls.from_ownership(
+            pipeline,
+            cls.ownership_matrix(pipeline, card_counts_list),
+            num_options_considered,
+        )
 
-        df = play_craft_efficiency.copy()
-        df[cls.SELL_COST_NAME] = df[cls.RARITY_NAME].apply(
-            lambda rarity: rarity.disenchant
+    @staticmethod
+    def ownership_matrix(
+        pipeline: CardValuePipeline, card_counts_list: t.List[t.Dict[CardId, int]]
+    ) -> np.ndarray:
+        """Gets a (users, cards, copies) array of if each user owns each card copy."""
+        counts = pipeline.playsets.get_count_matrix(card_counts_list)
+        return counts[:, :, np.newaxis] >= pipeline.playsets.COPY_COUNTS
+
+    @classmethod
+    @instrumentation.measured(
+        count_rows_in=lambda cls, pipeline, is_owned, *args, **kwargs: len(is_owned),
+        count_rows_out=lambda result, *args, **kwargs: len(result),
+    )
+    def from_ownership(
+        cls,
+        pipeline: CardValuePipeline,
+        is_owned: np.ndarray,
+        num_options_considered=20,
+    ):
+        """Creates from a (users, cards, copies) ownership matrix."""
+        pipeline._require(
+            CardValuePipeline.RARITY_NAME,
+            CardValuePipeline.PLAY_VALUE_NAME,
+            CardValuePipeline.PLAY_CRAFT_EFFICIENCY_NAME,
+            CardValuePipeline.PLAY_CRAFT_EFFICIENCY_RANK_NAME,
+        )
+        ranks = pipeline[CardValuePipeline.PLAY_CRAFT_EFFICIENCY_RANK_NAME].ravel()
+        order = np.empty_like(ranks)
+        order[ranks] = np.arange(len(ranks))
+        efficiencies_by_rank = pipeline[
+            CardValuePipeline.PLAY_CRAFT_EFFICIENCY_NAME
+        ].ravel()[order]
+
+        num_users = len(is_owned)
+        is_unowned_by_rank = ~is_owned.reshape(num_users, -1)[:, order]
+        num_unowned_so_far = np.cumsum(is_unowned_by_rank, axis=1)
+        is_top_option = is_unowned_by_rank & (
+            num_unowned_so_far <= num_options_considered
+        )
+        value_of_shiftstone = (
+            is_top_option @ efficiencies_by_rank / num_options_considered
         )
 
-        value_of_shiftstone = cls._value_of_shiftstone(
-            play_craft_efficiency, num_options_considered
+        sell_cost = rarities.DISENCHANTS[pipeline[CardValuePipeline.RARITY_NAME]]
+        resell_value = value_of_shiftstone[:, np.newaxis] * sell_cost
+        own_value = np.maximum(
+            pipeline[CardValuePipeline.PLAY_VALUE_NAME],
+            resell_value[:, :, np.newaxis],
+        )
+        return cls(is_owned, value_of_shiftstone, resell_value, own_value)
+
+
+def get_batch_own_values(
+    card_details: card_frame_bases.CardDetails,
+    card_counts_list: t.List[t.Dict[CardId, int]],
+    num_options_considered=20,
+    batch_size=500,
+) -> t.Iterator[BatchOwnValues]:
+    """Evaluates many users' collections, a batch of users at a time
+    to bound memory use."""
+    pipeline = CardValuePipeline.get_shared(card_details)
+    for start in range(0, len(card_counts_list), batch_size):
+        yield BatchOwnValues.from_collections(
+            pipeline,
+            card_counts_list[start : start + batch_size],
+            num_options_considered,
         )
 
-        df[cls.RESELL_VALUE_NAME] = df[cls.SELL_COST_NAME] * value_of_shiftstone
 
-        df[cls.OWN_VALUE_NAME] = df[[cls.PLAY_VALUE_NAME, cls.RESELL_VALUE_NAME]].max(
-            axis=1
-        )
+class UserCardValues:
+    """A user's card value pipeline and the collection it was made from,
+    kept so that it can be updated in place when their collection changes.
+
+    The own values are always calculated, as updates need them.
+    The frame for the views has only the given columns, or all of them."""
 
-        return cls(play_craft_efficiency.user, df)
+    def __init__(
+        self,
+        user: User,
+        pipeline: CardValuePipeline,
+        card_counts: t.Dict[CardId, int],
+        num_options_considered=20,
+        column_names: t.Optional[t.List[str]] = None,
+        card_details: t.Optional[card_frame_bases.CardDetails] = None,
+    ):
+        self.user = user
+        self.pipeline = pipeline
+        self.card_counts = card_counts
+        self.num_options_considered = num_options_considered
+        self.column_names = column_names
+        self.card_details = card_details
+        self._own_value_frame: t.Optional[OwnValueFrame] = None
 
     @classmethod
-    def from_user(cls, user: User, card_details: card_frame_bases.CardDetails):
-        """Creates from a user, performing the entire pipeline."""
-        weighted_deck_searches = get_weighted_deck_searches()
-        play_count = PlayCountFrame.from_weighted_deck_searches(
-            weighted_deck_searches=weighted_deck_searches, card_details=card_details
+    @instrumentation.measured()
+    def from_user(
+        cls,
+        user: User,
+        card_details: card_frame_bases.CardDetails,
+        num_options_considered=20,
+        column_names: t.Optional[t.List[str]] = None,
+        deck_type: t.Optional[DeckType] = None,
+    ):
+        """Creates from a user, applying their collection to the shared values
+        of their profile, from only decks of the deck type if given."""
+        if isinstance(user, werkzeug.local.LocalProxy):
+            user = user._get_current_object()
+        card_counts = collection.get_collection_from_ew(user)
+
+        # Anonymous users have no profile.
+        profile_id = getattr(user, "deck_search_profile_id", None) or DEFAULT_PROFILE_ID
+        pipeline = CardValuePipeline.get_shared_for_profile(
+            card_details, profile_id, deck_type
+        ).branch()
+        pipeline.evaluate(
+            [CardValuePipeline.OWN_VALUE_NAME]
+            + (column_names or [CardValuePipeline.FIT_PLAY_VALUE_NAME]),
+            card_counts=card_counts,
+            num_options_considered=num_options_considered,
+        )
+        return cls(
+            user,
+            pipeline,
+            card_counts,
+            num_options_considered,
+            column_names,
+            card_details,
         )
 
-        play_rate = PlayRateFrame.from_play_counts(play_count)
+    @property
+    def own_value_frame(self) -> "OwnValueFrame":
+        """The long frame for the views.
+        It is patched when values change, so copy it before modifying it."""
+        if self._own_value_frame is None:
+            self._own_value_frame = self.make_own_value_frame(self.column_names)
+        return self._own_value_frame
+
+    def make_own_value_frame(
+        self, column_names: t.Optional[t.List[str]] = None
+    ) -> "OwnValueFrame":
+        """Makes a new long frame with the given columns, or all of them."""
+        return self.pipeline.to_own_value_frame(
+            self.user, column_names, self.card_details
+        )
 
-        ownership = collection.dataframe_for_user(user)
-        play_value = PlayValueFrame.from_play_rates(
-            user=user, play_rate_frame=play_rate, ownership=ownership
+    @instrumentation.measured()
+    def update_collection(self, card_counts: t.Dict[CardId, int]):
+        """Updates the values for the user's new collection."""
+        flipped_positions, is_top_changed = self.pipeline.update_ownership(
+            self.card_counts, card_counts, self.num_options_considered
+        )
+        self.card_counts = card_counts
+        logging.info(
+            f"Updated {len(flipped_positions)} card copies for {self.user},"
+            f" top craft options changed: {is_top_changed}"
         )
-        play_craft_efficiency = PlayCraftEfficiencyFrame.from_play_value(play_value)
-        own_value = cls.from_play_craft_efficiency(play_craft_efficiency)
-        return own_value
+
+        frame = self._own_value_frame
+        if frame is not None and OwnValueFrame.IS_OWNED_NAME in frame:
+            is_owned_column = frame.columns.get_loc(OwnValueFrame.IS_OWNED_NAME)
+            frame.iloc[flipped_positions, is_owned_column] = self.pipeline[
+                CardValuePipeline.IS_OWNED_NAME
+            ].ravel()[flipped_positions]
+        if len(flipped_positions):
+            self._patch_collection_fit()
+        if is_top_changed:
+            self._patch_own_values()
+
+    def set_num_options_considered(self, num_options_considered: int):
+        """Updates the values for a new number of crafting options
+        considered when valuing shiftstone."""
+        if num_options_considered == self.num_options_considered:
+            return
+        self.num_options_considered = num_options_considered
+        self.pipeline.update_own_values(num_options_considered)
+        self._patch_own_values()
+
+    def _patch_collection_fit(self):
+        frame = self._own_value_frame
+        if frame is None:
+            return
+        if OwnValueFrame.COLLECTION_FIT_NAME in frame:
+            frame[OwnValueFrame.COLLECTION_FIT_NAME] = np.repeat(
+                self.pipeline[CardValuePipeline.COLLECTION_FIT_NAME],
+                self.pipeline.playsets.MAX_COPIES,
+            )
+        if OwnValueFrame.FIT_PLAY_VALUE_NAME in frame:
+            frame[OwnValueFrame.FIT_PLAY_VALUE_NAME] = self.pipeline[
+                CardValuePipeline.FIT_PLAY_VALUE_NAME
+            ].ravel()
+
+    def _patch_own_values(self):
+        frame = self._own_value_frame
+        if frame is None:
+            return
+        if OwnValueFrame.RESELL_VALUE_NAME in frame:
+            frame[OwnValueFrame.RESELL_VALUE_NAME] = np.repeat(
+                self.pipeline[CardValuePipeline.RESELL_VALUE_NAME],
+                self.pipeline.playsets.MAX_COPIES,
+            )
+        if OwnValueFrame.OWN_VALUE_NAME in frame:
+            frame[OwnValueFrame.OWN_VALUE_NAME] = self.pipeline[
+                CardValuePipeline.OWN_VALUE_NAME
+            ].ravel()
+
+
+class OwnValueFrame(card_frame_bases.CardCopy):
+    """The card values for a user, with a row per card copy for the views.
+
+    Has the columns of the CardValuePipeline it was made from that the view needs,
+    and any card details joined to them."""
+
+    INDEX_NAMES = [
+        card_frame_bases.CardCopy.SET_NUM_NAME,
+        card_frame_bases.CardCopy.CARD_NUM_NAME,
+        card_frame_bases.CardCopy.COUNT_IN_DECK_NAME,
+    ]
+
+    RARITY_NAME = CardValuePipeline.RARITY_NAME
+    PLAY_VALUE_NAME = CardValuePipeline.PLAY_VALUE_NAME
+    PLAY_CRAFT_EFFICIENCY_NAME = CardValuePipeline.PLAY_CRAFT_EFFICIENCY_NAME
+    IS_OWNED_NAME = CardValuePipeline.IS_OWNED_NAME
+    SELL_COST_NAME = CardValuePipeline.SELL_COST_NAME
+    RESELL_VALUE_NAME = CardValuePipeline.RESELL_VALUE_NAME
+    OWN_VALUE_NAME = CardValuePipeline.OWN_VALUE_NAME
+    COLLECTION_FIT_NAME = CardValuePipeline.COLLECTION_FIT_NAME
+    FIT_PLAY_VALUE_NAME = CardValuePipeline.FIT_PLAY_VALUE_NAME
+    _metadata = ["user"]
+
+    def __init__(self, user: User, *args):
+        # Anonymous visitors see values for an empty collection.
+        if not isinstance(
+            user, (User, flask_login.AnonymousUserMixin, werkzeug.local.LocalProxy)
+        ):
+            raise ValueError("Must be given user parameter of type User")
+
+        card_frame_bases.CardCopy.__init__(self, *args)
+        self.user = user
+
+    def __eq__(self, other):
+        return self.user == other.user
+
+    def __hash__(self):
+        return hash(self.user)
+
+    def copy(self, deep=True):
+        return OwnValueFrame(self.user, pd.DataFrame.copy(self, deep=deep))
 
     @classmethod
-    def _value_of_shiftstone(
-        cls, play_craft_efficiency: PlayCraftEfficiencyFrame, num_options_considered=20
+    def from_user(
+        cls,
+        user: User,
+        card_details: card_frame_bases.CardDetails,
+        num_options_considered=20,
+        column_names: t.Optional[t.List[str]] = None,
     ):
-        """Gets the top num_options crafting efficiencies and averages them to predict
-        how much value the user will get from crafting."""
-        efficiencies = play_craft_efficiency.query(
-            f"{cls.IS_OWNED_NAME} == False"
-        ).sort_values(cls.PLAY_CRAFT_EFFICIENCY_NAME, ascending=False)
-
-        top_efficiencies = efficiencies.head(num_options_considered)
-        avg_top_efficiency = (
-            sum(top_efficiencies[cls.PLAY_CRAFT_EFFICIENCY_NAME])
-            / num_options_considered
+        """Creates from a user, applying their collection to the shared values.
+        Has only the given columns, or all of the pipeline's columns."""
+        user_card_values = UserCardValues.from_user(
+            user, card_details, num_options_considered, column_names
         )
+        return user_card_values.own_value_frame
 
-        return avg_top_efficiency
+
+@instrumentation.measured()
+def update_play_craft_efficiencies():
+    """Recalculates and stores the card values which are the same for every user.
+
+    Should follow updating the deck searches."""
+    import infiltrate.global_data as global_data
+
+    logging.info("Updating card play values")
+    pipeline = CardValuePipeline.from_weighted_deck_searches(global_data.all_cards)
+    card_play_value.CardPlayValue.replace_all(pipeline.playsets.to_frame())
+    CardValuePipeline.get_shared.cache_clear()
+    CardValuePipeline.get_shared_for_profile.cache_clear()
@@ -1,3 +1,7 @@
+import itertools
+import typing as t
+
+import numpy as np
 import pandas as pd
 
 import infiltrate.models.card as card
@@ -36,6 +40,10 @@ class CardDetails(pd.DataFrame):
         self.details_url = self.details_url
         self.is_in_draft_pack = self.is_in_draft_pack
 
+    def __hash__(self):
+        # Card details are shared singletons, so identity allows caching on them.
+        return id(self)
+
     def card_exists(self, card_id: card.CardId):
         """Return if the card_id is found."""
         matching_card = self.loc[
@@ -46,3 +54,158 @@ class CardDetails(pd.DataFrame):
         ]
         does_exist = len(matching_card) > 0
         return does_exist
+
+
+class CardPlaysets:
+    """Card data with one row per card, and an array of values per copy of the card.
+
+    A compact form of CardCopy for calculations. Per card columns have shape
+    (num_cards,) and per copy columns have shape (num_cards, MAX_COPIES),
+    where column i is for the (i+1)th copy."""
+
+    SET_NUM_NAME = "set_num"
+    CARD_NUM_NAME = "card_num"
+    COUNT_IN_DECK_NAME = "count_in_deck"
+
+    MAX_COPIES = 4
+    COPY_COUNTS = np.arange(1, MAX_COPIES + 1)
+
+    def __init__(
+        self, index: pd.MultiIndex, columns: t.Optional[t.Dict[str, np.ndarray]] = None
+    ):
+        self.index = index
+        self.columns: t.Dict[str, np.ndarray] = {}
+        for name, values in (columns or {}).items():
+            self[name] = values
+
+    @classmethod
+    def from_card_details(
+        cls,
+        card_details: CardDetails,
+        column_names: t.Optional[t.List[str]] = None,
+    ):
+        """Makes per card columns for the given columns of the card details,
+        or all of them."""
+        index = pd.MultiIndex.from_arrays(
+            [
+                card_details[cls.SET_NUM_NAME].values,
+                card_details[cls.CARD_NUM_NAME].values,
+            ],
+            names=[cls.SET_NUM_NAME, cls.CARD_NUM_NAME],
+        )
+        if column_names is None:
+            column_names = [
+                name
+                for name in card_details.columns
+                if name not in (cls.SET_NUM_NAME, cls.CARD_NUM_NAME)
+            ]
+        columns = {name: card_details[name].values for name in column_names}
+        return cls(index, columns)
+
+    @classmethod
+    def from_playsets(cls, playsets: "CardPlaysets"):
+        """Constructor sharing the other playsets' arrays without copying them."""
+        return cls(playsets.index, playsets.columns)
+
+    def copy(self):
+        """A copy which can have columns added or replaced without changing this.
+        Arrays are shared, so should not be modified in place."""
+        return self.from_playsets(self)
+
+    @property
+    def set_nums(self) -> np.ndarray:
+        return self.index.get_level_values(self.SET_NUM_NAME).values
+
+    @property
+    def card_nums(self) -> np.ndarray:
+        return self.index.get_level_values(self.CARD_NUM_NAME).values
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name: str):
+        return name in self.columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        try:
+            return self.__dict__["columns"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setitem__(self, name: str, values):
+        values = np.asarray(values)
+        if len(values) != len(self) or values.ndim > 2:
+            raise ValueError(
+                f"Column {name} has shape {values.shape}, "
+                f"expected ({len(self)},) or ({len(self)}, {self.MAX_COPIES})"
+            )
+        self.columns[name] = values
+
+    def get_rows(self, set_nums, card_nums) -> np.ndarray:
+        """Gets the row of each card, or -1 for unknown cards."""
+        card_ids = pd.MultiIndex.from_arrays(
+            [np.asarray(set_nums, dtype=int), np.asarray(card_nums, dtype=int)]
+        )
+        return self.index.get_indexer(card_ids)
+
+    def get_counts(self, card_counts: t.Dict[card.CardId, int]) -> np.ndarray:
+        """Gets an array of the count of each card, such as from a collection."""
+        counts = np.zeros(len(self), dtype=int)
+        if card_counts:
+            card_ids = list(card_counts.keys())
+            rows = self.get_rows(
+                [card_id.set_num for card_id in card_ids],
+                [card_id.card_num for card_id in card_ids],
+            )
+            is_known = rows >= 0
+            counts[rows[is_known]] = np.fromiter(card_counts.values(), int)[is_known]
+        return counts
+
+    def get_count_matrix(
+        self, card_counts_list: t.List[t.Dict[card.CardId, int]]
+    ) -> np.ndarray:
+        """Gets a (collections, cards) array of the count of each card
+        in each of many collections."""
+        counts = np.zeros((len(card_counts_list), len(self)), dtype=int)
+        collection_indices = np.repeat(
+            np.arange(len(card_counts_list)),
+            [len(card_counts) for card_counts in card_counts_list],
+        )
+        card_ids = list(itertools.chain.from_iterable(card_counts_list))
+        if card_ids:
+            rows = self.get_rows(
+                [card_id.set_num for card_id in card_ids],
+                [card_id.card_num for card_id in card_ids],
+            )
+            is_known = rows >= 0
+            values = np.fromiter(
+                itertools.chain.from_iterable(
+                    card_counts.values() for card_counts in card_counts_list
+                ),
+                dtype=int,
+                count=len(card_ids),
+            )
+            counts[collection_indices[is_known], rows[is_known]] = values[is_known]
+        return counts
+
+    def to_frame(self, column_names: t.Optional[t.List[str]] = None) -> pd.DataFrame:
+        """Makes the long format frame with a row for each copy of each card,
+        with the given columns or all of them."""
+        if column_names is None:
+            column_names = list(self.columns)
+        num_cards = len(self)
+        data = {
+            self.SET_NUM_NAME: np.repeat(self.set_nums, self.MAX_COPIES),
+            self.CARD_NUM_NAME: np.repeat(self.card_nums, self.MAX_COPIES),
+            self.COUNT_IN_DECK_NAME: np.tile(self.COPY_COUNTS, num_cards),
+        }
+        for name in column_names:
+            values = self[name]
+            if values.ndim == 1:
+                data[name] = np.repeat(values, self.MAX_COPIES)
+            else:
+                data[name] = values.ravel()
+        return pd.DataFrame(data)
@@ -0,0 +1,114 @@
+"""Ranks recent decks by the shiftstone needed to complete them from a collection.
+
+The deck store is a sparse deck by card matrix of the copies each deck requires,
+so every deck is costed at once against the user's owned counts."""
+import datetime
+import functools
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+import infiltrate.card_frame_bases as card_frame_bases
+import infiltrate.deck_store as deck_store
+import infiltrate.instrumentation as instrumentation
+import infiltrate.models.deck as models_deck
+import infiltrate.models.rarity as rarities
+from infiltrate.models.card import CardId
+
+DECK_ID_NAME = "deck_id"
+URL_NAME = "url"
+DATE_UPDATED_NAME = "date_updated"
+VIEWS_NAME = "views"
+DECK_TYPE_NAME = "deck_type"
+ARCHETYPE_NAME = "archetype"
+COST_NAME = "shiftstone_to_complete"
+NUM_MISSING_NAME = "num_missing"
+COLUMN_NAMES = [
+    DECK_ID_NAME,
+    URL_NAME,
+    DATE_UPDATED_NAME,
+    VIEWS_NAME,
+    DECK_TYPE_NAME,
+    ARCHETYPE_NAME,
+    COST_NAME,
+    NUM_MISSING_NAME,
+]
+
+
+@instrumentation.measured()
+def get_cheapest_decks(
+    card_counts: t.Dict[CardId, int],
+    card_details: card_frame_bases.CardDetails,
+    maximum_age_days: int = 30,
+    deck_type: t.Optional[models_deck.DeckType] = None,
+    num_decks: int = 50,
+) -> pd.DataFrame:
+    """Gets the decks updated in the last maximum_age_days, of the deck type if given,
+    which need the least shiftstone to complete from the collection.
+
+    Decks needing cards which can't be crafted are left out."""
+    store = deck_store.get_store()
+    if store is None:
+        return pd.DataFrame(columns=COLUMN_NAMES)
+    oldest_date = datetime.datetime.now() - datetime.timedelta(days=maximum_age_days)
+    decks = store.get_deck_range(oldest_date)
+
+    costs, num_missing = store.get_completion_costs(
+        decks, store.get_card_counts(card_counts), _get_craft_costs(store, card_details)
+    )
+    is_completable = np.isfinite(costs)
+    if deck_type is not None:
+        is_completable &= store.deck_types[decks] == deck_type.value
+    candidates = np.flatnonzero(is_completable)
+    if len(candidates) > num_decks:
+        candidates = candidates[
+            np.argpartition(costs[candidates], num_decks - 1)[:num_decks]
+        ]
+    # Cheapest first, then most viewed.
+    positions = candidates[
+        np.lexsort((-store.views[decks][candidates], costs[candidates]))
+    ]
+
+    store_positions = positions + decks.start
+    deck_ids = store.deck_ids[store_positions]
+    return pd.DataFrame(
+        {
+            DECK_ID_NAME: deck_ids,
+            URL_NAME: [
+                f"https://eternalwarcry.com/decks/d/{deck_id}" for deck_id in deck_ids
+            ],
+            DATE_UPDATED_NAME: store.dates[store_positions],
+            VIEWS_NAME: store.views[store_positions],
+            DECK_TYPE_NAME: [
+                None
+                if code == deck_store.UNKNOWN_CODE
+                else models_deck.DeckType(code).name
+                for code in store.deck_types[store_positions]
+            ],
+            ARCHETYPE_NAME: [
+                None
+                if code == deck_store.UNKNOWN_CODE
+                else models_deck.Archetype(code).name
+                for code in store.archetypes[store_positions]
+            ],
+            COST_NAME: costs[positions].astype(np.int64),
+            NUM_MISSING_NAME: num_missing[positions],
+        },
+        columns=COLUMN_NAMES,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_craft_costs(
+    store: deck_store.DeckStore, card_details: card_frame_bases.CardDetails
+) -> np.ndarray:
+    """Gets the craft cost of each of the store's cards,
+    or infinity for cards without details."""
+    card_ids = pd.MultiIndex.from_arrays([store.set_nums, store.card_nums])
+    rows = card_details.index.get_indexer(card_ids)
+    craft_costs = np.full(len(rows), np.inf)
+    is_known = rows >= 0
+    rarity_codes = card_details[card_frame_bases.CardDetails.RARITY_NAME].values
+    craft_costs[is_known] = rarities.ENCHANTS[rarity_codes[rows[is_known]]]
+    return craft_costs
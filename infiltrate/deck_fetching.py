@@ -0,0 +1,173 @@
+"""Fetches many pages concurrently, for ingesting decks.
+
+A pool of workers fetches and parses pages, limited by a token bucket,
+and hands the results over a bounded queue to the calling thread,
+which writes them in batches. Only the calling thread uses the database."""
+import concurrent.futures
+import logging
+import queue
+import re
+import threading
+import time
+import typing as t
+import urllib.error
+
+import infiltrate.browsers as browsers
+
+T = t.TypeVar("T")
+
+# Expected errors from a single page, logged without a traceback.
+FETCH_ERRORS = (ConnectionError, urllib.error.URLError, ValueError, KeyError)
+
+
+class TokenBucket:
+    """Limits the rate of requests between threads.
+
+    Tokens refill at rate per second, up to capacity, allowing short bursts."""
+
+    def __init__(self, rate: float, capacity: t.Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Waits until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last_refill) * self.rate
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrentFetcher(t.Generic[T]):
+    """Fetches the json at many urls with a bounded number in flight,
+    and writes what parse makes of each with write_batch, a batch at a time.
+
+    Pages which fail to fetch or parse are logged and skipped,
+    and the last run's are kept in failed_urls, to be retried.
+    Errors outside of a page stop the run, and are raised by run."""
+
+    _DONE = object()
+    _TIMED_OUT = object()
+
+    def __init__(
+        self,
+        parse: t.Callable[[t.Dict], T],
+        write_batch: t.Callable[[t.List[T]], None],
+        num_workers: int = 8,
+        requests_per_second: float = 10.0,
+        queue_size: int = 200,
+        batch_size: int = 100,
+        flush_seconds: float = 5.0,
+        get_json: t.Callable[[str], t.Dict] = browsers.get_json_from_url,
+    ):
+        self.parse = parse
+        self.write_batch = write_batch
+        self.num_workers = num_workers
+        self.rate_limit = TokenBucket(requests_per_second)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.get_json = get_json
+        self.failed_urls: t.List[str] = []
+
+    def run(self, urls: t.Iterable[str]) -> int:
+        """Fetches, parses and writes the urls. Returns the number written."""
+        self.failed_urls = []
+        results = queue.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+        producer_errors = []
+        producer = threading.Thread(
+            target=self._fetch_all,
+            args=(list(urls), results, stopped, producer_errors),
+            daemon=True,
+        )
+        producer.start()
+        try:
+            num_written = self._write_all(results)
+        finally:
+            # Lets the workers finish if writing failed.
+            stopped.set()
+            producer.join()
+        if producer_errors:
+            raise producer_errors[0]
+        return num_written
+
+    def _fetch_all(
+        self,
+        urls: t.List[str],
+        results: queue.Queue,
+        stopped: threading.Event,
+        errors: t.List[BaseException],
+    ):
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.num_workers) as executor:
+                for _ in executor.map(
+                    lambda url: self._fetch(url, results, stopped), urls
+                ):
+                    pass
+        except Exception as error:
+            errors.append(error)
+        finally:
+            _put(results, self._DONE, stopped)
+
+    def _fetch(self, url: str, results: queue.Queue, stopped: threading.Event):
+        if stopped.is_set():
+            return
+        self.rate_limit.acquire()
+        try:
+            parsed = self.parse(self.get_json(url))
+        except FETCH_ERRORS as error:
+            logging.warning(f"Skipping {_redact_key(url)}: {error!r}")
+            self.failed_urls.append(url)
+            return
+        except Exception:
+            logging.exception(f"Skipping {_redact_key(url)}: unexpected error")
+            self.failed_urls.append(url)
+            return
+        _put(results, parsed, stopped)
+
+    def _write_all(self, results: queue.Queue) -> int:
+        num_written = 0
+        batch = []
+        while True:
+            try:
+                item = results.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                item = self._TIMED_OUT
+            else:
+                if item is self._DONE:
+                    break
+                batch.append(item)
+            if batch and (item is self._TIMED_OUT or len(batch) >= self.batch_size):
+                self.write_batch(batch)
+                num_written += len(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+            num_written += len(batch)
+        return num_written
+
+
+def _put(results: queue.Queue, item, stopped: threading.Event):
+    """Waits for room in the queue, unless the run stopped."""
+    while not stopped.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _redact_key(url: str) -> str:
+    """Hides the api key in the url, for logging."""
+    return re.sub(r"key=[^&]*", "key=...", url)
@@ -0,0 +1,668 @@
+"""A compact columnar copy of all decks, for computing playrates without the database.
+
+Decks are rows of a sparse deck by card matrix of the number of copies played,
+kept in CSR form as plain numpy arrays, alongside per deck arrays.
+Decks are sorted by date_updated, so date windows are contiguous slices.
+The arrays are saved as .npy files and memory mapped when loaded.
+Each set of arrays is written to a new directory which is then swapped into place,
+so arrays which are already mapped are never written to.
+"""
+import datetime
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+import infiltrate.models.deck as models_deck
+from infiltrate import db
+from infiltrate.models.card import CardId
+
+# Siblings, so that swapping in one set of arrays leaves the others in place.
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data", "deck_store")
+STORE_DIRECTORY = os.path.join(DATA_DIRECTORY, "decks")
+CUBE_DIRECTORY = os.path.join(DATA_DIRECTORY, "cube")
+NEIGHBOURS_DIRECTORY = os.path.join(DATA_DIRECTORY, "neighbours")
+
+UNKNOWN_CODE = -1
+SECONDS_PER_DAY = 24 * 60 * 60
+
+SET_NUM_NAME = "set_num"
+CARD_NUM_NAME = "card_num"
+COUNT_IN_DECK_NAME = "count_in_deck"
+PLAY_COUNT_NAME = "num_decks_with_count_or_less"
+
+VIEWS_WEIGHT = "views"
+RATING_WEIGHT = "rating"
+
+
+class DeckStore:
+    """All decks, with a CSR matrix of the copies of each card in each deck."""
+
+    MAX_COPIES = 4
+    ARRAY_NAMES = [
+        "deck_ids",
+        "dates",
+        "views",
+        "ratings",
+        "deck_types",
+        "archetypes",
+        "indptr",
+        "card_indices",
+        "counts",
+        "set_nums",
+        "card_nums",
+    ]
+
+    def __init__(
+        self,
+        deck_ids: np.ndarray,
+        dates: np.ndarray,
+        views: np.ndarray,
+        ratings: np.ndarray,
+        deck_types: np.ndarray,
+        archetypes: np.ndarray,
+        indptr: np.ndarray,
+        card_indices: np.ndarray,
+        counts: np.ndarray,
+        set_nums: np.ndarray,
+        card_nums: np.ndarray,
+    ):
+        """Decks must be sorted by date.
+
+        Deck i plays counts[indptr[i]:indptr[i + 1]] copies of the cards at
+        card_indices[indptr[i]:indptr[i + 1]] of set_nums and card_nums."""
+        self.deck_ids = deck_ids
+        self.dates = dates
+        self.views = views
+        self.ratings = ratings
+        self.deck_types = deck_types
+        self.archetypes = archetypes
+        self.indptr = indptr
+        self.card_indices = card_indices
+        self.counts = counts
+        self.set_nums = set_nums
+        self.card_nums = card_nums
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def from_frames(cls, decks: pd.DataFrame, deck_has_cards: pd.DataFrame):
+        """Builds the store from frames of the decks and deck_has_card tables."""
+        decks = decks.sort_values("date_updated", kind="stable")
+        deck_positions = pd.Series(np.arange(len(decks)), index=decks["id"].values)
+        deck_has_cards = deck_has_cards[deck_has_cards["deck_id"].isin(decks["id"])]
+
+        card_ids = pd.MultiIndex.from_arrays(
+            [deck_has_cards[SET_NUM_NAME].values, deck_has_cards[CARD_NUM_NAME].values]
+        )
+        card_indices, unique_card_ids = pd.factorize(card_ids, sort=True)
+        rows = deck_positions[deck_has_cards["deck_id"].values].values
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(len(decks) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(decks)), out=indptr[1:])
+
+        return cls(
+            deck_ids=decks["id"].values.astype(str),
+            dates=decks["date_updated"].values.astype("datetime64[s]"),
+            views=decks["views"].fillna(0).values.astype(np.int64),
+            ratings=decks["rating"].fillna(0).values.astype(np.int64),
+            deck_types=_get_enum_codes(decks["deck_type"], models_deck.DeckType),
+            archetypes=_get_enum_codes(decks["archetype"], models_deck.Archetype),
+            indptr=indptr,
+            card_indices=card_indices[order].astype(np.int32),
+            counts=deck_has_cards["num_played"].values[order].astype(np.int16),
+            set_nums=unique_card_ids.get_level_values(0).values.astype(np.int64),
+            card_nums=unique_card_ids.get_level_values(1).values.astype(np.int64),
+        )
+
+    @classmethod
+    def from_database(cls):
+        session = db.engine.raw_connection()
+        decks = pd.read_sql_query(
+            "SELECT id, date_updated, views, rating, deck_type, archetype FROM decks",
+            session,
+            parse_dates=["date_updated"],
+        )
+        deck_has_cards = pd.read_sql_query(
+            "SELECT deck_id, set_num, card_num, num_played FROM deck_has_card", session
+        )
+        return cls.from_frames(decks, deck_has_cards)
+
+    def save(self, directory: str = STORE_DIRECTORY):
+        _save_arrays(self, directory)
+
+    @classmethod
+    def load(cls, directory: str = STORE_DIRECTORY):
+        """Memory maps a saved store."""
+        return _load_arrays(cls, directory)
+
+    def get_card_counts(self, card_counts: t.Dict[CardId, int]) -> np.ndarray:
+        """Gets an array of the count of each of the store's cards,
+        such as from a collection."""
+        counts = np.zeros(len(self.set_nums), dtype=np.int64)
+        if card_counts:
+            card_ids = pd.MultiIndex.from_arrays(
+                [
+                    np.array([card_id.set_num for card_id in card_counts], dtype=int),
+                    np.array([card_id.card_num for card_id in card_counts], dtype=int),
+                ]
+            )
+            store_card_ids = pd.MultiIndex.from_arrays([self.set_nums, self.card_nums])
+            indices = store_card_ids.get_indexer(card_ids)
+            is_known = indices >= 0
+            values = np.fromiter(card_counts.values(), dtype=np.int64)
+            counts[indices[is_known]] = values[is_known]
+        return counts
+
+    def get_deck_range(
+        self,
+        oldest_date: t.Optional[datetime.datetime] = None,
+        newest_date: t.Optional[datetime.datetime] = None,
+    ) -> slice:
+        """The decks updated after oldest_date, up to newest_date."""
+        start = 0
+        stop = len(self)
+        if oldest_date is not None:
+            start = np.searchsorted(
+                self.dates, np.datetime64(oldest_date, "s"), side="right"
+            )
+        if newest_date is not None:
+            stop = np.searchsorted(
+                self.dates, np.datetime64(newest_date, "s"), side="right"
+            )
+        return slice(start, max(start, stop))
+
+    def get_deck_weights(
+        self,
+        decks: slice,
+        weight: str = VIEWS_WEIGHT,
+        deck_types: t.Optional[t.Iterable[models_deck.DeckType]] = None,
+        archetypes: t.Optional[t.Iterable[models_deck.Archetype]] = None,
+        half_life_days: t.Optional[float] = None,
+        now: t.Optional[datetime.datetime] = None,
+    ) -> np.ndarray:
+        """The weight of each deck in the range, or 0 for filtered out decks.
+
+        With a half life, weights halve for every half_life_days
+        the deck was updated before now."""
+        weights_by_name = {VIEWS_WEIGHT: self.views, RATING_WEIGHT: self.ratings}
+        weights = np.array(weights_by_name[weight][decks], dtype=float)
+        if half_life_days is not None:
+            now = np.datetime64(now or datetime.datetime.now(), "s")
+            age_days = (now - self.dates[decks]).astype(float) / SECONDS_PER_DAY
+            weights *= 0.5 ** (age_days / half_life_days)
+        if deck_types is not None:
+            codes = [deck_type.value for deck_type in deck_types]
+            weights[~np.isin(self.deck_types[decks], codes)] = 0
+        if archetypes is not None:
+            codes = [archetype.value for archetype in archetypes]
+            weights[~np.isin(self.archetypes[decks], codes)] = 0
+        return weights
+
+    def get_play_count_matrix(
+        self, decks: slice, deck_weights: np.ndarray
+    ) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Gets the cards in any of the decks, and a (cards, MAX_COPIES) array of
+        the total weight of decks with at least each count of each card."""
+        start, stop = self.indptr[decks.start], self.indptr[decks.stop]
+        nnz_decks = np.repeat(
+            np.arange(decks.stop - decks.start),
+            np.diff(self.indptr[decks.start : decks.stop + 1]),
+        )
+        card_indices = self.card_indices[start:stop]
+        counts = np.minimum(self.counts[start:stop], self.MAX_COPIES)
+
+        present_cards = np.unique(card_indices)
+        rows = np.searchsorted(present_cards, card_indices)
+        # Weight of decks with exactly each count, then summed over higher counts.
+        exact = np.bincount(
+            rows * (self.MAX_COPIES + 1) + counts,
+            weights=deck_weights[nnz_decks],
+            minlength=len(present_cards) * (self.MAX_COPIES + 1),
+        ).reshape(len(present_cards), self.MAX_COPIES + 1)
+        at_least = np.cumsum(exact[:, ::-1], axis=1)[:, ::-1]
+        return present_cards, at_least[:, 1:]
+
+    def get_play_counts(
+        self,
+        oldest_date: t.Optional[datetime.datetime] = None,
+        newest_date: t.Optional[datetime.datetime] = None,
+        weight: str = VIEWS_WEIGHT,
+        deck_types: t.Optional[t.Iterable[models_deck.DeckType]] = None,
+        archetypes: t.Optional[t.Iterable[models_deck.Archetype]] = None,
+        half_life_days: t.Optional[float] = None,
+        now: t.Optional[datetime.datetime] = None,
+    ) -> pd.DataFrame:
+        """Gets a dataframe of the weighted number of decks with at least
+        each count of each card, in the layout of the deck search playrate cache."""
+        decks = self.get_deck_range(oldest_date, newest_date)
+        deck_weights = self.get_deck_weights(
+            decks, weight, deck_types, archetypes, half_life_days, now
+        )
+        present_cards, play_counts = self.get_play_count_matrix(decks, deck_weights)
+        return _make_play_count_frame(
+            self.set_nums[present_cards], self.card_nums[present_cards], play_counts
+        )
+
+    def get_completion_costs(
+        self, decks: slice, owned_counts: np.ndarray, craft_costs: np.ndarray
+    ) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Gets the shiftstone needed to craft the copies missing from each deck
+        in the range, and the number of missing copies, given the owned count and
+        craft cost of each of the store's cards."""
+        start, stop = self.indptr[decks.start], self.indptr[decks.stop]
+        nnz_decks = np.repeat(
+            np.arange(decks.stop - decks.start),
+            np.diff(self.indptr[decks.start : decks.stop + 1]),
+        )
+        card_indices = self.card_indices[start:stop]
+        counts = np.minimum(self.counts[start:stop], self.MAX_COPIES)
+        missing = np.maximum(counts - owned_counts[card_indices], 0)
+        # Owned cards cost nothing, even if they can't be crafted.
+        missing_costs = np.where(missing > 0, missing * craft_costs[card_indices], 0)
+
+        num_decks = decks.stop - decks.start
+        costs = np.bincount(nnz_decks, weights=missing_costs, minlength=num_decks)
+        num_missing = np.bincount(nnz_decks, weights=missing, minlength=num_decks)
+        return costs, num_missing.astype(np.int64)
+
+    def get_playrate_cube(
+        self, maximum_ages: t.List[int], now: t.Optional[datetime.datetime] = None
+    ) -> "PlayrateCube":
+        """Gets the play counts of each window, deck type and archetype
+        with a single pass over the decks.
+
+        Each deck is counted in the shortest window containing it,
+        then the windows are summed cumulatively, as they are nested."""
+        now = np.datetime64(now or datetime.datetime.now(), "s")
+        maximum_ages = np.array(sorted(maximum_ages))
+        decks = self.get_deck_range(
+            oldest_date=(now - np.timedelta64(int(maximum_ages[-1]), "D")).item()
+        )
+        start, stop = self.indptr[decks.start], self.indptr[decks.stop]
+
+        # The number of windows containing each deck, from the largest window down.
+        oldest_dates = now - maximum_ages[::-1].astype("timedelta64[D]")
+        num_windows = np.searchsorted(oldest_dates, self.dates[decks], side="left")
+        deck_windows = len(maximum_ages) - num_windows
+        deck_keys = deck_windows
+        for codes, num_codes in (
+            (self.deck_types[decks] - UNKNOWN_CODE, PlayrateCube.NUM_DECK_TYPES),
+            (self.archetypes[decks] - UNKNOWN_CODE, PlayrateCube.NUM_ARCHETYPES),
+        ):
+            deck_keys = deck_keys * num_codes + codes.astype(np.int64)
+
+        nnz_decks = np.repeat(
+            np.arange(decks.stop - decks.start),
+            np.diff(self.indptr[decks.start : decks.stop + 1]),
+        )
+        counts = np.minimum(self.counts[start:stop], self.MAX_COPIES)
+        keys = (
+            deck_keys[nnz_decks] * len(self.set_nums) + self.card_indices[start:stop]
+        ) * (self.MAX_COPIES + 1) + counts
+        shape = (
+            len(maximum_ages),
+            PlayrateCube.NUM_DECK_TYPES,
+            PlayrateCube.NUM_ARCHETYPES,
+            len(self.set_nums),
+            self.MAX_COPIES + 1,
+        )
+        exact = np.bincount(
+            keys,
+            weights=self.views[decks][nnz_decks],
+            minlength=int(np.prod(shape)),
+        ).reshape(shape)
+        at_least = np.cumsum(exact[..., ::-1], axis=-1)[..., ::-1][..., 1:]
+        play_counts = np.cumsum(at_least, axis=0).astype(np.float32)
+        return PlayrateCube(maximum_ages, play_counts, self.set_nums, self.card_nums)
+
+    def get_card_neighbours(
+        self,
+        oldest_date: t.Optional[datetime.datetime] = None,
+        num_neighbours: int = 20,
+        decks_per_chunk: int = 2000,
+    ) -> "CardNeighbours":
+        """Gets the cards most often played alongside each card,
+        from the views of decks updated after oldest_date.
+
+        The sparse card by card co-occurrence matrix is summed over chunks of decks
+        from every pair of cards in each deck, so only pairs that occur are kept."""
+        decks = self.get_deck_range(oldest_date)
+        pair_keys = np.zeros(0, dtype=np.int64)
+        pair_weights = np.zeros(0)
+        for chunk_start in range(decks.start, decks.stop, decks_per_chunk):
+            chunk = slice(chunk_start, min(chunk_start + decks_per_chunk, decks.stop))
+            keys, weights = self._get_card_pairs(chunk)
+            pair_keys, pair_weights = _sum_by_key(
+                np.concatenate([pair_keys, keys]),
+                np.concatenate([pair_weights, weights]),
+            )
+
+        num_cards = len(self.set_nums)
+        firsts, seconds = np.divmod(pair_keys, num_cards)
+        # The diagonal is the weight of the decks playing each card.
+        deck_weights = np.zeros(num_cards)
+        is_diagonal = firsts == seconds
+        deck_weights[firsts[is_diagonal]] = pair_weights[is_diagonal]
+        firsts, seconds = firsts[~is_diagonal], seconds[~is_diagonal]
+        pair_weights = pair_weights[~is_diagonal]
+        rates = np.divide(
+            pair_weights,
+            deck_weights[firsts],
+            out=np.zeros(len(pair_weights)),
+            where=deck_weights[firsts] > 0,
+        )
+
+        # The top rates of each card, from each card's pairs in descending order.
+        order = np.lexsort((-rates, firsts))
+        firsts, seconds, rates = firsts[order], seconds[order], rates[order]
+        ranks = np.arange(len(firsts)) - np.searchsorted(firsts, firsts)
+        is_top = ranks < num_neighbours
+        neighbour_indices = np.zeros((num_cards, num_neighbours), dtype=np.int32)
+        neighbour_rates = np.zeros((num_cards, num_neighbours), dtype=np.float32)
+        neighbour_indices[firsts[is_top], ranks[is_top]] = seconds[is_top]
+        neighbour_rates[firsts[is_top], ranks[is_top]] = rates[is_top]
+        return CardNeighbours(
+            neighbour_indices, neighbour_rates, self.set_nums, self.card_nums
+        )
+
+    def _get_card_pairs(self, decks: slice) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Gets the key of every ordered pair of cards in each deck, including each
+        card with itself, and the views of the deck, summed by key."""
+        start, stop = self.indptr[decks.start], self.indptr[decks.stop]
+        deck_lengths = np.diff(self.indptr[decks.start : decks.stop + 1])
+        nnz_decks = np.repeat(np.arange(decks.stop - decks.start), deck_lengths)
+        nnz_deck_lengths = deck_lengths[nnz_decks]
+        nnz_deck_starts = self.indptr[decks.start : decks.stop][nnz_decks] - start
+
+        # Each card is paired with each card of its deck, in order.
+        firsts = np.repeat(np.arange(stop - start), nnz_deck_lengths)
+        pair_starts = np.cumsum(nnz_deck_lengths) - nnz_deck_lengths
+        seconds = (
+            np.arange(len(firsts))
+            - np.repeat(pair_starts, nnz_deck_lengths)
+            + nnz_deck_starts[firsts]
+        )
+
+        card_indices = self.card_indices[start:stop].astype(np.int64)
+        keys = card_indices[firsts] * len(self.set_nums) + card_indices[seconds]
+        weights = self.views[decks][nnz_decks[firsts]].astype(float)
+        return _sum_by_key(keys, weights)
+
+
+class PlayrateCube:
+    """The views of decks with at least each count of each card,
+    keyed by window, deck type, archetype, card and copy.
+
+    Windows are cumulative, so each includes the decks of the shorter windows."""
+
+    # Codes are shifted by UNKNOWN_CODE, so decks of unknown type have a slot.
+    NUM_DECK_TYPES = (
+        max(member.value for member in models_deck.DeckType) + 1 - UNKNOWN_CODE
+    )
+    NUM_ARCHETYPES = (
+        max(member.value for member in models_deck.Archetype) + 1 - UNKNOWN_CODE
+    )
+    ARRAY_NAMES = ["maximum_ages", "play_counts", "set_nums", "card_nums"]
+
+    def __init__(
+        self,
+        maximum_ages: np.ndarray,
+        play_counts: np.ndarray,
+        set_nums: np.ndarray,
+        card_nums: np.ndarray,
+    ):
+        self.maximum_ages = maximum_ages
+        self.play_counts = play_counts
+        self.set_nums = set_nums
+        self.card_nums = card_nums
+
+    def save(self, directory: str = CUBE_DIRECTORY):
+        _save_arrays(self, directory)
+
+    @classmethod
+    def load(cls, directory: str = CUBE_DIRECTORY):
+        """Memory maps a saved cube."""
+        return _load_arrays(cls, directory)
+
+    def has_window(self, maximum_age_days: int) -> bool:
+        return maximum_age_days in self.maximum_ages
+
+    def get_play_counts(
+        self,
+        maximum_age_days: int,
+        deck_types: t.Optional[t.Iterable[models_deck.DeckType]] = None,
+        archetypes: t.Optional[t.Iterable[models_deck.Archetype]] = None,
+    ) -> pd.DataFrame:
+        """Gets a dataframe of the play counts of the window, summed over
+        the given deck types and archetypes, or all of them."""
+        window = int(np.flatnonzero(self.maximum_ages == maximum_age_days)[0])
+        play_counts = self.play_counts[window]
+        if deck_types is not None:
+            play_counts = play_counts[
+                [deck_type.value - UNKNOWN_CODE for deck_type in deck_types]
+            ]
+        play_counts = play_counts.sum(axis=0)
+        if archetypes is not None:
+            play_counts = play_counts[
+                [archetype.value - UNKNOWN_CODE for archetype in archetypes]
+            ]
+        play_counts = play_counts.sum(axis=0)
+
+        is_played = play_counts[:, 0] > 0
+        return _make_play_count_frame(
+            self.set_nums[is_played],
+            self.card_nums[is_played],
+            play_counts[is_played].astype(float),
+        )
+
+
+class CardNeighbours:
+    """The cards most often played alongside each card, as the rate of its decks,
+    weighted by views, that also play the neighbour.
+
+    Rows are cards of set_nums and card_nums, in descending order of rate.
+    Cards with fewer neighbours are padded with rates of 0."""
+
+    ARRAY_NAMES = ["neighbour_indices", "rates", "set_nums", "card_nums"]
+
+    def __init__(
+        self,
+        neighbour_indices: np.ndarray,
+        rates: np.ndarray,
+        set_nums: np.ndarray,
+        card_nums: np.ndarray,
+    ):
+        self.neighbour_indices = neighbour_indices
+        self.rates = rates
+        self.set_nums = set_nums
+        self.card_nums = card_nums
+
+    def save(self, directory: str = NEIGHBOURS_DIRECTORY):
+        _save_arrays(self, directory)
+
+    @classmethod
+    def load(cls, directory: str = NEIGHBOURS_DIRECTORY):
+        """Memory maps saved neighbours."""
+        return _load_arrays(cls, directory)
+
+    def get_fit(self, is_owned: np.ndarray) -> np.ndarray:
+        """Gets the rate weighted share of each card's neighbours
+        that are owned, given if each card is owned."""
+        neighbour_is_owned = is_owned[self.neighbour_indices]
+        total_rates = self.rates.sum(axis=1)
+        owned_rates = (self.rates * neighbour_is_owned).sum(axis=1)
+        return np.divide(
+            owned_rates,
+            total_rates,
+            out=np.zeros(len(total_rates)),
+            where=total_rates > 0,
+        )
+
+
+def _make_play_count_frame(
+    set_nums: np.ndarray, card_nums: np.ndarray, play_counts: np.ndarray
+) -> pd.DataFrame:
+    """Makes a frame in the layout of the deck search playrate cache
+    from a (cards, MAX_COPIES) array."""
+    return pd.DataFrame(
+        {
+            SET_NUM_NAME: np.repeat(set_nums, DeckStore.MAX_COPIES),
+            CARD_NUM_NAME: np.repeat(card_nums, DeckStore.MAX_COPIES),
+            COUNT_IN_DECK_NAME: np.tile(
+                np.arange(1, DeckStore.MAX_COPIES + 1), len(set_nums)
+            ),
+            PLAY_COUNT_NAME: play_counts.ravel(),
+        }
+    )
+
+
+def _save_arrays(arrays_object, directory: str):
+    """Writes the arrays to a new directory beside the target, then swaps it in.
+
+    Readers holding memory maps of the old files keep them,
+    and later loads see either the old or the new arrays, never a mix."""
+    parent, base_name = os.path.split(os.path.normpath(directory))
+    os.makedirs(parent, exist_ok=True)
+    new_directory = tempfile.mkdtemp(prefix=f".{base_name}-new-", dir=parent)
+    try:
+        for name in arrays_object.ARRAY_NAMES:
+            np.save(
+                os.path.join(new_directory, f"{name}.npy"),
+                getattr(arrays_object, name),
+            )
+    except BaseException:
+        shutil.rmtree(new_directory, ignore_errors=True)
+        raise
+
+    # os.replace can't replace a non empty directory, so the old one is moved aside.
+    old_directory = None
+    if os.path.exists(directory):
+        old_directory = f"{new_directory}-old"
+        os.replace(directory, old_directory)
+    os.replace(new_directory, directory)
+    if old_directory is not None:
+        shutil.rmtree(old_directory, ignore_errors=True)
+
+
+def _load_arrays(cls, directory: str):
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        for name in cls.ARRAY_NAMES
+    }
+    return cls(**arrays)
+
+
+def _sum_by_key(
+    keys: np.ndarray, weights: np.ndarray
+) -> t.Tuple[np.ndarray, np.ndarray]:
+    """Gets the unique keys and the sum of the weights of each."""
+    unique_keys, positions = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(positions, weights, minlength=len(unique_keys))
+
+
+def _get_enum_codes(names: pd.Series, enum_type) -> np.ndarray:
+    """Converts enum names to their int8 values, with UNKNOWN_CODE for nulls."""
+    codes = {
+        member_name: member.value
+        for member_name, member in enum_type.__members__.items()
+    }
+    return names.map(codes).fillna(UNKNOWN_CODE).values.astype(np.int8)
+
+
+@functools.lru_cache(maxsize=1)
+def get_store() -> t.Optional[DeckStore]:
+    """Gets the saved store, or None if it has not been built."""
+    if not all(
+        os.path.exists(os.path.join(STORE_DIRECTORY, f"{name}.npy"))
+        for name in DeckStore.ARRAY_NAMES
+    ):
+        return None
+    return DeckStore.load()
+
+
+@functools.lru_cache(maxsize=256)
+def get_recent_play_counts(
+    maximum_age_days: int,
+    deck_type: t.Optional[models_deck.DeckType] = None,
+    archetype: t.Optional[models_deck.Archetype] = None,
+    half_life_days: t.Optional[float] = None,
+) -> t.Optional[pd.DataFrame]:
+    """Gets the play counts of decks updated in the last maximum_age_days,
+    restricted to the deck type and archetype if given,
+    and decayed by age if given a half life.
+
+    Cached until the store is updated, so do not modify the result.
+    None if the store has not been built."""
+    store = get_store()
+    if store is None:
+        return None
+    oldest_date = datetime.datetime.now() - datetime.timedelta(days=maximum_age_days)
+    return store.get_play_counts(
+        oldest_date=oldest_date,
+        deck_types=None if deck_type is None else [deck_type],
+        archetypes=None if archetype is None else [archetype],
+        half_life_days=half_life_days,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_playrate_cube() -> t.Optional[PlayrateCube]:
+    """Gets the saved cube, or None if it has not been built
+    or was built with a different number of deck types or archetypes."""
+    if not os.path.exists(os.path.join(CUBE_DIRECTORY, "play_counts.npy")):
+        return None
+    cube = PlayrateCube.load()
+    if cube.play_counts.shape[1:3] != (
+        PlayrateCube.NUM_DECK_TYPES,
+        PlayrateCube.NUM_ARCHETYPES,
+    ):
+        logging.warning("The playrate cube is outdated. It is not used until rebuilt.")
+        return None
+    return cube
+
+
+def update_playrate_cube(maximum_ages: t.List[int]):
+    """Rebuilds the cube for the windows from the store."""
+    store = get_store()
+    if store is None:
+        logging.warning("No deck store. The playrate cube is not updated.")
+        return
+    logging.info("Updating playrate cube")
+    store.get_playrate_cube(maximum_ages).save()
+    get_playrate_cube.cache_clear()
+
+
+@functools.lru_cache(maxsize=1)
+def get_card_neighbours() -> t.Optional[CardNeighbours]:
+    """Gets the saved card neighbours, or None if they have not been built."""
+    if not os.path.exists(os.path.join(NEIGHBOURS_DIRECTORY, "rates.npy")):
+        return None
+    return CardNeighbours.load()
+
+
+def update_card_neighbours(maximum_age_days: int):
+    """Rebuilds the card neighbours from decks of the last maximum_age_days."""
+    store = get_store()
+    if store is None:
+        logging.warning("No deck store. The card neighbours are not updated.")
+        return
+    logging.info("Updating card neighbours")
+    oldest_date = datetime.datetime.now() - datetime.timedelta(days=maximum_age_days)
+    store.get_card_neighbours(oldest_date).save()
+    get_card_neighbours.cache_clear()
+
+
+def update():
+    """Rebuilds the store from the database."""
+    logging.info("Updating deck store")
+    store = DeckStore.from_database()
+    store.save()
+    get_store.cache_clear()
+    get_recent_play_counts.cache_clear()
@@ -6,8 +6,8 @@ import pandas as pd
 import sqlalchemy.orm
 
 
+@functools.lru_cache(maxsize=None)
 def _sqlalchemy_class_to_column_names(sqlalchemy_class):
-    sqlalchemy.orm.class_mapper(sqlalchemy_class)
     column_names = [
         prop.key
         for prop in sqlalchemy.orm.class_mapper(sqlalchemy_class).iterate_properties
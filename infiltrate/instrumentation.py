@@ -0,0 +1,203 @@
+"""Low overhead measurement of the card evaluation pipeline and purchase evaluators.
+
+Each measured step records its wall time and rows in and out into an in-process
+registry, which is logged and served by the instrumentation admin view.
+
+Peak allocated bytes are only measured while tracemalloc is tracing, since tracing
+slows everything down. Operators can turn it on for a while through the admin view.
+"""
+import collections
+import contextlib
+import functools
+import logging
+import statistics
+import threading
+import time
+import tracemalloc
+import typing as t
+
+# Added in Python 3.9. Without it peaks are measured from the peak before the step.
+_reset_peak = getattr(tracemalloc, "reset_peak", None)
+
+
+class Measurement:
+    """A single run of a step. The measured code may fill in rows_out."""
+
+    def __init__(self, name: str, rows_in: t.Optional[int] = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out: t.Optional[int] = None
+        self.seconds = 0.0
+        self.peak_bytes: t.Optional[int] = None
+        self._child_peak = 0
+
+
+class StepStats:
+    """Totals for all runs of a step since the registry was cleared."""
+
+    NUM_RECENT = 100
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent_seconds: t.Deque[float] = collections.deque(
+            maxlen=self.NUM_RECENT
+        )
+        self.last_rows_in: t.Optional[int] = None
+        self.last_rows_out: t.Optional[int] = None
+        self.last_peak_bytes: t.Optional[int] = None
+        self.max_peak_bytes: t.Optional[int] = None
+
+    def add(self, measurement: Measurement):
+        self.calls += 1
+        self.total_seconds += measurement.seconds
+        self.max_seconds = max(self.max_seconds, measurement.seconds)
+        self.recent_seconds.append(measurement.seconds)
+        self.last_rows_in = measurement.rows_in
+        self.last_rows_out = measurement.rows_out
+        if measurement.peak_bytes is not None:
+            self.last_peak_bytes = measurement.peak_bytes
+            self.max_peak_bytes = max(self.max_peak_bytes or 0, measurement.peak_bytes)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "mean_seconds": self.total_seconds / self.calls,
+            "recent_median_seconds": statistics.median(self.recent_seconds),
+            "max_seconds": self.max_seconds,
+            "last_rows_in": self.last_rows_in,
+            "last_rows_out": self.last_rows_out,
+            "last_peak_bytes": self.last_peak_bytes,
+            "max_peak_bytes": self.max_peak_bytes,
+        }
+
+
+class Registry:
+    """Collects the stats of each step in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: t.Dict[str, StepStats] = {}
+
+    def record(self, measurement: Measurement):
+        with self._lock:
+            stats = self._stats.get(measurement.name)
+            if stats is None:
+                stats = self._stats[measurement.name] = StepStats(measurement.name)
+            stats.add(measurement)
+
+    def get_stats(self) -> t.List[t.Dict[str, t.Any]]:
+        """Gets the stats of each step, slowest total first."""
+        with self._lock:
+            all_stats = sorted(
+                self._stats.values(), key=lambda stats: -stats.total_seconds
+            )
+            return [stats.to_dict() for stats in all_stats]
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+REGISTRY = Registry()
+
+_open_measurements = threading.local()
+
+
+def _get_open_measurements() -> t.List[Measurement]:
+    try:
+        return _open_measurements.stack
+    except AttributeError:
+        _open_measurements.stack = []
+        return _open_measurements.stack
+
+
+@contextlib.contextmanager
+def measure(name: str, rows_in: t.Optional[int] = None) -> t.Iterator[Measurement]:
+    """Measures the enclosed code as a step of the given name."""
+    measurement = Measurement(name, rows_in)
+    open_measurements = _get_open_measurements()
+    is_tracing = tracemalloc.is_tracing()
+    if is_tracing:
+        start_bytes, start_peak = tracemalloc.get_traced_memory()
+        if _reset_peak is not None:
+            if open_measurements:
+                parent = open_measurements[-1]
+                parent._child_peak = max(parent._child_peak, start_peak)
+            _reset_peak()
+            start_peak = start_bytes
+
+    open_measurements.append(measurement)
+    start = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement.seconds = time.perf_counter() - start
+        open_measurements.pop()
+
+        if is_tracing and tracemalloc.is_tracing():
+            end_bytes, end_peak = tracemalloc.get_traced_memory()
+            # Inner steps may have reset the peak, so they report theirs.
+            peak = max(end_peak, measurement._child_peak)
+            if peak > start_peak:
+                measurement.peak_bytes = peak - start_bytes
+            else:
+                measurement.peak_bytes = max(end_bytes - start_bytes, 0)
+            if open_measurements:
+                parent = open_measurements[-1]
+                parent._child_peak = max(parent._child_peak, peak)
+
+        REGISTRY.record(measurement)
+        _log(measurement, is_outermost=not open_measurements)
+
+
+def _log(measurement: Measurement, is_outermost: bool):
+    message = f"{measurement.name} took {measurement.seconds * 1000:.1f}ms"
+    if measurement.rows_in is not None or measurement.rows_out is not None:
+        message += f", rows {measurement.rows_in} -> {measurement.rows_out}"
+    if measurement.peak_bytes is not None:
+        message += f", peak {measurement.peak_bytes / 1_000_000:.1f}MB"
+    if is_outermost:
+        logging.info(message)
+    else:
+        logging.debug(message)
+
+
+def measured(
+    name: t.Optional[str] = None,
+    count_rows_in: t.Optional[t.Callable[..., int]] = None,
+    count_rows_out: t.Optional[t.Callable[..., int]] = None,
+):
+    """Decorator measuring each call of the function.
+
+    count_rows_in is given the function's arguments,
+    and count_rows_out is given its result followed by its arguments."""
+
+    def decorator(function):
+        step_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            rows_in = count_rows_in(*args, **kwargs) if count_rows_in else None
+            with measure(step_name, rows_in) as measurement:
+                result = function(*args, **kwargs)
+                if count_rows_out:
+                    measurement.rows_out = count_rows_out(result, *args, **kwargs)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def start_tracing_memory():
+    """Starts measuring peak allocated bytes, which slows everything down."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def stop_tracing_memory():
+    tracemalloc.stop()
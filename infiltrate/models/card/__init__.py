@@ -5,6 +5,7 @@ Related to card_collections.py
 import logging
 import typing as t
 
+import numpy as np
 import pandas as pd
 import sqlalchemy.exc
 import sqlalchemy.orm
@@ -74,9 +75,7 @@ def all_cards_df_from_db() -> pd.DataFrame:
         inplace=True,
     )
 
-    cards_df["rarity"] = cards_df.rarity.apply(
-        lambda rarity_name: rarity.rarity_from_name[rarity_name]
-    )
+    cards_df["rarity"] = cards_df.rarity.map(rarity.code_from_name).astype(np.int8)
 
     return cards_df
 
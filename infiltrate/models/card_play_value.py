@@ -0,0 +1,55 @@
+"""Card values which are the same for every user.
+
+Refreshed after deck searches are updated, so that a user's card values only need
+their collection applied."""
+import pandas as pd
+
+import infiltrate.models.card as models_card
+from infiltrate import db
+
+
+class CardPlayValue(db.Model):
+    """A table of the user independent values of each copy of each card."""
+
+    __tablename__ = "card_play_values"
+    set_num = db.Column("set_num", db.Integer, primary_key=True)
+    card_num = db.Column("card_num", db.Integer, primary_key=True)
+    count_in_deck = db.Column("count_in_deck", db.Integer, primary_key=True)
+    num_decks_with_count_or_less = db.Column(
+        "num_decks_with_count_or_less", db.Float, nullable=False
+    )
+    play_rate = db.Column("play_rate", db.Float, nullable=False)
+    play_value = db.Column("play_value", db.Float, nullable=False)
+    craft_cost = db.Column("craft_cost", db.Integer, nullable=False)
+    findability = db.Column("findability", db.Float, nullable=False)
+    play_craft_efficiency = db.Column("play_craft_efficiency", db.Float, nullable=False)
+    __table_args__ = (
+        db.ForeignKeyConstraint(
+            (set_num, card_num),
+            [models_card.Card.set_num, models_card.Card.card_num],
+            ondelete="CASCADE",
+        ),
+        {},
+    )
+
+    @staticmethod
+    def as_df() -> pd.DataFrame:
+        session = db.engine.raw_connection()
+        query = "SELECT * FROM card_play_values"
+        df = pd.read_sql_query(query, session)
+        return df
+
+    @classmethod
+    def replace_all(cls, play_values: pd.DataFrame):
+        """Replaces the stored values with the given frame's matching columns."""
+        columns = [column.name for column in cls.__table__.columns]
+        with db.engine.begin() as connection:
+            connection.execute(cls.__table__.delete())
+            play_values[columns].to_sql(
+                cls.__tablename__,
+                connection,
+                if_exists="append",
+                index=False,
+                method="multi",
+                chunksize=1_000,
+            )
@@ -1,13 +1,14 @@
 """The Deck model and related utilities"""
+import concurrent.futures
 import enum
 import logging
 import typing as t
-import urllib.error
-from datetime import datetime
+from datetime import datetime, timedelta
 
-import tqdm
+from sqlalchemy.dialects import postgresql, sqlite
 
 import infiltrate.browsers as browsers
+import infiltrate.deck_fetching as deck_fetching
 import infiltrate.global_data as global_data
 import infiltrate.models.card as card
 
@@ -94,11 +95,105 @@ class Deck(db.Model):
         return Deck.query.filter_by(id=deck_id).first()
 
 
+class DeckBackfill(db.Model):
+    """A table of the progress of each backfill of historical decks,
+    so that it can resume after a restart.
+
+    next_page is the low water mark: the decks of every listing page before it
+    have been written."""
+
+    __tablename__ = "deck_backfills"
+    name = db.Column("name", db.String(length=40), primary_key=True)
+    oldest_date = db.Column("oldest_date", db.DateTime, nullable=False)
+    next_page = db.Column("next_page", db.Integer, nullable=False)
+    date_started = db.Column("date_started", db.DateTime, nullable=False)
+    date_completed = db.Column("date_completed", db.DateTime, nullable=True)
+
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def write_decks(decks: t.List[Deck]):
+    """Upserts the decks and replaces their cards, in one transaction.
+    Decks already applied to deck searches are retracted from them first.
+
+    Uses multi-row INSERT ... ON CONFLICT DO UPDATE where the database supports it,
+    rather than merging each deck, which selects the deck and each of its cards."""
+    import infiltrate.models.deck_search as deck_search
+
+    if not decks:
+        return
+    # Later copies of a deck in the batch replace earlier ones.
+    decks_by_id = {deck.id: deck for deck in decks}
+    dialect_insert = _DIALECT_INSERTS.get(db.engine.dialect.name)
+    try:
+        # They are added back with their new cards by the next deck search update.
+        deck_search.retract_decks(list(decks_by_id))
+        if dialect_insert is None:
+            for deck in decks_by_id.values():
+                db.session.merge(deck)
+        else:
+            _upsert_decks(list(decks_by_id.values()), dialect_insert)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _upsert_decks(decks: t.List[Deck], dialect_insert):
+    deck_table = Deck.__table__
+    insert = dialect_insert(deck_table).values([_get_row(deck) for deck in decks])
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=[deck_table.c.id],
+            set_={
+                column.name: insert.excluded[column.name]
+                for column in deck_table.columns
+                if not column.primary_key
+            },
+        )
+    )
+
+    card_table = DeckHasCard.__table__
+    # Cards removed from a deck since it was last written are dropped.
+    db.session.execute(
+        card_table.delete().where(card_table.c.deck_id.in_([deck.id for deck in decks]))
+    )
+    card_rows = {}
+    for deck in decks:
+        for deck_has_card in deck.cards:
+            row = _get_row(deck_has_card)
+            row["deck_id"] = deck.id
+            key = (deck.id, row["set_num"], row["card_num"])
+            # A card in more than one of a deck's lists keeps its largest count.
+            if key not in card_rows or card_rows[key]["num_played"] < row["num_played"]:
+                card_rows[key] = row
+    if card_rows:
+        insert = dialect_insert(card_table).values(list(card_rows.values()))
+        db.session.execute(
+            insert.on_conflict_do_update(
+                index_elements=[
+                    column for column in card_table.columns if column.primary_key
+                ],
+                set_={"num_played": insert.excluded.num_played},
+            )
+        )
+
+
+def _get_row(model: db.Model) -> t.Dict[str, t.Any]:
+    """The values of the model's table columns, by column name."""
+    return {
+        column.name: getattr(model, column.key) for column in model.__table__.columns
+    }
+
+
 # noinspection PyMissingOrEmptyDocstring
 class _WarcryNewIdGetter:
     ITEMS_PER_PAGE = 50
 
     def get_new_ids(self, max_decks=None):
+        """Gets the ids of decks which are new or were updated since they were stored,
+        reading at most max_decks listings."""
         if max_decks is not None:
             max_pages = max_decks / self.ITEMS_PER_PAGE
         else:
@@ -108,18 +203,21 @@ class _WarcryNewIdGetter:
         new_ids = []
         page = 0
         while True:
-            ids_on_page = self.get_ids_from_page(page)
-            new_ids_on_page = self.remove_old_ids(ids_on_page)
+            listings = self.get_listings_from_page(page)
+            new_ids_on_page = self.remove_old_ids(
+                list(listings.keys()), listings.values()
+            )
             new_ids += new_ids_on_page
+            # Pages are newest first, so a page of only known decks ends the new ones.
             if not new_ids_on_page or max_pages is not None and page >= max_pages:
-                # todo this may need testing.
                 break
 
             page += 1
             logging.info(f"Pages of deck ids ready: {page}")
         return new_ids
 
-    def get_ids_from_page(self, page: int):
+    def get_listings_from_page(self, page: int) -> t.Dict[str, t.Optional[datetime]]:
+        """Gets the id of each deck on the page, and when it was last updated."""
         # TODO could find what deck search they belong to here and only keep the needed ones
         url = (
             "https://api.eternalwarcry.com/v1/decks/SearchDecks"
@@ -128,29 +226,58 @@ class _WarcryNewIdGetter:
             + f"&key={application.config['WARCRY_KEY']}"
         )
         page_json = browsers.get_json_from_url(url)
-        ids = self.get_ids_from_page_json(page_json)
-
-        return ids
+        return self.get_listings_from_page_json(page_json)
 
     @staticmethod
-    def get_ids_from_page_json(page_json: t.Dict):
-        decks = page_json["decks"]
-        ids = [deck["deck_id"] for deck in decks]
-        return ids
+    def get_listings_from_page_json(
+        page_json: t.Dict,
+    ) -> t.Dict[str, t.Optional[datetime]]:
+        return {
+            deck["deck_id"]: _parse_date(deck.get("date_updated_full"))
+            for deck in page_json["decks"]
+        }
 
     @staticmethod
-    def remove_old_ids(ids: t.List[str]) -> t.List[str]:
-        new_ids = []
-        for deck_id in ids:
-            if not Deck.get_from_id(deck_id):
-                new_ids.append(deck_id)
-            else:
-                break
-        return new_ids
+    def remove_old_ids(
+        ids: t.List[str],
+        listed_dates: t.Optional[t.Iterable[t.Optional[datetime]]] = None,
+    ) -> t.List[str]:
+        """Keeps the ids not in the database, or listed as updated after the
+        stored deck, checking the whole page at once,
+        so decks newer than a gap in ingestion are still found."""
+        stored_dates = dict(
+            db.session.query(Deck.id, Deck.date_updated).filter(Deck.id.in_(ids))
+        )
+        if listed_dates is None:
+            listed_dates = [None] * len(ids)
+        return [
+            deck_id
+            for deck_id, listed_date in zip(ids, listed_dates)
+            if deck_id not in stored_dates
+            or _is_newer(listed_date, stored_dates[deck_id])
+        ]
+
+
+def _parse_date(date_string: t.Optional[str]) -> t.Optional[datetime]:
+    """Parses Warcry's full dates, such as 2020-01-02T03:04:05.67."""
+    if not date_string:
+        return None
+    return datetime.strptime(date_string[:19], "%Y-%m-%dT%H:%M:%S")
+
+
+def _is_newer(listed_date: t.Optional[datetime], stored_date: t.Optional[datetime]):
+    """If a listed deck was updated after the stored copy.
+    Decks without dates can't be compared, so they are assumed unchanged."""
+    return (
+        listed_date is not None
+        and stored_date is not None
+        and listed_date > stored_date
+    )
 
 
 def get_new_warcry_ids(max_decks=1_000):
-    """Return all Warcry deck IDs newer than any in the database."""
+    """Return all Warcry deck IDs newer than any in the database,
+    or updated since they were stored."""
 
     id_getter = _WarcryNewIdGetter()
     ids = id_getter.get_new_ids(max_decks=max_decks)
@@ -158,84 +285,166 @@ def get_new_warcry_ids(max_decks=1_000):
     return ids
 
 
-def update_decks():
-    """Updates the database with all new Warcry decks"""
+# noinspection PyMissingOrEmptyDocstring
+class _WarcyDeckUpdater:
+    def run(self, ids: t.List[str]) -> t.List[str]:
+        """Fetches and writes the decks.
+        Returns the ids of the decks which failed to fetch, and were not written."""
+        # Fetched concurrently, and written from this thread in batches.
+        fetcher = deck_fetching.ConcurrentFetcher(
+            parse=self.make_deck_from_details_json,
+            write_batch=write_decks,
+            num_workers=int(application.config["DECK_FETCH_WORKERS"]),
+            requests_per_second=float(application.config["DECK_FETCH_RATE"]),
+        )
+        ids_by_url = {self.get_details_url(deck_id): deck_id for deck_id in ids}
+        num_written = fetcher.run(list(ids_by_url))
+        logging.info(f"Updated {num_written} of {len(ids)} decks")
+        return [ids_by_url[url] for url in fetcher.failed_urls]
 
-    # noinspection PyMissingOrEmptyDocstring
-    class _WarcyDeckUpdater:
-        def run(self):
-            ids = get_new_warcry_ids(1_000)
+    @staticmethod
+    def get_details_url(deck_id: str) -> str:
+        return (
+            "https://api.eternalwarcry.com/v1/decks/details"
+            + f"?key={application.config['WARCRY_KEY']}"
+            + f"&deck_id={deck_id}"
+        )
 
-            for deck_id in tqdm.tqdm(ids, desc="Updating decks"):
-                self.update_deck(deck_id)
+    def make_deck_from_details_json(self, page_json: t.Dict) -> Deck:
+
+        archetype = Archetype[page_json["archetype"].lower().replace(" ", "_")]
+        try:
+            deck_type = DeckType.__dict__[
+                page_json["deck_type"].lower().replace(" ", "_")
+            ]
+        except KeyError:  # not sure this is the right exception
+            deck_type = DeckType(int(page_json["deck_type"]))
+
+        deck = Deck(
+            id=page_json["deck_id"],
+            archetype=archetype,
+            date_added=_parse_date(page_json["date_added_full"]),
+            date_updated=_parse_date(page_json["date_updated_full"]),
+            deck_type=deck_type,
+            description=page_json["description"].encode("ascii", errors="ignore"),
+            patch=page_json["patch"],
+            username=page_json["username"],
+            views=page_json["views"],
+            rating=page_json["rating"],
+        )
 
-        def update_deck(self, deck_id: str):
-            url = (
-                "https://api.eternalwarcry.com/v1/decks/details"
-                + f"?key={application.config['WARCRY_KEY']}"
-                + f"&deck_id={deck_id}"
-            )
-            try:
-                page_json = browsers.get_json_from_url(url)
-            except (ConnectionError, urllib.error.HTTPError):
-                return
-
-            self.make_deck_from_details_json(page_json)
-
-        def make_deck_from_details_json(self, page_json: t.Dict):
-
-            archetype = Archetype[page_json["archetype"].lower().replace(" ", "_")]
-            try:
-                deck_type = DeckType.__dict__[
-                    page_json["deck_type"].lower().replace(" ", "_")
-                ]
-            except KeyError:  # not sure this is the right exception
-                deck_type = DeckType(int(page_json["deck_type"]))
-
-            deck = Deck(
-                id=page_json["deck_id"],
-                archetype=archetype,
-                date_added=datetime.strptime(
-                    page_json["date_added_full"][:19], "%Y-%m-%dT%H:%M:%S"
-                ),
-                date_updated=datetime.strptime(
-                    page_json["date_updated_full"][:19], "%Y-%m-%dT%H:%M:%S"
-                ),
-                deck_type=deck_type,
-                description=page_json["description"].encode("ascii", errors="ignore"),
-                patch=page_json["patch"],
-                username=page_json["username"],
-                views=page_json["views"],
-                rating=page_json["rating"],
-            )
+        self.add_cards_to_deck(deck, page_json)
+        return deck
+
+    @staticmethod
+    def add_cards_to_deck(deck: Deck, page_json: t.Dict):
+        cards_json = (
+            page_json["deck_cards"]
+            + page_json["sideboard_cards"]
+            + page_json["market_cards"]
+        )
 
-            self.add_cards_to_deck(deck, page_json)
-            db.session.merge(deck)
-            db.session.commit()
+        for card_json in cards_json:
+            set_num = card_json["set_number"]
+            card_num = card_json["eternal_id"]
+            card_id = card.CardId(set_num, card_num)
 
-        @staticmethod
-        def add_cards_to_deck(deck: Deck, page_json: t.Dict):
-            cards_json = (
-                page_json["deck_cards"]
-                + page_json["sideboard_cards"]
-                + page_json["market_cards"]
-            )
+            # todo better to pass all_cards to this than use the global
+            if global_data.all_cards.card_exists(card_id):
+                deck_has_card = DeckHasCard(
+                    deck_id=page_json["deck_id"],
+                    set_num=set_num,
+                    card_num=card_num,
+                    num_played=card_json["count"],
+                )
+                deck.cards.append(deck_has_card)
 
-            for card_json in cards_json:
-                set_num = card_json["set_number"]
-                card_num = card_json["eternal_id"]
-                card_id = card.CardId(set_num, card_num)
-
-                # todo better to pass all_cards to this than use the global
-                if global_data.all_cards.card_exists(card_id):
-                    deck_has_card = DeckHasCard(
-                        deck_id=page_json["deck_id"],
-                        set_num=set_num,
-                        card_num=card_num,
-                        num_played=card_json["count"],
-                    )
-                    deck.cards.append(deck_has_card)
 
+def update_decks():
+    """Updates the database with all new Warcry decks"""
     logging.info("Updating decks")
     updater = _WarcyDeckUpdater()
-    updater.run()
+    updater.run(get_new_warcry_ids(1_000))
+
+
+def backfill_decks(
+    maximum_age_days: int = 90,
+    name: str = "history",
+    pages_per_chunk: int = 20,
+    restart: bool = False,
+    num_retries: int = 2,
+):
+    """Fetches every Warcry deck updated in the last maximum_age_days,
+    resuming the backfill with the name from its checkpoint.
+
+    Listing pages are fetched a chunk at a time in parallel, then the chunk's new
+    and changed decks, and then the checkpoint is moved past the chunk.
+    Decks which fail to fetch are retried num_retries times. If some still fail,
+    the backfill stops without moving the checkpoint, so they are retried when
+    it is continued.
+    New decks push older ones onto later pages while it runs,
+    so resuming may see some decks again, but misses none."""
+    checkpoint = DeckBackfill.query.get(name)
+    if checkpoint is None or restart:
+        checkpoint = DeckBackfill(
+            name=name,
+            oldest_date=datetime.now() - timedelta(days=maximum_age_days),
+            next_page=0,
+            date_started=datetime.now(),
+        )
+        checkpoint = db.session.merge(checkpoint)
+        db.session.commit()
+    if checkpoint.date_completed is not None:
+        logging.info(f"Deck backfill {name} is already complete")
+        return
+    logging.info(
+        f"Backfilling decks since {checkpoint.oldest_date} from page "
+        f"{checkpoint.next_page}"
+    )
+
+    id_getter = _WarcryNewIdGetter()
+    updater = _WarcyDeckUpdater()
+    num_workers = int(application.config["DECK_FETCH_WORKERS"])
+    rate_limit = deck_fetching.TokenBucket(float(application.config["DECK_FETCH_RATE"]))
+
+    def get_listings(page: int) -> t.Dict[str, t.Optional[datetime]]:
+        rate_limit.acquire()
+        return id_getter.get_listings_from_page(page)
+
+    while checkpoint.date_completed is None:
+        pages = range(checkpoint.next_page, checkpoint.next_page + pages_per_chunk)
+        with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+            chunk_listings = list(executor.map(get_listings, pages))
+
+        listings = {}
+        is_complete = False
+        for page_listings in chunk_listings:
+            in_range = {
+                deck_id: date
+                for deck_id, date in page_listings.items()
+                if date is None or date > checkpoint.oldest_date
+            }
+            listings.update(in_range)
+            # Pages are newest first, so a page with older decks is the last needed.
+            if not page_listings or len(in_range) < len(page_listings):
+                is_complete = True
+                break
+
+        ids = id_getter.remove_old_ids(list(listings.keys()), listings.values())
+        failed_ids = updater.run(ids)
+        for _ in range(num_retries):
+            if not failed_ids:
+                break
+            failed_ids = updater.run(failed_ids)
+        if failed_ids:
+            logging.warning(
+                f"Deck backfill {name} stopped at page {checkpoint.next_page},"
+                f" as {len(failed_ids)} decks failed to fetch"
+            )
+            return
+
+        checkpoint.next_page = pages.stop
+        if is_complete:
+            checkpoint.date_completed = datetime.now()
+        db.session.commit()
+        logging.info(f"Deck backfill {name} is complete to page {pages.stop}")
@@ -1,19 +1,25 @@
 """Specifies groups of decks"""
 from __future__ import annotations
 
+import collections
 import dataclasses
 import datetime
 import logging
 import typing as t
 
 import pandas as pd
-from tqdm import tqdm
+import sqlalchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
-import infiltrate.card_collections as card_collections
+import infiltrate.deck_store as deck_store
+import infiltrate.df_types as df_types
 import infiltrate.models.card as models_card
 import infiltrate.models.deck as models_deck
 from infiltrate import db
 
+PLAY_COUNT_NAME = "num_decks_with_count_or_less"
+PLAY_COUNT_COLUMN_NAMES = ["set_num", "card_num", "count_in_deck", PLAY_COUNT_NAME]
+
 
 class DeckSearchHasCard(db.Model):
     """A table showing the amount the playset sizes of cards
@@ -51,26 +57,55 @@ class DeckSearchHasCard(db.Model):
         return df
 
 
+class DeckSearchHasDeck(db.Model):
+    """A table of the decks whose plays have been added to a deck search's playrates.
+
+    This is the watermark for updating the playrates incrementally. The deck's date
+    and weight are kept as they were applied, so they can be subtracted exactly
+    once the deck leaves the deck search."""
+
+    decksearch_id = db.Column(
+        "decksearch_id", db.Integer, db.ForeignKey("deck_searches.id"), primary_key=True
+    )
+    deck_id = db.Column(
+        "deck_id", db.String(length=100), db.ForeignKey("decks.id"), primary_key=True
+    )
+    date_updated = db.Column("date_updated", db.DateTime, nullable=False)
+    weight = db.Column("weight", db.Integer, nullable=False)
+    date_applied = db.Column("date_applied", db.DateTime, nullable=False)
+
+
 class DeckSearch(db.Model):
     """A table for a set of parameters to filter the list of all decks"""
 
     __tablename__ = "deck_searches"
     id = db.Column(db.Integer, primary_key=True)
     maximum_age_days = db.Column("maximum_age_days", db.Integer())
+    # Decks are weighted by their recency if given, halving every half life.
+    half_life_days = db.Column("half_life_days", db.Float(), nullable=True)
     cards: t.List[DeckSearchHasCard] = db.relationship("DeckSearchHasCard")
 
+    def get_oldest_date(self) -> datetime.datetime:
+        """Decks updated after this date belong to the deck search."""
+        return datetime.datetime.now() - datetime.timedelta(days=self.maximum_age_days)
+
     def get_decks(self) -> t.List[models_deck.Deck]:
         """Returns all decks belonging to the deck search"""
-        time_to_update = datetime.datetime.now() - datetime.timedelta(
-            days=self.maximum_age_days
-        )
-        is_past_time_to_update = models_deck.Deck.date_updated > time_to_update
+        is_past_time_to_update = models_deck.Deck.date_updated > self.get_oldest_date()
         decks = models_deck.Deck.query.filter(is_past_time_to_update)
         return decks
 
     def get_play_counts(self) -> pd.DataFrame:
         """Gets a dataframe of the number of times each copy of each card is used
-        in decks in the deck search."""
+        in decks in the deck search.
+
+        Computed from the deck store if it has been built,
+        otherwise read from the playrate cache."""
+        store = deck_store.get_store()
+        if store is not None:
+            return store.get_play_counts(
+                oldest_date=self.get_oldest_date(), half_life_days=self.half_life_days
+            )
         num_decks_with_cards = DeckSearchHasCard.as_df(decksearch_id=self.id)
         return num_decks_with_cards
 
@@ -80,47 +115,396 @@ class DeckSearch(db.Model):
 
         This cache is redundant but avoids recalculation.
 
-        This cache can become out of date, and should be recalculated
-        regularly."""
-        self.delete_playrates()
-        playrates = self._get_playrates()
-        self._add_playrates(playrates)
+        This cache is updated incrementally from the decks entering and leaving
+        the deck search since the last update, so can be updated often."""
+        update_playrates([self])
 
     def delete_playrates(self):
-        """Delete the playrate cache."""
+        """Delete the playrate cache, so that the next update rebuilds it."""
         DeckSearchHasCard.query.filter_by(decksearch_id=self.id).delete()
+        DeckSearchHasDeck.query.filter_by(decksearch_id=self.id).delete()
 
-    def _get_playrates(self):
-        playrate = card_collections.make_card_playset_dict()
-        for deck in self.get_decks():
-            for card in deck.cards:
-                card_id = models_card.CardId(
-                    set_num=card.set_num, card_num=card.card_num
-                )
-                for num_played in range(min(card.num_played, 4)):
-                    playrate[card_id][num_played] += self._scale_playrate(deck)
-        return playrate
-
-    def _scale_playrate(self, deck):
+    @staticmethod
+    def _scale_playrate(decks):
         """This is the adjusted amount a card play counts for,
         scaled on the 'importance' of the deck, so that better decks have more
         influence over the play rates."""
-        return deck.views
-
-    def _add_playrates(self, playrates: t.Dict):
-        rows = []
-        for card_id, counts in tqdm(playrates.items(), desc="Add playrates"):
-            for play_count in range(1, 5):
-                deck_search_has_card = DeckSearchHasCard(
-                    decksearch_id=self.id,
-                    set_num=card_id.set_num,
-                    card_num=card_id.card_num,
-                    count_in_deck=play_count,
-                    num_decks_with_count_or_less=counts[play_count - 1],
-                )
-                rows.append(deck_search_has_card)
-        db.session.bulk_save_objects(rows)
-        db.session.commit()
+        return db.func.coalesce(decks.c.views, 0)
+
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def update_playrates(deck_searches: t.List[DeckSearch]):
+    """Updates the playrate caches of the deck searches within the database.
+
+    Deck searches without applied decks are rebuilt with a single pass over
+    the decks. The others add the plays of decks that entered them
+    and subtract the plays of decks that left them since the last update.
+    Decayed deck searches change every deck's weight, so are rebuilt
+    from the deck store."""
+    now = datetime.datetime.now()
+    decayed_searches = [
+        deck_search for deck_search in deck_searches if deck_search.half_life_days
+    ]
+    if decayed_searches:
+        _rebuild_decayed_playrates(decayed_searches, now)
+        deck_searches = [
+            deck_search
+            for deck_search in deck_searches
+            if deck_search not in decayed_searches
+        ]
+    dialect_insert = _DIALECT_INSERTS.get(db.engine.dialect.name)
+    applied_ids = {
+        decksearch_id
+        for (decksearch_id,) in db.session.query(DeckSearchHasDeck.decksearch_id)
+        .filter(
+            DeckSearchHasDeck.decksearch_id.in_(
+                [deck_search.id for deck_search in deck_searches]
+            )
+        )
+        .distinct()
+    }
+    if dialect_insert is None:
+        # Incremental updates need an upsert, so other databases always rebuild.
+        applied_ids = set()
+    new_searches = [search for search in deck_searches if search.id not in applied_ids]
+    applied_searches = [search for search in deck_searches if search.id in applied_ids]
+
+    if new_searches:
+        _rebuild_playrates(new_searches, now)
+    if applied_searches:
+        _update_playrates_incrementally(applied_searches, now, dialect_insert)
+    db.session.commit()
+
+    for deck_search in deck_searches + decayed_searches:
+        db.session.expire(deck_search, ["cards"])
+
+
+def _rebuild_decayed_playrates(
+    deck_searches: t.List[DeckSearch], now: datetime.datetime
+):
+    """Replaces the playrate caches of the decayed deck searches
+    with play counts from the deck store, rounded to whole counts."""
+    store = deck_store.get_store()
+    if store is None:
+        logging.warning("No deck store. Decayed deck searches are not updated.")
+        return
+
+    deck_search_ids = [deck_search.id for deck_search in deck_searches]
+    DeckSearchHasCard.query.filter(
+        DeckSearchHasCard.decksearch_id.in_(deck_search_ids)
+    ).delete(synchronize_session=False)
+    for deck_search in deck_searches:
+        play_counts = store.get_play_counts(
+            oldest_date=_get_oldest_date(deck_search, now),
+            half_life_days=deck_search.half_life_days,
+            now=now,
+        )
+        play_counts[deck_store.PLAY_COUNT_NAME] = (
+            play_counts[deck_store.PLAY_COUNT_NAME].round().astype(int)
+        )
+        play_counts["decksearch_id"] = deck_search.id
+        play_counts.to_sql(
+            DeckSearchHasCard.__tablename__,
+            db.session.connection(),
+            if_exists="append",
+            index=False,
+        )
+
+
+def _rebuild_playrates(deck_searches: t.List[DeckSearch], now: datetime.datetime):
+    """Replaces the playrate caches of the deck searches."""
+    deck_search_ids = [deck_search.id for deck_search in deck_searches]
+    for model in (DeckSearchHasCard, DeckSearchHasDeck):
+        model.query.filter(model.decksearch_id.in_(deck_search_ids)).delete(
+            synchronize_session=False
+        )
+
+    table = DeckSearchHasCard.__table__
+    insert = table.insert().from_select(
+        [
+            table.c.decksearch_id,
+            table.c.set_num,
+            table.c.card_num,
+            table.c.count_in_deck,
+            table.c.num_decks_with_count_or_less,
+        ],
+        _get_playrates_query(deck_searches, now),
+    )
+    db.session.execute(insert)
+    _add_entering_decks(deck_searches, now)
+
+
+def _update_playrates_incrementally(
+    deck_searches: t.List[DeckSearch], now: datetime.datetime, dialect_insert
+):
+    """Adds the plays of decks entering the deck searches,
+    and subtracts the plays of decks leaving them."""
+    num_entering = _add_entering_decks(deck_searches, now)
+
+    applied = DeckSearchHasDeck.__table__
+    is_leaving = _get_is_leaving(deck_searches, now)
+    changes = db.union_all(
+        db.select(applied.c.decksearch_id, applied.c.deck_id, applied.c.weight).where(
+            applied.c.date_applied == now
+        ),
+        db.select(applied.c.decksearch_id, applied.c.deck_id, -applied.c.weight).where(
+            is_leaving
+        ),
+    ).subquery("changes")
+    _apply_deck_changes(changes, dialect_insert)
+
+    num_leaving = db.session.execute(applied.delete().where(is_leaving)).rowcount
+    _delete_empty_playrates([deck_search.id for deck_search in deck_searches])
+    logging.info(
+        f"Updated deck searches with {num_entering} entering "
+        f"and {num_leaving} leaving decks"
+    )
+
+
+def _apply_deck_changes(changes, dialect_insert):
+    """Adds the weight of each deck in a subquery of
+    (decksearch_id, deck_id, weight) changes to the deck search's playrates."""
+    deck_has_card = models_deck.DeckHasCard.__table__
+    copies = _get_copy_counts_query()
+    has_count = deck_has_card.c.num_played >= copies.c.count_in_deck
+    weight = db.case((has_count, changes.c.weight), else_=0)
+    changes_query = (
+        db.select(
+            changes.c.decksearch_id,
+            deck_has_card.c.set_num,
+            deck_has_card.c.card_num,
+            copies.c.count_in_deck,
+            db.func.sum(weight),
+        )
+        .select_from(
+            changes.join(
+                deck_has_card, deck_has_card.c.deck_id == changes.c.deck_id
+            ).join(copies, db.true())
+        )
+        .where(db.true())
+        .group_by(
+            changes.c.decksearch_id,
+            deck_has_card.c.set_num,
+            deck_has_card.c.card_num,
+            copies.c.count_in_deck,
+        )
+    )
+
+    table = DeckSearchHasCard.__table__
+    upsert = dialect_insert(table).from_select(
+        [
+            table.c.decksearch_id,
+            table.c.set_num,
+            table.c.card_num,
+            table.c.count_in_deck,
+            table.c.num_decks_with_count_or_less,
+        ],
+        changes_query,
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[
+            table.c.decksearch_id,
+            table.c.set_num,
+            table.c.card_num,
+            table.c.count_in_deck,
+        ],
+        set_={
+            table.c.num_decks_with_count_or_less.name: (
+                table.c.num_decks_with_count_or_less
+                + upsert.excluded.num_decks_with_count_or_less
+            )
+        },
+    )
+    db.session.execute(upsert)
+
+
+def _delete_empty_playrates(deck_search_ids: t.List[int]):
+    table = DeckSearchHasCard.__table__
+    db.session.execute(
+        table.delete().where(
+            db.and_(
+                table.c.decksearch_id.in_(deck_search_ids),
+                table.c.num_decks_with_count_or_less == 0,
+            )
+        )
+    )
+
+
+def retract_decks(deck_ids: t.List[str]):
+    """Subtracts the plays of the decks from the deck searches they were applied to,
+    and forgets they were applied, so the next update adds them again.
+
+    Run before changing the decks' cards, so the cards they were applied with are
+    subtracted. Doesn't commit."""
+    applied = DeckSearchHasDeck.__table__
+    is_retracted = applied.c.deck_id.in_(deck_ids)
+    deck_search_ids = [
+        decksearch_id
+        for (decksearch_id,) in db.session.query(DeckSearchHasDeck.decksearch_id)
+        .filter(is_retracted)
+        .distinct()
+    ]
+    if not deck_search_ids:
+        return
+    dialect_insert = _DIALECT_INSERTS.get(db.engine.dialect.name)
+    if dialect_insert is not None:
+        changes = (
+            db.select(
+                applied.c.decksearch_id,
+                applied.c.deck_id,
+                (-applied.c.weight).label("weight"),
+            )
+            .where(is_retracted)
+            .subquery("changes")
+        )
+        _apply_deck_changes(changes, dialect_insert)
+        _delete_empty_playrates(deck_search_ids)
+    num_retracted = db.session.execute(applied.delete().where(is_retracted)).rowcount
+    logging.info(f"Retracted {num_retracted} applied decks from deck searches")
+
+
+def _add_entering_decks(
+    deck_searches: t.List[DeckSearch], now: datetime.datetime
+) -> int:
+    """Records the decks in each deck search that are not yet applied to it,
+    with the given date_applied."""
+    decks = models_deck.Deck.__table__
+    applied = DeckSearchHasDeck.__table__
+    entering_queries = [
+        db.select(
+            db.literal(deck_search.id, db.Integer),
+            decks.c.id,
+            decks.c.date_updated,
+            DeckSearch._scale_playrate(decks),
+            db.literal(now, db.DateTime),
+        ).where(
+            db.and_(
+                decks.c.date_updated > _get_oldest_date(deck_search, now),
+                ~db.exists().where(
+                    db.and_(
+                        applied.c.decksearch_id == deck_search.id,
+                        applied.c.deck_id == decks.c.id,
+                    )
+                ),
+            )
+        )
+        for deck_search in deck_searches
+    ]
+    insert = applied.insert().from_select(
+        [
+            applied.c.decksearch_id,
+            applied.c.deck_id,
+            applied.c.date_updated,
+            applied.c.weight,
+            applied.c.date_applied,
+        ],
+        db.union_all(*entering_queries),
+    )
+    return db.session.execute(insert).rowcount
+
+
+def _get_is_leaving(deck_searches: t.List[DeckSearch], now: datetime.datetime):
+    """A condition on applied decks which are now too old for their deck search."""
+    applied = DeckSearchHasDeck.__table__
+    return db.or_(
+        *[
+            db.and_(
+                applied.c.decksearch_id == deck_search.id,
+                applied.c.date_updated <= _get_oldest_date(deck_search, now),
+            )
+            for deck_search in deck_searches
+        ]
+    )
+
+
+def _get_oldest_date(
+    deck_search: DeckSearch, now: datetime.datetime
+) -> datetime.datetime:
+    return now - datetime.timedelta(days=deck_search.maximum_age_days)
+
+
+def _get_playrates_query(deck_searches: t.List[DeckSearch], now: datetime.datetime):
+    """A query of the weight of decks in each deck search with at least each count
+    of each card, for each card in any of the deck search's decks.
+
+    Each deck is counted once, in the shortest window containing it.
+    Windows are nested, so each deck search adds up the windows within it."""
+    maximum_ages = sorted(
+        {deck_search.maximum_age_days for deck_search in deck_searches}
+    )
+
+    def get_oldest_date(maximum_age_days: int) -> datetime.datetime:
+        return now - datetime.timedelta(days=maximum_age_days)
+
+    decks = models_deck.Deck.__table__
+    deck_has_card = models_deck.DeckHasCard.__table__
+    copies = _get_copy_counts_query()
+
+    window = db.case(
+        *[
+            (decks.c.date_updated > get_oldest_date(maximum_age), maximum_age)
+            for maximum_age in maximum_ages
+        ]
+    ).label("maximum_age_days")
+    has_count = deck_has_card.c.num_played >= copies.c.count_in_deck
+    weight = db.case((has_count, DeckSearch._scale_playrate(decks)), else_=0)
+    windowed = (
+        db.select(
+            window,
+            deck_has_card.c.set_num,
+            deck_has_card.c.card_num,
+            copies.c.count_in_deck,
+            db.func.sum(weight).label("weight"),
+        )
+        .select_from(
+            deck_has_card.join(decks, decks.c.id == deck_has_card.c.deck_id).join(
+                copies, db.true()
+            )
+        )
+        .where(decks.c.date_updated > get_oldest_date(maximum_ages[-1]))
+        .group_by(
+            window,
+            deck_has_card.c.set_num,
+            deck_has_card.c.card_num,
+            copies.c.count_in_deck,
+        )
+        .subquery("windowed")
+    )
+
+    searches = DeckSearch.__table__
+    return (
+        db.select(
+            searches.c.id,
+            windowed.c.set_num,
+            windowed.c.card_num,
+            windowed.c.count_in_deck,
+            db.func.sum(windowed.c.weight),
+        )
+        .select_from(
+            windowed.join(
+                searches, windowed.c.maximum_age_days <= searches.c.maximum_age_days
+            )
+        )
+        .where(searches.c.id.in_([deck_search.id for deck_search in deck_searches]))
+        .group_by(
+            searches.c.id,
+            windowed.c.set_num,
+            windowed.c.card_num,
+            windowed.c.count_in_deck,
+        )
+    )
+
+
+def _get_copy_counts_query():
+    """A query of the numbers of copies a deck may have, from 1 to 4."""
+    return db.union_all(
+        *[
+            db.select(db.literal(count, db.Integer).label("count_in_deck"))
+            for count in range(1, 5)
+        ]
+    ).subquery("copies")
 
 
 def create_deck_searches():
@@ -143,6 +527,92 @@ def create_deck_searches():
     db.session.commit()
 
 
+DEFAULT_PROFILE_ID = 1
+
+
+class DeckSearchProfile(db.Model):
+    """A user defined set of weighted deck searches, optionally restricted
+    to a deck type and archetype."""
+
+    __tablename__ = "deck_search_profiles"
+    id = db.Column("id", db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column("user_id", db.Integer, db.ForeignKey("users.id"))
+    name = db.Column("name", db.String(length=40))
+    deck_type = db.Column("deck_type", db.Enum(models_deck.DeckType), nullable=True)
+    archetype = db.Column("archetype", db.Enum(models_deck.Archetype), nullable=True)
+    weighted_deck_searches: t.List["WeightedDeckSearch"] = db.relationship(
+        "WeightedDeckSearch",
+        primaryjoin="DeckSearchProfile.id == foreign(WeightedDeckSearch.profile_id)",
+        cascade="all, delete-orphan",
+    )
+
+    @classmethod
+    def create(
+        cls,
+        user_id: int,
+        name: str,
+        windows: t.Dict[int, float],
+        deck_type: t.Optional[models_deck.DeckType] = None,
+        archetype: t.Optional[models_deck.Archetype] = None,
+        half_life_days: t.Optional[float] = None,
+    ):
+        """Creates a profile weighting the decks of each maximum age in days,
+        decayed by their age if given a half life."""
+        profile = cls(
+            user_id=user_id, name=name, deck_type=deck_type, archetype=archetype
+        )
+        for maximum_age_days, weight in windows.items():
+            name = f"Last {maximum_age_days} days"
+            if half_life_days:
+                name = f"{maximum_age_days}d, half life {half_life_days:g}d"
+            profile.weighted_deck_searches.append(
+                WeightedDeckSearch(
+                    deck_search=get_or_create_deck_search(
+                        maximum_age_days, half_life_days
+                    ),
+                    name=name[:20],
+                    weight=weight,
+                )
+            )
+        _normalize_deck_search_weights(profile.weighted_deck_searches)
+        db.session.add(profile)
+        db.session.commit()
+        return profile
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "deck_type": self.deck_type.name if self.deck_type else None,
+            "archetype": self.archetype.name if self.archetype else None,
+            "windows": {
+                search.deck_search.maximum_age_days: search.weight
+                for search in self.weighted_deck_searches
+            },
+            "half_life_days": next(
+                (
+                    search.deck_search.half_life_days
+                    for search in self.weighted_deck_searches
+                ),
+                None,
+            ),
+        }
+
+
+def get_or_create_deck_search(
+    maximum_age_days: int, half_life_days: t.Optional[float] = None
+) -> DeckSearch:
+    deck_search = DeckSearch.query.filter_by(
+        maximum_age_days=maximum_age_days, half_life_days=half_life_days
+    ).first()
+    if deck_search is None:
+        deck_search = DeckSearch(
+            maximum_age_days=maximum_age_days, half_life_days=half_life_days
+        )
+        db.session.add(deck_search)
+    return deck_search
+
+
 class WeightedDeckSearch(db.Model):
     """A DeckSearch with a user given weight for its relative importance.
 
@@ -151,23 +621,148 @@ class WeightedDeckSearch(db.Model):
     deck_search_id = db.Column(
         db.Integer, db.ForeignKey("deck_searches.id"), primary_key=True
     )
-    profile_id = db.Column(db.Integer())
+    profile_id = db.Column(db.Integer(), primary_key=True)
     name = db.Column("name", db.String(length=20), primary_key=True)
 
     weight = db.Column("weight", db.Float)
     deck_search: DeckSearch = db.relationship(
         "DeckSearch", uselist=False, cascade_backrefs=False
     )
+    profile: t.Optional[DeckSearchProfile] = db.relationship(
+        "DeckSearchProfile",
+        primaryjoin="DeckSearchProfile.id == foreign(WeightedDeckSearch.profile_id)",
+        uselist=False,
+        viewonly=True,
+    )
+
+    def get_play_counts(
+        self, deck_type: t.Optional[models_deck.DeckType] = None
+    ) -> pd.DataFrame:
+        """Gets a dataframe of the number of times each copy of each card is used
+        in decks in the deck search, of the deck type if given.
+
+        The default profile reads the playrate cache, or slices the playrate cube
+        for a deck type. Other profiles are computed from the deck store,
+        so that any window and restrictions load quickly."""
+        profile = self.profile
+        is_custom = self._is_custom()
+        archetype = None
+        if is_custom:
+            deck_type = deck_type or profile.deck_type
+            archetype = profile.archetype
+        if deck_type is None and not is_custom:
+            return df_types.sqlalchemy_objects_to_df(self.deck_search.cards)
+
+        maximum_age_days = self.deck_search.maximum_age_days
+        half_life_days = self.deck_search.half_life_days
+        cube = deck_store.get_playrate_cube()
+        if half_life_days is None and cube and cube.has_window(maximum_age_days):
+            return cube.get_play_counts(
+                maximum_age_days,
+                deck_types=None if deck_type is None else [deck_type],
+                archetypes=None if archetype is None else [archetype],
+            )
+        play_counts = deck_store.get_recent_play_counts(
+            maximum_age_days, deck_type, archetype, half_life_days
+        )
+        if play_counts is not None:
+            return play_counts.copy()
+        logging.warning(
+            f"No deck store for {self.name}. Using the unrestricted playrate cache."
+        )
+        return df_types.sqlalchemy_objects_to_df(self.deck_search.cards)
+
+    def _is_custom(self) -> bool:
+        return self.profile is not None and self.profile.id != DEFAULT_PROFILE_ID
+
+    def reads_playrate_cache(self, deck_type: t.Optional[models_deck.DeckType]):
+        """If the play counts are the deck search's cached rows in the database."""
+        is_in_database = sqlalchemy.inspect(self).has_identity
+        return is_in_database and deck_type is None and not self._is_custom()
+
+
+def get_weighted_play_counts(
+    weighted_deck_searches: t.List[WeightedDeckSearch],
+    deck_type: t.Optional[models_deck.DeckType] = None,
+) -> pd.DataFrame:
+    """Gets the play counts of the weighted deck searches times their weights,
+    with a row per card copy per source, to be summed by the caller.
+
+    Deck searches reading the playrate cache are weighted and summed
+    in one query, without loading their rows as objects."""
+    cached = [
+        search
+        for search in weighted_deck_searches
+        if search.reads_playrate_cache(deck_type)
+    ]
+    play_count_dfs = []
+    if cached:
+        play_count_dfs.append(_get_cached_weighted_play_counts(cached))
+    for weighted_deck_search in weighted_deck_searches:
+        if weighted_deck_search not in cached:
+            play_count_df = weighted_deck_search.get_play_counts(deck_type)
+            if not play_count_df.empty:
+                play_count_df[PLAY_COUNT_NAME] = (
+                    play_count_df[PLAY_COUNT_NAME] * weighted_deck_search.weight
+                )
+                play_count_dfs.append(play_count_df)
+
+    if not play_count_dfs:
+        return pd.DataFrame(columns=PLAY_COUNT_COLUMN_NAMES, dtype=int)
+    return pd.concat(
+        [play_count_df[PLAY_COUNT_COLUMN_NAMES] for play_count_df in play_count_dfs],
+        ignore_index=True,
+    )
+
+
+def _get_cached_weighted_play_counts(
+    weighted_deck_searches: t.List[WeightedDeckSearch],
+) -> pd.DataFrame:
+    weights = collections.defaultdict(float)
+    for weighted_deck_search in weighted_deck_searches:
+        weights[weighted_deck_search.deck_search_id] += weighted_deck_search.weight
+
+    table = DeckSearchHasCard.__table__
+    weight = db.case(weights, value=table.c.decksearch_id)
+    query = (
+        db.select(
+            table.c.set_num,
+            table.c.card_num,
+            table.c.count_in_deck,
+            db.func.sum(table.c.num_decks_with_count_or_less * weight),
+        )
+        .where(table.c.decksearch_id.in_(list(weights)))
+        .group_by(table.c.set_num, table.c.card_num, table.c.count_in_deck)
+    )
+    rows = db.session.execute(query).fetchall()
+    return pd.DataFrame.from_records(rows, columns=PLAY_COUNT_COLUMN_NAMES).astype(
+        {PLAY_COUNT_NAME: float}
+    )
 
 
 def update_deck_searches():
-    """Update the playrate caches of all deck searches."""
+    """Update the playrate caches of the default profile's deck searches.
+    Other profiles use the deck store instead."""
     logging.info("Updating deck_searches")
-    weighted_deck_searches = WeightedDeckSearch.query.all()
-    for weighted in weighted_deck_searches:
-        logging.info(f"Updating playrate cache for {weighted.name}")
-        deck_search = weighted.deck_search
-        deck_search.update_playrates()
+    weighted_deck_searches = get_weighted_deck_searches()
+    deck_searches = list(
+        {
+            weighted.deck_search_id: weighted.deck_search
+            for weighted in weighted_deck_searches
+        }.values()
+    )
+    if deck_searches:
+        update_playrates(deck_searches)
+        deck_store.update_playrate_cube(
+            [
+                deck_search.maximum_age_days
+                for deck_search in deck_searches
+                if not deck_search.half_life_days
+            ]
+        )
+        deck_store.update_card_neighbours(
+            max(deck_search.maximum_age_days for deck_search in deck_searches)
+        )
 
 
 def make_weighted_deck_search(deck_search: DeckSearch, weight: float, name: str):
@@ -180,9 +775,8 @@ def make_weighted_deck_search(deck_search: DeckSearch, weight: float, name: str)
     return weighted_deck_search
 
 
-def get_weighted_deck_searches(profile=1):
-    """Generates the standard weighted deck searches,
-    and gives them the user_id."""
+def get_weighted_deck_searches(profile=DEFAULT_PROFILE_ID):
+    """Gets the weighted deck searches of the profile."""
 
     return WeightedDeckSearch.query.filter_by(profile_id=profile).all()
 
@@ -216,7 +810,13 @@ def create_weighted_deck_searches():
     db.session.commit()
 
 
+def create_default_profile():
+    db.session.merge(DeckSearchProfile(id=DEFAULT_PROFILE_ID, name="Default"))
+    db.session.commit()
+
+
 def setup():
     logging.info("Setting up deck searches")
+    create_default_profile()
     create_deck_searches()
     create_weighted_deck_searches()
@@ -2,6 +2,8 @@
 import logging
 import typing as t
 
+import numpy as np
+
 from infiltrate import db
 
 
@@ -29,6 +31,11 @@ class Rarity(db.Model):
         All numbers are correct for long term average."""
         return self.num_in_pack / sum([r.num_in_pack for r in RARITIES])
 
+    @property
+    def code(self) -> int:
+        """The rarity's position in RARITIES, for indexing arrays by rarity."""
+        return code_from_name[self.name]
+
     def __repr__(self):
         return f"<Rarity {self.name}>"
 
@@ -76,6 +83,11 @@ LEGENDARY = Rarity(
 RARITIES: t.List[Rarity] = [COMMON, UNCOMMON, RARE, LEGENDARY, PROMO]
 
 rarity_from_name = {r.name: r for r in RARITIES}
+code_from_name = {r.name: code for code, r in enumerate(RARITIES)}
+
+# Rarity attributes indexed by rarity code, for looking up whole columns of codes.
+ENCHANTS = np.array([r.enchant for r in RARITIES])
+DISENCHANTS = np.array([r.disenchant for r in RARITIES])
 
 
 def create_rarities():
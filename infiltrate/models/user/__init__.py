@@ -21,6 +21,12 @@ class User(db.Model, UserMixin):
         ),
     )
     password = db.Column("password", db.String())
+    deck_search_profile_id = db.Column(
+        "deck_search_profile_id",
+        db.Integer(),
+        db.ForeignKey("deck_search_profiles.id"),
+        nullable=True,
+    )
 
 
 def get_by_id(user_id: int) -> User:
@@ -8,6 +8,7 @@ import pandas as pd
 
 import infiltrate.card_evaluation as card_evaluation
 import infiltrate.dwd_news as dwd_news
+import infiltrate.instrumentation as instrumentation
 import infiltrate.models.card.draft as card_draft
 import infiltrate.models.card_set as models_card_set
 import infiltrate.models.rarity as rarity
@@ -17,6 +18,16 @@ from infiltrate.models.user import User
 
 PurchaseRow = t.Tuple[str, str, str, int, float, float]
 
+# The card data columns purchase evaluators use, besides the card copy keys.
+CARD_DATA_COLUMN_NAMES = [
+    card_evaluation.CardValuePipeline.RARITY_NAME,
+    card_evaluation.CardValuePipeline.PLAY_VALUE_NAME,
+    card_evaluation.CardValuePipeline.IS_OWNED_NAME,
+    card_evaluation.CardValuePipeline.RESELL_VALUE_NAME,
+    card_evaluation.CardValuePipeline.OWN_VALUE_NAME,
+    card_evaluation.CardValuePipeline.IS_IN_DRAFT_PACK_NAME,
+]
+
 
 class PurchaseEvaluator(abc.ABC):
     """ABC for evaluable purchase types"""
@@ -541,6 +552,10 @@ def get_league_packs() -> t.Dict[models_card_set.CardSet, int]:
     return packs
 
 
+@instrumentation.measured(
+    count_rows_in=lambda own_values, *args, **kwargs: len(own_values),
+    count_rows_out=lambda result, *args, **kwargs: len(result),
+)
 def get_purchase_values(own_values: card_evaluation.OwnValueFrame, user: User):
     getter = _PurchasesValueDataframeGetter(own_values, user)
     return getter.get_purchase_values()
@@ -569,7 +584,12 @@ class _PurchasesValueDataframeGetter:
         columns = ["type", "name", "info_url", "gold_cost", "value", "value_per_gold"]
         df_constructor = []
         for purchase_evaluator in self.purchase_evaluators:
-            df_constructor += purchase_evaluator.get_df_rows()
+            with instrumentation.measure(
+                type(purchase_evaluator).__name__, rows_in=len(self.card_data)
+            ) as measurement:
+                rows = purchase_evaluator.get_df_rows()
+                measurement.rows_out = len(rows)
+            df_constructor += rows
 
         values_df = pd.DataFrame(df_constructor, columns=columns)
         return values_df
@@ -4,7 +4,6 @@ import typing as t
 
 import numpy as np
 
-import infiltrate.caches as caches
 import infiltrate.models.card as card
 import infiltrate.models.card_set as card_sets
 import infiltrate.models.rarity as rarities
@@ -85,7 +84,8 @@ def _get_value_for_set_and_rarity(
 ) -> float:
     cards_in_set_and_rarity = card_data[
         np.logical_and(
-            card_data["set_num"] == card_set.set_num, card_data["rarity"] == rarity,
+            card_data["set_num"] == card_set.set_num,
+            card_data["rarity"] == rarity.code,
         )
     ]
 
@@ -93,6 +93,11 @@ def _get_value_for_set_and_rarity(
     return value
 
 
+def clear_cached_values():
+    """Forgets the values of sets and rarities, which are cached by user."""
+    _get_value_for_set_and_rarity.cache_clear()
+
+
 def get_value(card_pool):  # called many times and slow
     is_owned = card_pool["is_owned"] == True
     unowned_cards = card_pool[~is_owned]
@@ -148,7 +153,7 @@ class DraftPackCardClass(CardClass):
         cards_in_draft_pack_and_rarity = card_data[
             np.logical_and(
                 card_data["is_in_draft_pack"] == True,
-                card_data["rarity"] == self.rarity,
+                card_data["rarity"] == self.rarity.code,
             )
         ]
         value = get_value(cards_in_draft_pack_and_rarity)
@@ -211,6 +216,8 @@ class PlayerRewards:  # TODO Make into model to persist
             self.get_card_classes_with_amounts_per_week()
         )
 
+        self._findabilities: t.Optional[np.ndarray] = None
+
     def get_rewards_per_week(self):
         """Get the rewards the player will find in a week on avg."""
         rewards_with_rates = [
@@ -261,24 +268,62 @@ class PlayerRewards:  # TODO Make into model to persist
 
         return card_classes_with_amounts_per_week
 
-    @caches.mem_cache.cache(f"player_rewards_findabilities", expires=120)
-    def get_chance_of_specific_card_drop_in_a_week(
-        self, rarity: rarities.Rarity, card_set: card_sets.CardSet
-    ):
-        chances = []
-        for card_class_with_amount in self.card_classes_with_amounts_per_week:
-            rarity_match = rarity == card_class_with_amount.card_class.rarity
+    @property
+    def findabilities(self) -> np.ndarray:
+        """The chance of finding a specific card in a week,
+        indexed by set number then rarity code.
+
+        Built on first use, as it counts the cards in each card class."""
+        if self._findabilities is None:
+            self._findabilities = self._make_findabilities()
+        return self._findabilities
+
+    def _make_findabilities(self) -> np.ndarray:
+        card_classes = [
+            card_class_with_amount.card_class
+            for card_class_with_amount in self.card_classes_with_amounts_per_week
+        ]
+        max_set_num = max(
+            [
+                set_num
+                for card_class in card_classes
+                for set_num in card_sets.get_set_nums_from_sets(card_class.sets)
+            ],
+            default=1,
+        )
+        chances_of_none = np.ones((max_set_num + 1, len(rarities.RARITIES)))
 
-            set_nums = card_sets.get_set_nums_from_sets(
-                card_class_with_amount.card_class.sets
-            )
+        for card_class_with_amount in self.card_classes_with_amounts_per_week:
+            card_class = card_class_with_amount.card_class
+            if card_class.num_cards == 0:
+                continue
+            chance = card_class_with_amount.chance_of_specific_card_drop_per_week
+            set_nums = set(card_sets.get_set_nums_from_sets(card_class.sets))
+            for set_num in set_nums:
+                chances_of_none[set_num, card_class.rarity.code] *= 1 - chance
+
+        # Set 0 is treated as part of set 1
+        chances_of_none[0] = chances_of_none[1]
+        chances_of_at_least_one = 1 - chances_of_none
+        return chances_of_at_least_one
+
+    def get_findabilities(self, set_nums, rarity_codes) -> np.ndarray:
+        """The chance of finding each specific card in a week,
+        for arrays of card set numbers and rarity codes."""
+        findabilities = self.findabilities
+        set_nums = np.asarray(set_nums)
+        is_droppable_set = set_nums < len(findabilities)
+        droppable_set_nums = np.where(is_droppable_set, set_nums, 0)
+        chances = findabilities[droppable_set_nums, np.asarray(rarity_codes)]
+        return np.where(is_droppable_set, chances, 0)
 
-            set_match = card_set.set_num in set_nums
-            if rarity_match and set_match:
-                chance = card_class_with_amount.chance_of_specific_card_drop_per_week
-                chances.append(chance)
-        chance_of_at_least_one = get_chance_of_at_least_one(chances)
-        return chance_of_at_least_one
+    def get_chance_of_specific_card_drop_in_a_week(
+        self, rarity: rarities.Rarity, card_set: card_sets.CardSet
+    ) -> float:
+        chance = self.get_findabilities(
+            set_nums=[card_set.set_num], rarity_codes=[rarity.code]
+        )[0]
+        return float(chance)
 
 
 def get_chance_of_at_least_one(probabilities):
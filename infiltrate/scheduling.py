@@ -2,24 +2,61 @@
 
 import atexit
 import logging
+import threading
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
+import infiltrate.caches as caches
+import infiltrate.card_evaluation as card_evaluation
+import infiltrate.deck_store as deck_store
 import infiltrate.models.card as card
 import infiltrate.models.card_set as card_set
 import infiltrate.models.deck as deck
 import infiltrate.models.deck_search as deck_search
 import infiltrate.models.rarity as rarity
+from infiltrate import application
 from infiltrate.models import chapter
 
+
+def update_deck_searches_and_card_values():
+    """Card values depend on deck searches, so are refreshed after them."""
+    deck_store.update()
+    deck_search.update_deck_searches()
+    card_evaluation.update_play_craft_efficiencies()
+
+
 UPDATES_TO_INTERVALS = {
     card.update_cards: 3,
     card_set.update: 3,
     deck.update_decks: 3,
-    deck_search.update_deck_searches: 3,
+    update_deck_searches_and_card_values: 1,
     chapter.update: 3,
 }
 
+_deck_backfill_lock = threading.Lock()
+
+
+def start_deck_backfill() -> bool:
+    """Starts continuing the deck backfill on a background thread,
+    unless it is already running. Returns whether it was started.
+
+    The backfill checkpoints as it goes, so is resumed if the process stops."""
+    if not _deck_backfill_lock.acquire(blocking=False):
+        return False
+
+    def backfill():
+        try:
+            with application.app_context():
+                deck.backfill_decks()
+                caches.invalidate()
+        except Exception:
+            logging.exception("Deck backfill stopped")
+        finally:
+            _deck_backfill_lock.release()
+
+    threading.Thread(target=backfill, name="deck_backfill", daemon=True).start()
+    return True
+
 
 def initial_update():
     logging.info("Performing initial updates")
@@ -53,5 +90,5 @@ if __name__ == "__main__":
     card.update_cards()
     card_set.update()
     deck.update_decks()
-    deck_search.update_deck_searches()
+    update_deck_searches_and_card_values()
     chapter.update()
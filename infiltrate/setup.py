@@ -19,6 +19,14 @@ def _set_config(app):
             raise ValueError(f"{var} missing from environment.")
         app.config[var] = value
 
+    optional_variables = {
+        # Concurrent fetches and requests per second when ingesting decks.
+        "DECK_FETCH_WORKERS": "8",
+        "DECK_FETCH_RATE": "10",
+    }
+    for var, default in optional_variables.items():
+        app.config[var] = os.environ.get(var, default)
+
 
 def _setup_db(app):
     logging.info("Setting up database")
@@ -1,15 +1,23 @@
 """This is where the routes are defined."""
-import functools
+import collections
+import threading
 import typing as t
 
 import numpy as np
 import pandas as pd
+import werkzeug.local
 
 import infiltrate.global_data as global_data
 import infiltrate.models.card as card
-from infiltrate.card_evaluation import OwnValueFrame
+import infiltrate.rewards as rewards
+from infiltrate.card_evaluation import (
+    CardValuePipeline,
+    OwnValueFrame,
+    UserCardValues,
+)
 from infiltrate.card_frame_bases import CardDetails
-from infiltrate.models.user import User
+from infiltrate.models.deck import DeckType
+from infiltrate.models.user import User, collection
 from infiltrate.views.card_values import display_filters
 
 
@@ -21,6 +29,31 @@ class CardDisplays:
 
     CARDS_PER_PAGE = 24
 
+    # Used for filtering, sorting and searching. Urls are joined to the page.
+    COLUMN_NAMES = [
+        CardValuePipeline.RARITY_NAME,
+        CardValuePipeline.PLAY_VALUE_NAME,
+        CardValuePipeline.CRAFT_COST_NAME,
+        CardValuePipeline.FINDABILITY_NAME,
+        CardValuePipeline.PLAY_CRAFT_EFFICIENCY_NAME,
+        CardValuePipeline.IS_OWNED_NAME,
+        CardValuePipeline.OWN_VALUE_NAME,
+        CardValuePipeline.FIT_PLAY_VALUE_NAME,
+        "name",
+        "is_in_expedition",
+    ]
+    PAGE_DETAIL_NAMES = [
+        CardValuePipeline.IMAGE_URL_NAME,
+        CardValuePipeline.DETAILS_URL_NAME,
+    ]
+    MAX_CACHED_USER_CARD_VALUES = 50
+
+    # Keyed by user, card details and deck type. Least recently used first.
+    _user_card_values: "collections.OrderedDict[t.Tuple, UserCardValues]" = (
+        collections.OrderedDict()
+    )
+    _user_card_values_lock = threading.Lock()
+
     def __init__(self, value_info: OwnValueFrame):
         self.value_info = value_info
 
@@ -29,9 +62,15 @@ class CardDisplays:
 
     @classmethod
     def make_for_user(
-        cls, user: User, card_details: CardDetails = None
+        cls,
+        user: User,
+        card_details: CardDetails = None,
+        num_options_considered=20,
+        deck_type: t.Optional[DeckType] = None,
     ) -> "CardDisplays":
-        own_value = cls.make_own_value_frame_for_user(user, card_details)
+        own_value = cls.make_own_value_frame_for_user(
+            user, card_details, num_options_considered, deck_type
+        )
 
         # The frame is cached and could be modified if not copied
         own_value = own_value.copy()
@@ -39,15 +78,101 @@ class CardDisplays:
         return cls(own_value)
 
     @classmethod
-    @functools.lru_cache(maxsize=50)
     def make_own_value_frame_for_user(
-        cls, user: User, card_details: CardDetails = None
-    ):
-        """Makes the cards for a user, cached for immediate reuse."""
+        cls,
+        user: User,
+        card_details: CardDetails = None,
+        num_options_considered=20,
+        deck_type: t.Optional[DeckType] = None,
+    ) -> OwnValueFrame:
+        """Makes the cards for a user, from their cached values."""
+        user_card_values = cls.get_user_card_values(user, card_details, deck_type)
+        user_card_values.set_num_options_considered(num_options_considered)
+        return user_card_values.own_value_frame
+
+    @classmethod
+    def get_user_card_values(
+        cls,
+        user: User,
+        card_details: CardDetails = None,
+        deck_type: t.Optional[DeckType] = None,
+    ) -> UserCardValues:
+        """Makes the card values for a user, cached for immediate reuse.
+
+        The defaults are filled in before caching,
+        so every way of passing the same arguments shares one entry.
+        Anonymous users are a new object each request, so are not cached."""
+        if isinstance(user, werkzeug.local.LocalProxy):
+            user = user._get_current_object()
         if card_details is None:
             card_details = global_data.all_cards
-        own_value = OwnValueFrame.from_user(user, card_details)
-        return own_value
+        if not user.is_authenticated:
+            return UserCardValues.from_user(
+                user, card_details, column_names=cls.COLUMN_NAMES, deck_type=deck_type
+            )
+        key = (user, card_details, deck_type)
+        with cls._user_card_values_lock:
+            user_card_values = cls._user_card_values.get(key)
+            if user_card_values is not None:
+                cls._user_card_values.move_to_end(key)
+                return user_card_values
+
+        user_card_values = UserCardValues.from_user(
+            user, card_details, column_names=cls.COLUMN_NAMES, deck_type=deck_type
+        )
+        with cls._user_card_values_lock:
+            cls._user_card_values[key] = user_card_values
+            while len(cls._user_card_values) > cls.MAX_CACHED_USER_CARD_VALUES:
+                cls._user_card_values.popitem(last=False)
+        return user_card_values
+
+    @classmethod
+    def clear_cached_user_card_values(cls):
+        with cls._user_card_values_lock:
+            cls._user_card_values.clear()
+
+    @classmethod
+    def update_collection(cls, user: User):
+        """Updates the user's cached card values for their current collection.
+
+        Values which aren't cached are left to be made from the new collection."""
+        if isinstance(user, werkzeug.local.LocalProxy):
+            user = user._get_current_object()
+        with cls._user_card_values_lock:
+            users_card_values = [
+                user_card_values
+                for key, user_card_values in cls._user_card_values.items()
+                if key[0] == user
+            ]
+        if users_card_values:
+            card_counts = collection.get_collection_from_ew(user)
+            for user_card_values in users_card_values:
+                user_card_values.update_collection(card_counts)
+        # Set values are cached by user, so are stale after their collection changes.
+        rewards.clear_cached_values()
+
+    @staticmethod
+    def add_card_details(
+        cards: pd.DataFrame,
+        column_names: t.List[str] = None,
+        card_details: CardDetails = None,
+    ) -> pd.DataFrame:
+        """Joins card details, by default the urls, to cards about to be rendered."""
+        if column_names is None:
+            column_names = CardDisplays.PAGE_DETAIL_NAMES
+        if card_details is None:
+            card_details = global_data.all_cards
+        rows = card_details.index.get_indexer(
+            pd.MultiIndex.from_arrays(
+                [
+                    cards[OwnValueFrame.SET_NUM_NAME].values,
+                    cards[OwnValueFrame.CARD_NUM_NAME].values,
+                ]
+            )
+        )
+        for name in column_names:
+            cards[name] = card_details[name].values[rows]
+        return cards
 
     @property
     def sort_method(self) -> t.Optional[display_filters.CardDisplaySort]:
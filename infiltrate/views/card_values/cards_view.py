@@ -6,6 +6,7 @@ import numpy as np
 from flask_classful import FlaskView
 
 import infiltrate.models.card.completion as completion
+import infiltrate.models.deck as models_deck
 import infiltrate.views.card_values.card_displays as card_displays
 import infiltrate.views.card_values.display_filters as display_filters
 
@@ -14,6 +15,8 @@ class CardsView(FlaskView):
     """View for the list of card values"""
 
     route_base = "/"
+    DEFAULT_NUM_OPTIONS_CONSIDERED = 20
+    MAX_NUM_OPTIONS_CONSIDERED = 200
 
     def index(self):
         """The main card values page"""
@@ -28,6 +31,7 @@ class CardsView(FlaskView):
 
         page_num = int(page_num)
         page_num, cards_on_page = displays.get_page(page_num)
+        cards_on_page = displays.add_card_details(cards_on_page)
 
         scaled = (np.log2(cards_on_page["play_craft_efficiency"] * 100) * 15).clip(
             lower=0
@@ -51,6 +55,7 @@ class CardsView(FlaskView):
         search_str = flask.request.args.get("search_str")
         search_str = search_str.lower()
         cards_on_page = completion.get_matching_card(displays.value_info, search_str)
+        cards_on_page = displays.add_card_details(cards_on_page)
 
         scaled = (np.log2(cards_on_page["play_craft_efficiency"] * 100) * 15).clip(
             lower=0
@@ -77,6 +82,23 @@ class CardsView(FlaskView):
             sort_str = "craft"
         return sort_str
 
+    @classmethod
+    def _get_num_options_considered(cls) -> int:
+        """The number of crafting options averaged to value shiftstone."""
+        num_options_str = flask.request.args.get("num_options_considered")
+        try:
+            num_options = int(num_options_str)
+        except (TypeError, ValueError):
+            return cls.DEFAULT_NUM_OPTIONS_CONSIDERED
+        return min(max(1, num_options), cls.MAX_NUM_OPTIONS_CONSIDERED)
+
+    @staticmethod
+    def _get_deck_type() -> t.Optional[models_deck.DeckType]:
+        """Expedition players see values from only expedition decks."""
+        if flask.request.args.get("only_expedition") == "true":
+            return models_deck.DeckType.expedition
+        return None
+
     def _get_sort(self):
         sort_str = self._get_sort_str()
         return display_filters.get_sort(sort_str)
@@ -119,7 +141,11 @@ class CardsView(FlaskView):
         if filters is None:
             filters = []
 
-        displays = card_displays.CardDisplays.make_for_user(flask_login.current_user)
+        displays = card_displays.CardDisplays.make_for_user(
+            flask_login.current_user,
+            num_options_considered=self._get_num_options_considered(),
+            deck_type=self._get_deck_type(),
+        )
 
         for _filter in filters:
             displays.filter(_filter)
@@ -108,13 +108,35 @@ class ValueSort(CardDisplaySort):
         return cards
 
 
+class FitSort(CardDisplaySort):
+    """Sorts cards to show value boosted by fit with the user's collection."""
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def sort(cards):
+        """Sorts cards from highest to lowest collection fit value."""
+        cards.index.names = [name + "_index" for name in cards.index.names]
+        sorted_df = cards.sort_values(
+            by=[OwnValueFrame.FIT_PLAY_VALUE_NAME, OwnValueFrame.COUNT_IN_DECK_NAME],
+            ascending=[False, True],
+        )
+        return OwnValueFrame(cards.user, sorted_df)
+
+
 EFFICIENCY_SORT = "efficiency"
 VALUE_SORT = "value"
+FIT_SORT = "fit"
 
 
 def get_sort(sort_str):
     """Get an OwnershipFilter from its id string."""
-    sort_str_to_sort = {EFFICIENCY_SORT: CraftSort, VALUE_SORT: ValueSort}
+    sort_str_to_sort = {
+        EFFICIENCY_SORT: CraftSort,
+        VALUE_SORT: ValueSort,
+        FIT_SORT: FitSort,
+    }
 
     sort = sort_str_to_sort.get(sort_str, None)
     if sort is None:
@@ -144,10 +166,10 @@ class RarityFilter(OwnershipFilter):
     """Excludes the given rarity."""
 
     def __init__(self, rarity_name: str):
-        self.rarity = rarity_mod.rarity_from_name[rarity_name]
+        self.rarity_code = rarity_mod.code_from_name[rarity_name]
 
     def filter(self, cards):
-        filtered_df = cards[cards["rarity"] != self.rarity]
+        filtered_df = cards[cards["rarity"] != self.rarity_code]
         return OwnValueFrame(cards.user, filtered_df)
 
 
@@ -0,0 +1,134 @@
+"""Routes for users to define how their card values weigh decks."""
+import math
+import typing as t
+
+import flask
+import flask_login
+from flask_classful import FlaskView, route
+
+import infiltrate.card_evaluation as card_evaluation
+import infiltrate.models.deck as models_deck
+import infiltrate.models.deck_search as deck_search
+import infiltrate.views.card_values.card_displays as card_displays
+from infiltrate import db
+from infiltrate.models.user import get_by_id
+
+# Longer windows overflow datetime arithmetic, and each window is a deck search.
+MAX_WINDOW_DAYS = 3650
+MAX_WINDOWS = 10
+
+
+# noinspection PyMethodMayBeStatic
+class DeckSearchProfilesView(FlaskView):
+    """View for a user to create and choose deck search profiles."""
+
+    decorators = [flask_login.login_required]
+
+    def index(self):
+        """The default profile and the user's profiles, and which is selected."""
+        user = flask_login.current_user
+        profiles = deck_search.DeckSearchProfile.query.filter(
+            db.or_(
+                deck_search.DeckSearchProfile.id == deck_search.DEFAULT_PROFILE_ID,
+                deck_search.DeckSearchProfile.user_id == user.id,
+            )
+        )
+        return flask.jsonify(
+            {
+                "selected": user.deck_search_profile_id
+                or deck_search.DEFAULT_PROFILE_ID,
+                "profiles": [profile.to_dict() for profile in profiles],
+            }
+        )
+
+    def post(self):
+        """Creates a profile from a json body with a name, windows mapping
+        maximum_age_days to weights, and an optional deck_type, archetype
+        and half_life_days, then selects it.
+
+        Takes at most MAX_WINDOWS windows of at most MAX_WINDOW_DAYS."""
+        body = flask.request.get_json(silent=True) or {}
+        try:
+            windows = {
+                int(maximum_age_days): float(weight)
+                for maximum_age_days, weight in body["windows"].items()
+            }
+            name = str(body.get("name", "Custom"))[:40]
+            deck_type = _get_enum_member(models_deck.DeckType, body.get("deck_type"))
+            archetype = _get_enum_member(models_deck.Archetype, body.get("archetype"))
+            half_life_days = body.get("half_life_days")
+            if half_life_days is not None:
+                half_life_days = float(half_life_days)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            flask.abort(400)
+        if (
+            not windows
+            or len(windows) > MAX_WINDOWS
+            or min(windows) <= 0
+            or max(windows) > MAX_WINDOW_DAYS
+            or not all(math.isfinite(weight) for weight in windows.values())
+            or min(windows.values()) < 0
+            or sum(windows.values()) <= 0
+            or (
+                half_life_days is not None
+                and not (math.isfinite(half_life_days) and half_life_days > 0)
+            )
+        ):
+            flask.abort(400)
+
+        user = flask_login.current_user
+        profile = deck_search.DeckSearchProfile.create(
+            user_id=user.id,
+            name=name,
+            windows=windows,
+            deck_type=deck_type,
+            archetype=archetype,
+            half_life_days=half_life_days,
+        )
+        _select_profile(profile.id)
+        return flask.jsonify(profile.to_dict())
+
+    @route("/select/<int:profile_id>", methods=["POST"])
+    def select(self, profile_id: int):
+        if profile_id != deck_search.DEFAULT_PROFILE_ID:
+            _get_own_profile(profile_id)
+        _select_profile(profile_id)
+        return ""
+
+    @route("/<int:profile_id>", methods=["DELETE"])
+    def delete(self, profile_id: int):
+        profile = _get_own_profile(profile_id)
+        if flask_login.current_user.deck_search_profile_id == profile_id:
+            _select_profile(None)
+        db.session.delete(profile)
+        db.session.commit()
+        card_evaluation.CardValuePipeline.get_shared_for_profile.cache_clear()
+        return ""
+
+
+def _get_enum_member(enum_type, name: t.Optional[str]):
+    """The member of the enum with the name, or None for no name."""
+    if name is None:
+        return None
+    try:
+        return enum_type[name]
+    except KeyError:
+        raise ValueError(f"Unknown {enum_type.__name__} {name}")
+
+
+def _get_own_profile(profile_id: int) -> deck_search.DeckSearchProfile:
+    profile = deck_search.DeckSearchProfile.query.get(profile_id)
+    if profile is None or profile.user_id != flask_login.current_user.id:
+        flask.abort(404)
+    return profile
+
+
+def _select_profile(profile_id: t.Optional[int]):
+    """Saves the user's profile, and drops card values made with their old one."""
+    user = flask_login.current_user
+    user_model = get_by_id(user.id)
+    user_model.deck_search_profile_id = profile_id
+    db.session.commit()
+    # Users are cached between requests, so the cached user is updated too.
+    user.deck_search_profile_id = profile_id
+    card_displays.CardDisplays.clear_cached_user_card_values()
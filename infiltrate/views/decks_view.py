@@ -0,0 +1,30 @@
+import flask
+import flask_classful
+import flask_login
+
+import infiltrate.deck_completion as deck_completion
+import infiltrate.global_data as global_data
+import infiltrate.models.deck as models_deck
+from infiltrate.models.user import collection
+
+
+class DecksView(flask_classful.FlaskView):
+    """View for the recent decks closest to completion from the user's collection."""
+
+    route_base = "/decks"
+
+    def index(self):
+        """The main decks page"""
+        return flask.render_template("deck_completion/main.html")
+
+    def completion(self, only_expedition="false"):
+        """A table loaded into the decks page."""
+        deck_type = (
+            models_deck.DeckType.expedition if only_expedition == "true" else None
+        )
+        decks = deck_completion.get_cheapest_decks(
+            card_counts=collection.get_collection_from_ew(flask_login.current_user),
+            card_details=global_data.all_cards,
+            deck_type=deck_type,
+        )
+        return flask.render_template("deck_completion/table.html", decks=decks)
@@ -0,0 +1,43 @@
+"""Private API to see where time goes in card evaluation while the site is live."""
+import flask
+from flask_classful import FlaskView
+
+import infiltrate.instrumentation as instrumentation
+from infiltrate import application
+
+NO_KEY_GIVEN = "no_key_given"
+
+
+# noinspection PyMethodMayBeStatic
+class InstrumentationAPI(FlaskView):
+    """View for the stats of measured evaluation steps"""
+
+    route_base = "/secret_instrumentation"
+    key = application.config["UPDATE_KEY"]
+
+    def is_bad_key(self, key):
+        return key != self.key
+
+    def stats(self, key=NO_KEY_GIVEN):
+        if self.is_bad_key(key):
+            return "Bad Key"
+        return flask.jsonify(instrumentation.REGISTRY.get_stats())
+
+    def clear(self, key=NO_KEY_GIVEN):
+        """Clears the stats, such as after a data update to compare against."""
+        if self.is_bad_key(key):
+            return "Bad Key"
+        instrumentation.REGISTRY.clear()
+        return "Cleared Stats"
+
+    def start_tracing_memory(self, key=NO_KEY_GIVEN):
+        if self.is_bad_key(key):
+            return "Bad Key"
+        instrumentation.start_tracing_memory()
+        return "Started Tracing Memory"
+
+    def stop_tracing_memory(self, key=NO_KEY_GIVEN):
+        if self.is_bad_key(key):
+            return "Bad Key"
+        instrumentation.stop_tracing_memory()
+        return "Stopped Tracing Memory"
@@ -23,7 +23,9 @@ class PurchasesView(flask_classful.FlaskView):
         purchase_values = purchases.get_purchase_values(
             user=flask_login.current_user,
             own_values=card_evaluation.OwnValueFrame.from_user(
-                user=flask_login.current_user, card_details=global_data.all_cards
+                user=flask_login.current_user,
+                card_details=global_data.all_cards,
+                column_names=purchases.CARD_DATA_COLUMN_NAMES,
             ),
         )
         purchase_values = purchase_values.query("value > 0")
@@ -2,6 +2,8 @@ import flask
 import flask_login
 from flask_classful import FlaskView
 
+import infiltrate.models.rarity as rarities
+from infiltrate.card_evaluation import CardValuePipeline
 from infiltrate.views.card_values.card_displays import CardDisplays
 
 
@@ -9,9 +11,35 @@ from infiltrate.views.card_values.card_displays import CardDisplays
 class RawDataView(FlaskView):
     """View to supply raw data files."""
 
+    CARD_EVALUATION_COLUMN_NAMES = [
+        "name",
+        CardValuePipeline.RARITY_NAME,
+        CardValuePipeline.PLAY_COUNT_NAME,
+        CardValuePipeline.PLAY_RATE_NAME,
+        CardValuePipeline.PLAY_VALUE_NAME,
+        CardValuePipeline.CRAFT_COST_NAME,
+        CardValuePipeline.FINDABILITY_NAME,
+        CardValuePipeline.PLAY_CRAFT_EFFICIENCY_NAME,
+        CardValuePipeline.IS_OWNED_NAME,
+        CardValuePipeline.SELL_COST_NAME,
+        CardValuePipeline.RESELL_VALUE_NAME,
+        CardValuePipeline.OWN_VALUE_NAME,
+    ]
+
     def card_evaluation(self):
-        card_displays = CardDisplays.make_for_user(flask_login.current_user)
-        value_frame = card_displays.value_info
+        user_card_values = CardDisplays.get_user_card_values(flask_login.current_user)
+        value_frame = user_card_values.make_own_value_frame(
+            self.CARD_EVALUATION_COLUMN_NAMES
+        )
+        # Rarities are stored as codes, but the csv is for people.
+        value_frame = value_frame.assign(
+            **{
+                CardValuePipeline.RARITY_NAME: [
+                    rarities.RARITIES[code].name
+                    for code in value_frame[CardValuePipeline.RARITY_NAME]
+                ]
+            }
+        )
         csv = value_frame.to_csv()
 
         response = flask.make_response(csv, 200)
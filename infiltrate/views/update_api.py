@@ -5,7 +5,7 @@ from flask_classful import FlaskView
 import infiltrate.caches as caches
 import infiltrate.models.card as card
 import infiltrate.models.deck as deck
-import infiltrate.models.deck_search as deck_search
+import infiltrate.scheduling as scheduling
 from infiltrate import application
 
 NO_KEY_GIVEN = "no_key_given"
@@ -45,8 +45,16 @@ class UpdateAPI(FlaskView):
         caches.invalidate()
         return "Updated Decks"
 
+    def backfill_decks(self, key=NO_KEY_GIVEN):
+        """Starts continuing the backfill of the last 90 days of decks
+        from its checkpoint, in the background, as it takes hours."""
+        self.refuse_bad_key(key)
+        if not scheduling.start_deck_backfill():
+            return "Deck Backfill Already Running"
+        return "Started Deck Backfill"
+
     def update_deck_searches(self, key=NO_KEY_GIVEN):
         self.refuse_bad_key(key)
-        deck_search.update_deck_searches()
+        scheduling.update_deck_searches_and_card_values()
         caches.invalidate()
         return "Updated Deck Searches"
@@ -6,6 +6,7 @@ import flask_login
 
 # noinspection PyMethodMayBeStatic
 import infiltrate.models.user
+import infiltrate.views.card_values.card_displays as card_displays
 
 
 class UpdateCollectionView(FlaskView):
@@ -23,6 +24,7 @@ class UpdateCollectionView(FlaskView):
             url = f"https://api.eternalwarcry.com/v1/useraccounts/updatecollection"
             data = {"key": user_model.ew_key, "cards": card_import}
             requests.post(url=url, data=data)
+            card_displays.CardDisplays.update_collection(user)
         except KeyError:
             pass
         return ""
@@ -1,12 +1,17 @@
-import pytest
+import flask_login
+import numpy as np
 import pandas as pd
+import pytest
+import werkzeug.local
 
 import infiltrate.card_frame_bases as card_frame_bases
+import infiltrate.deck_store as deck_store
 import infiltrate.models.card as card
 import infiltrate.models.deck as deck
 import infiltrate.models.rarity as rarity
 import infiltrate.card_evaluation as card_evaluation
 import infiltrate.models.deck_search as deck_search
+from infiltrate.models.user import User
 
 
 def test_card_copy_creates_index():
@@ -29,7 +34,7 @@ def test_card_details():
             {
                 "set_num": 0,
                 "card_num": 0,
-                "rarity": rarity.COMMON,
+                "rarity": rarity.COMMON.code,
                 "image_url": "image_url",
                 "details_url": "details_url",
                 "is_in_draft_pack": "is_in_draft_pack",
@@ -42,12 +47,34 @@ def test_card_details():
     assert len(sut.columns) == 6
 
 
-def test_play_count_frame_from_weighted_deck_searches():
-    sut = card_evaluation.PlayCountFrame.from_weighted_deck_searches(
+def test_pipeline_add_play_counts():
+    sut = card_evaluation.CardValuePipeline.from_card_details(
+        card_frame_bases.CardDetails(
+            [
+                {
+                    "set_num": 0,
+                    "card_num": 0,
+                    "rarity": rarity.COMMON.code,
+                    "image_url": "image_url",
+                    "details_url": "details_url",
+                    "is_in_draft_pack": "is_in_draft_pack",
+                },
+                {
+                    "set_num": 0,
+                    "card_num": 1,
+                    "rarity": rarity.LEGENDARY.code,
+                    "image_url": "image_url",
+                    "details_url": "details_url",
+                    "is_in_draft_pack": "is_in_draft_pack",
+                },
+            ]
+        )
+    )
+    sut.add_play_counts(
         weighted_deck_searches=[
             deck_search.WeightedDeckSearch(
                 deck_search_id=0,
-                user_id=0,
+                profile_id=0,
                 name="",
                 weight=1,
                 deck_search=deck_search.DeckSearch(
@@ -78,126 +105,330 @@ def test_play_count_frame_from_weighted_deck_searches():
                 ),
             )
         ],
-        card_details=card_frame_bases.CardDetails(
-            [
-                {
-                    "set_num": 0,
-                    "card_num": 0,
-                    "rarity": rarity.COMMON,
-                    "image_url": "image_url",
-                    "details_url": "details_url",
-                    "is_in_draft_pack": "is_in_draft_pack",
-                },
-                {
-                    "set_num": 0,
-                    "card_num": 1,
-                    "rarity": rarity.LEGENDARY,
-                    "image_url": "image_url",
-                    "details_url": "details_url",
-                    "is_in_draft_pack": "is_in_draft_pack",
-                },
-            ]
-        ),
     )
-    assert len(sut) == 3
-    # todo should probably assert entire output
+    assert len(sut.playsets) == 2
+    assert sut.derived_columns == [sut.PLAY_COUNT_NAME]
+    assert sut[sut.PLAY_COUNT_NAME].tolist() == [[2, 1, 0, 0], [1, 0, 0, 0]]
 
 
-def test_play_rate_frame_from_play_counts():
-    sut = card_evaluation.PlayRateFrame.from_play_counts(
-        play_count_frame=card_evaluation.PlayCountFrame(
-            {
-                "count_in_deck": [1, 2, 1],
-                "decksearch_id": [0, 0, 0],
-                "num_decks_with_count_or_less": [2, 1, 1],
-                "card_num": [0, 0, 1],
-                "details_url": ["details_url"] * 3,
-                "image_url": ["image_url"] * 3,
-                "is_in_draft_pack": [True] * 3,
-                "rarity": [rarity.COMMON, rarity.COMMON, rarity.LEGENDARY,],
-                "set_num": [0, 0, 0],
-            }
-        )
+def _make_playsets(**columns) -> card_frame_bases.CardPlaysets:
+    index = pd.MultiIndex.from_arrays([[0, 0], [0, 1]], names=["set_num", "card_num"])
+    card_columns = {
+        "details_url": np.array(["details_url"] * 2),
+        "image_url": np.array(["image_url"] * 2),
+        "is_in_draft_pack": np.array([True] * 2),
+        "rarity": np.array([rarity.COMMON.code, rarity.LEGENDARY.code]),
+        "num_decks_with_count_or_less": np.array([[2, 1, 0, 0], [1, 0, 0, 0]]),
+    }
+    card_columns.update(columns)
+    return card_frame_bases.CardPlaysets(index, card_columns)
+
+
+def test_card_playsets_to_frame():
+    sut = _make_playsets()
+
+    frame = sut.to_frame()
+
+    assert len(frame) == 8
+    assert frame["count_in_deck"].tolist() == [1, 2, 3, 4] * 2
+    assert frame["num_decks_with_count_or_less"].tolist() == [2, 1, 0, 0, 1, 0, 0, 0]
+    assert frame["rarity"].tolist() == [rarity.COMMON.code] * 4 + [
+        rarity.LEGENDARY.code
+    ] * 4
+
+
+def test_card_playsets_get_counts():
+    sut = _make_playsets()
+
+    counts = sut.get_counts({card.CardId(0, 1): 3, card.CardId(5, 5): 1})
+
+    assert counts.tolist() == [0, 3]
+
+
+def _make_pipeline(**columns) -> card_evaluation.CardValuePipeline:
+    return card_evaluation.CardValuePipeline(_make_playsets(**columns))
+
+
+def test_pipeline_add_play_rates():
+    sut = _make_pipeline()
+
+    sut.add_play_rates()
+
+    assert sut[sut.PLAY_RATE_NAME][0, 0] == 32.5
+    assert len(sut.playsets) == 2
+
+
+def test_pipeline_add_play_values():
+    sut = _make_pipeline()
+
+    sut.add_play_values()
+
+    assert sut[sut.PLAY_VALUE_NAME].tolist() == [[100, 50, 0, 0], [50, 0, 0, 0]]
+
+
+def test_pipeline_add_play_craft_efficiencies():
+    sut = _make_pipeline(play_value=np.array([[100, 50, 0, 0], [50, 0, 0, 0]]))
+
+    sut.add_play_craft_efficiencies()
+
+    assert sut.PLAY_CRAFT_EFFICIENCY_NAME in sut
+    assert sut[sut.CRAFT_COST_NAME].tolist() == [50, 3200]
+
+
+def test_pipeline_stage_requires_its_inputs():
+    sut = _make_pipeline()
+
+    with pytest.raises(ValueError):
+        sut.add_play_craft_efficiencies()
+
+
+def test_pipeline_branch_does_not_change_shared():
+    shared = _make_pipeline()
+    shared.add_play_values()
+
+    sut = shared.branch()
+    sut.add_ownership({card.CardId(0, 0): 1})
+
+    assert sut.IS_OWNED_NAME in sut
+    assert sut.IS_OWNED_NAME not in shared
+    assert sut[sut.PLAY_VALUE_NAME] is shared[shared.PLAY_VALUE_NAME]
+
+
+def test_pipeline_to_own_value_frame():
+    sut = _make_pipeline(
+        play_rate=np.array([[32.5, 16.25, 0, 0], [16.25, 0, 0, 0]]),
+        play_value=np.array([[100, 50, 0, 0], [50, 0, 0, 0]]),
+        craft_cost=np.array([50, 3200]),
+        findability=np.array([0.02623, 0]),
+        play_craft_efficiency=np.array([[1.94755, 0.97377, 0, 0], [0.01562, 0, 0, 0]]),
     )
-    _ = sut.play_count
-    assert len(sut) == 3
+    sut.add_play_craft_efficiency_ranks()
+    sut.add_ownership({card.CardId(0, 0): 1})
+    sut.add_own_values()
 
+    frame = sut.to_own_value_frame(User(id=0))
 
-def test_play_value_frame_from_play_rates():
-    sut = card_evaluation.PlayValueFrame.from_play_rates(
-        play_rate_frame=card_evaluation.PlayRateFrame(
-            {
-                "count_in_deck": [1, 2, 1],
-                "decksearch_id": [0, 0, 0],
-                "num_decks_with_count_or_less": [2, 1, 1],
-                "card_num": [0, 0, 1],
-                "details_url": ["details_url"] * 3,
-                "image_url": ["image_url"] * 3,
-                "is_in_draft_pack": [True] * 3,
-                "rarity": [rarity.COMMON, rarity.COMMON, rarity.LEGENDARY,],
-                "set_num": [0, 0, 0],
-                "play_rate": [16.25, 32.5, 16.25],
-            }
-        ),
-        ownership=pd.DataFrame(
-            {
-                "set_num": {0: 0, 1: 0,},
-                "card_num": {0: 0, 1: 1,},
-                "count": {0: 1, 1: 0},
-            }
-        ),
+    _ = frame.own_value
+    assert len(frame) == 8
+    assert frame.is_owned.tolist() == [True, False, False, False] + [False] * 4
+
+
+def test_own_value_frame_copy_does_not_share_data():
+    sut = _make_pipeline(
+        play_value=np.array([[100, 50, 0, 0], [50, 0, 0, 0]]),
+        play_craft_efficiency=np.array([[1.9, 0.9, 0, 0], [0.1, 0, 0, 0]]),
     )
+    sut.add_play_craft_efficiency_ranks()
+    sut.add_ownership({})
+    sut.add_own_values()
+    frame = sut.to_own_value_frame(User(id=0))
 
-    _ = sut.play_value
-    assert len(sut) == 3
+    copy = frame.copy()
+    copy["own_value"] = 0
 
-    # todo should probably assert entire output
+    assert copy.user is frame.user
+    assert frame.own_value.max() > 0
 
 
-def test_play_craft_efficency_from_play_value():
-    sut = card_evaluation.PlayCraftEfficiencyFrame.from_play_value(
-        card_evaluation.PlayValueFrame(
-            {
-                "count_in_deck": [1, 2, 1],
-                "decksearch_id": [0, 0, 0],
-                "num_decks_with_count_or_less": [2, 1, 1],
-                "card_num": [0, 0, 1],
-                "details_url": ["details_url"] * 3,
-                "image_url": ["image_url"] * 3,
-                "is_in_draft_pack": [True] * 3,
-                "rarity": [rarity.COMMON, rarity.COMMON, rarity.LEGENDARY,],
-                "set_num": [0, 0, 0],
-                "play_rate": [16.25, 32.5, 16.25],
-                "play_value": [100, 50, 50],
-                "is_owned": [True] * 3,
-            }
-        )
+def _make_top_craft_options(is_owned) -> card_evaluation.TopCraftOptions:
+    sut = _make_pipeline(
+        play_craft_efficiency=np.array([[4.0, 2.0, 0, 0], [3.0, 1.0, 0, 0]])
+    )
+    sut.add_play_craft_efficiency_ranks()
+    return card_evaluation.TopCraftOptions(
+        efficiencies=sut[sut.PLAY_CRAFT_EFFICIENCY_NAME],
+        ranks=sut[sut.PLAY_CRAFT_EFFICIENCY_RANK_NAME],
+        is_owned=np.array(is_owned),
+    )
+
+
+def test_top_craft_options_value_of_shiftstone():
+    sut = _make_top_craft_options([[True, False, False, False], [False] * 4])
+
+    assert sut.get_value_of_shiftstone(num_options_considered=2) == 2.5
+    assert sut.get_value_of_shiftstone(num_options_considered=4) == 1.5
+
+
+def test_top_craft_options_set_owned():
+    sut = _make_top_craft_options([[False] * 4, [False] * 4])
+
+    assert sut.set_owned(1, 1, is_owned=True, num_options_considered=2) is False
+    assert sut.set_owned(0, 0, is_owned=True, num_options_considered=2) is True
+    assert sut.set_owned(0, 0, is_owned=True, num_options_considered=2) is False
+    assert sut.get_value_of_shiftstone(num_options_considered=2) == 2.5
+
+    assert sut.set_owned(0, 0, is_owned=False, num_options_considered=2) is True
+    assert sut.get_value_of_shiftstone(num_options_considered=2) == 3.5
+
+
+def _make_owned_pipeline(card_counts) -> card_evaluation.CardValuePipeline:
+    sut = _make_pipeline(
+        play_value=np.array([[100, 50, 0, 0], [50, 0, 0, 0]]),
+        play_craft_efficiency=np.array([[4.0, 2.0, 0, 0], [3.0, 1.0, 0, 0]]),
+    )
+    sut.add_play_craft_efficiency_ranks()
+    sut.add_ownership(card_counts)
+    sut.add_own_values(num_options_considered=2)
+    return sut
+
+
+def test_pipeline_update_ownership():
+    old_card_counts = {card.CardId(0, 0): 1}
+    new_card_counts = {card.CardId(0, 0): 2, card.CardId(5, 5): 1}
+    sut = _make_owned_pipeline(old_card_counts)
+
+    flipped_positions, is_top_changed = sut.update_ownership(
+        old_card_counts, new_card_counts, num_options_considered=2
+    )
+
+    expected = _make_owned_pipeline(new_card_counts)
+    assert flipped_positions.tolist() == [1]
+    assert is_top_changed
+    assert sut[sut.IS_OWNED_NAME].tolist() == expected[sut.IS_OWNED_NAME].tolist()
+    assert sut[sut.OWN_VALUE_NAME].tolist() == expected[sut.OWN_VALUE_NAME].tolist()
+
+
+def _make_card_neighbours() -> deck_store.CardNeighbours:
+    # Card 2 is not in the pipeline.
+    return deck_store.CardNeighbours(
+        neighbour_indices=np.array([[1, 2], [0, 0], [0, 0]]),
+        rates=np.array([[0.5, 0.5], [1, 0], [0, 0]]),
+        set_nums=np.array([0, 0, 9]),
+        card_nums=np.array([0, 1, 9]),
     )
-    _ = sut.play_craft_efficiency
+
+
+def test_pipeline_add_collection_fit():
+    sut = _make_owned_pipeline({card.CardId(0, 0): 1})
+
+    sut.add_collection_fit(_make_card_neighbours())
+
+    assert sut[sut.COLLECTION_FIT_NAME].tolist() == [0, 1]
+    assert sut[sut.FIT_PLAY_VALUE_NAME].tolist() == [[100, 50, 0, 0], [75, 0, 0, 0]]
+
+
+def test_pipeline_update_ownership_updates_collection_fit():
+    old_card_counts = {card.CardId(0, 0): 1}
+    new_card_counts = {card.CardId(0, 1): 1}
+    sut = _make_owned_pipeline(old_card_counts)
+    sut.add_collection_fit(_make_card_neighbours())
+
+    sut.update_ownership(old_card_counts, new_card_counts, num_options_considered=2)
+
+    assert sut[sut.COLLECTION_FIT_NAME].tolist() == [0.5, 0]
+
+
+def test_user_card_values_update_collection_patches_frame():
+    old_card_counts = {card.CardId(0, 1): 1}
+    new_card_counts = {card.CardId(0, 0): 1}
+    user = User(id=0)
+    sut = card_evaluation.UserCardValues(
+        user, _make_owned_pipeline(old_card_counts), old_card_counts, 2
+    )
+    _ = sut.own_value_frame
+
+    sut.update_collection(new_card_counts)
+
+    expected = _make_owned_pipeline(new_card_counts).to_own_value_frame(user)
+    pd.testing.assert_frame_equal(sut.own_value_frame, expected)
+
+
+def test_user_card_values_from_anonymous_user(monkeypatch):
+    shared = _make_pipeline(
+        play_value=np.array([[100, 50, 0, 0], [50, 0, 0, 0]]),
+        play_craft_efficiency=np.array([[4.0, 2.0, 0, 0], [3.0, 1.0, 0, 0]]),
+    )
+    monkeypatch.setattr(
+        card_evaluation.CardValuePipeline,
+        "get_shared_for_profile",
+        staticmethod(lambda card_details, profile_id, deck_type: shared),
+    )
+    anonymous_user = flask_login.AnonymousUserMixin()
+
+    sut = card_evaluation.UserCardValues.from_user(
+        werkzeug.local.LocalProxy(lambda: anonymous_user),
+        card_details=None,
+        column_names=[card_evaluation.CardValuePipeline.OWN_VALUE_NAME],
+    )
+
+    assert sut.card_counts == {}
+    assert not sut.pipeline[sut.pipeline.IS_OWNED_NAME].any()
+    assert len(sut.own_value_frame) == 8
+
+
+def test_card_playsets_get_count_matrix():
+    sut = _make_playsets()
+
+    counts = sut.get_count_matrix(
+        [{card.CardId(0, 1): 3, card.CardId(5, 5): 1}, {}, {card.CardId(0, 0): 2}]
+    )
+
+    assert counts.tolist() == [[0, 3], [0, 0], [2, 0]]
+
+
+def test_batch_own_values_match_single_users():
+    card_counts_list = [{card.CardId(0, 0): 1}, {}, {card.CardId(0, 1): 4}]
+    pipeline = _make_owned_pipeline({})
+
+    sut = card_evaluation.BatchOwnValues.from_collections(
+        pipeline, card_counts_list, num_options_considered=2
+    )
+
     assert len(sut) == 3
+    for i, card_counts in enumerate(card_counts_list):
+        expected = _make_owned_pipeline(card_counts)
+        assert sut.is_owned[i].tolist() == expected[expected.IS_OWNED_NAME].tolist()
+        assert sut.own_value[i].tolist() == expected[expected.OWN_VALUE_NAME].tolist()
+
 
+def test_pipeline_evaluate_runs_only_needed_stages():
+    sut = _make_pipeline()
 
-def test_own_value_frame_from_play_craft_efficency():
-    sut = card_evaluation.OwnValueFrame.from_play_craft_efficiency(
-        card_evaluation.PlayCraftEfficiencyFrame(
+    sut.evaluate([card_evaluation.CardValuePipeline.PLAY_VALUE_NAME, "image_url"])
+
+    assert sut.derived_columns == [sut.PLAY_VALUE_NAME]
+
+
+def test_pipeline_evaluate_passes_stage_arguments():
+    sut = _make_pipeline()
+
+    sut.evaluate(
+        [card_evaluation.CardValuePipeline.OWN_VALUE_NAME],
+        card_counts={card.CardId(0, 0): 1},
+        num_options_considered=2,
+    )
+
+    assert sut.PLAY_RATE_NAME not in sut
+    assert sut[sut.IS_OWNED_NAME][0].tolist() == [True, False, False, False]
+    assert sut.OWN_VALUE_NAME in sut
+
+
+def test_pipeline_to_own_value_frame_joins_card_details():
+    sut = _make_owned_pipeline({})
+    card_details = card_frame_bases.CardDetails(
+        [
             {
-                "count_in_deck": [1, 2, 1],
-                "decksearch_id": [0, 0, 0],
-                "num_decks_with_count_or_less": [2, 1, 1],
-                "card_num": [0, 0, 1],
-                "details_url": ["details_url"] * 3,
-                "image_url": ["image_url"] * 3,
-                "is_in_draft_pack": [True] * 3,
-                "rarity": [rarity.COMMON, rarity.COMMON, rarity.LEGENDARY,],
-                "set_num": [0, 0, 0],
-                "play_rate": [16.25, 32.5, 16.25],
-                "play_value": [100, 50, 50],
-                "is_owned": [True] * 3,
-                "craft_cost": [50, 50, 3200],
-                "findability": [0.02623, 0.02623, 0],
-                "play_craft_efficiency": [1.94755, 0.97377, 0.01562],
+                "set_num": 0,
+                "card_num": card_num,
+                "name": name,
+                "rarity": rarity.COMMON.code,
+                "image_url": "image_url",
+                "details_url": "details_url",
+                "is_in_draft_pack": True,
             }
-        )
+            for card_num, name in [(1, "Second"), (0, "First")]
+        ]
     )
-    _ = sut.own_value
-    assert len(sut) == 3
+
+    frame = sut.to_own_value_frame(
+        User(id=0), [sut.OWN_VALUE_NAME, "name"], card_details
+    )
+
+    assert frame.columns.tolist() == [
+        "set_num",
+        "card_num",
+        "count_in_deck",
+        sut.OWN_VALUE_NAME,
+        "name",
+    ]
+    assert frame["name"].tolist() == ["First"] * 4 + ["Second"] * 4
@@ -1,5 +1,196 @@
-# from unittest import TestCase
-#
-#
-# class TestDeck(TestCase):
-#     pass
+import datetime
+
+import pytest
+from sqlalchemy.dialects import sqlite
+
+import infiltrate.models.deck as models_deck
+import infiltrate.models.deck_search as deck_search
+from infiltrate import application, db
+
+NOW = datetime.datetime.now().replace(microsecond=0)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """An empty in memory sqlite database in place of the app's."""
+    monkeypatch.setitem(application.config, "SQLALCHEMY_DATABASE_URI", "sqlite://")
+    with application.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        # Closing the only connection discards the in memory database.
+        db.engine.dispose()
+
+
+def _make_deck(deck_id, cards=None, days_old=1, views=10):
+    deck = models_deck.Deck(
+        id=deck_id,
+        archetype=models_deck.Archetype.aggro,
+        date_added=NOW - datetime.timedelta(days=days_old),
+        date_updated=NOW - datetime.timedelta(days=days_old),
+        deck_type=models_deck.DeckType.throne,
+        description="",
+        patch="1",
+        username="user",
+        views=views,
+        rating=0,
+    )
+    for (set_num, card_num), num_played in (cards or {(1, 1): 4}).items():
+        deck.cards.append(
+            models_deck.DeckHasCard(
+                deck_id=deck_id,
+                set_num=set_num,
+                card_num=card_num,
+                num_played=num_played,
+            )
+        )
+    return deck
+
+
+class _StubFetcher:
+    """Writes a deck for the id of each url, except the failing ids."""
+
+    failing_ids = set()
+
+    def __init__(self, parse, write_batch, **kwargs):
+        self.write_batch = write_batch
+        self.failed_urls = []
+
+    def run(self, urls):
+        decks = []
+        for url in urls:
+            deck_id = url.rsplit("deck_id=", 1)[-1]
+            if deck_id in self.failing_ids:
+                self.failed_urls.append(url)
+            else:
+                decks.append(_make_deck(deck_id))
+        self.write_batch(decks)
+        return len(decks)
+
+
+def test_backfill_keeps_checkpoint_when_decks_fail(database, monkeypatch):
+    listings = {0: {"kept": NOW - datetime.timedelta(days=1)}, 1: {}}
+    listings[0]["failing"] = listings[0]["kept"]
+    monkeypatch.setattr(
+        models_deck._WarcryNewIdGetter,
+        "get_listings_from_page",
+        lambda self, page: dict(listings.get(page, {})),
+    )
+    monkeypatch.setattr(models_deck.deck_fetching, "ConcurrentFetcher", _StubFetcher)
+    monkeypatch.setattr(_StubFetcher, "failing_ids", {"failing"})
+
+    models_deck.backfill_decks(pages_per_chunk=2)
+
+    checkpoint = models_deck.DeckBackfill.query.get("history")
+    assert checkpoint.next_page == 0
+    assert checkpoint.date_completed is None
+    assert models_deck.Deck.get_from_id("kept") is not None
+
+    monkeypatch.setattr(_StubFetcher, "failing_ids", set())
+    models_deck.backfill_decks(pages_per_chunk=2)
+
+    checkpoint = models_deck.DeckBackfill.query.get("history")
+    assert checkpoint.next_page == 2
+    assert checkpoint.date_completed is not None
+    assert models_deck.Deck.get_from_id("failing") is not None
+
+
+def _get_stored_cards(deck_id):
+    return {
+        (row.set_num, row.card_num): row.num_played
+        for row in models_deck.DeckHasCard.query.filter_by(deck_id=deck_id)
+    }
+
+
+def test_write_decks_deletes_removed_cards(database):
+    models_deck.write_decks([_make_deck("deck", {(1, 1): 4, (1, 2): 2})])
+
+    models_deck.write_decks([_make_deck("deck", {(1, 1): 3}, views=20)])
+
+    assert _get_stored_cards("deck") == {(1, 1): 3}
+    assert db.session.query(models_deck.Deck.views).filter_by(id="deck").scalar() == 20
+
+
+def test_write_decks_keeps_largest_count_of_repeated_card(database):
+    deck = _make_deck("deck", {(1, 1): 1})
+    # Such as a card in both the deck and its market.
+    deck.cards.append(
+        models_deck.DeckHasCard(deck_id="deck", set_num=1, card_num=1, num_played=3)
+    )
+    deck.cards.append(
+        models_deck.DeckHasCard(deck_id="deck", set_num=1, card_num=1, num_played=2)
+    )
+
+    models_deck.write_decks([deck])
+
+    assert _get_stored_cards("deck") == {(1, 1): 3}
+
+
+def test_remove_old_ids_keeps_unknown_and_newer_decks(database):
+    models_deck.write_decks(
+        [
+            _make_deck("known", days_old=1),
+            _make_deck("updated", days_old=3),
+            _make_deck("undated", days_old=3),
+        ]
+    )
+    listings = {
+        "known": NOW - datetime.timedelta(days=1),
+        "updated": NOW - datetime.timedelta(days=1),
+        "unknown": NOW,
+        "undated": None,
+    }
+
+    new_ids = models_deck._WarcryNewIdGetter.remove_old_ids(
+        list(listings.keys()), listings.values()
+    )
+
+    assert new_ids == ["updated", "unknown"]
+
+
+def _get_playrates(decksearch_id):
+    """The nonzero playrates. Rebuilds also keep zeros, which updates delete."""
+    return {
+        (row.set_num, row.card_num, row.count_in_deck): row.num_decks_with_count_or_less
+        for row in deck_search.DeckSearchHasCard.query.filter_by(
+            decksearch_id=decksearch_id
+        )
+        if row.num_decks_with_count_or_less
+    }
+
+
+def test_incremental_playrates_match_rebuild(database):
+    incremental = deck_search.DeckSearch(id=1, maximum_age_days=10)
+    rebuilt = deck_search.DeckSearch(id=2, maximum_age_days=10)
+    db.session.add_all([incremental, rebuilt])
+    models_deck.write_decks(
+        [
+            _make_deck("changed", {(1, 1): 4, (1, 2): 1}, days_old=1, views=10),
+            _make_deck("leaving", {(1, 1): 2}, days_old=5, views=100),
+            _make_deck("too_old", {(1, 3): 1}, days_old=20, views=1000),
+        ]
+    )
+    deck_search._rebuild_playrates([incremental], NOW)
+    db.session.commit()
+
+    # Retracts the changed deck from the applied deck search.
+    models_deck.write_decks(
+        [
+            _make_deck("changed", {(1, 1): 1, (1, 3): 2}, days_old=1, views=10),
+            _make_deck("entering", {(1, 2): 3}, days_old=2, views=1),
+        ]
+    )
+    later = NOW + datetime.timedelta(days=6)
+    deck_search._update_playrates_incrementally([incremental], later, sqlite.insert)
+    deck_search._rebuild_playrates([rebuilt], later)
+    db.session.commit()
+
+    assert _get_playrates(1) == _get_playrates(2)
+    assert _get_playrates(2) == {
+        (1, 1, 1): 10,
+        (1, 2, 1): 1,
+        (1, 2, 2): 1,
+        (1, 2, 3): 1,
+        (1, 3, 1): 10,
+        (1, 3, 2): 10,
+    }
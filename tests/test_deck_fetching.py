@@ -0,0 +1,93 @@
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+import infiltrate.deck_fetching as deck_fetching
+
+
+class _DeckDetailsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves {"deck_id": id} at /decks/<id>, and 404 for the id "missing"."""
+
+    def do_GET(self):
+        deck_id = self.path.rsplit("/", 1)[-1]
+        if deck_id == "missing":
+            self.send_error(404)
+            return
+        body = json.dumps({"deck_id": deck_id}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _DeckDetailsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_fetcher_writes_batches(server_url):
+    deck_ids = [f"deck{i}" for i in range(25)]
+    batches = []
+    sut = deck_fetching.ConcurrentFetcher(
+        parse=lambda page_json: page_json["deck_id"],
+        write_batch=lambda batch: batches.append(list(batch)),
+        num_workers=4,
+        requests_per_second=1000,
+        queue_size=5,
+        batch_size=10,
+    )
+
+    num_written = sut.run(
+        [f"{server_url}/decks/{deck_id}" for deck_id in deck_ids + ["missing"]]
+    )
+
+    assert num_written == 25
+    assert sorted(deck_id for batch in batches for deck_id in batch) == sorted(deck_ids)
+    assert max(len(batch) for batch in batches) == 10
+
+
+def test_concurrent_fetcher_skips_pages_with_unexpected_errors(server_url):
+    def parse(page_json):
+        if page_json["deck_id"] == "broken":
+            raise TypeError("unexpected page")
+        return page_json["deck_id"]
+
+    deck_ids = [f"deck{i}" for i in range(10)]
+    written = []
+    sut = deck_fetching.ConcurrentFetcher(
+        parse=parse,
+        write_batch=written.extend,
+        num_workers=4,
+        requests_per_second=1000,
+        batch_size=3,
+    )
+
+    num_written = sut.run(
+        [f"{server_url}/decks/{deck_id}" for deck_id in ["broken"] + deck_ids]
+    )
+
+    assert num_written == 10
+    assert sorted(written) == sorted(deck_ids)
+    assert sut.failed_urls == [f"{server_url}/decks/broken"]
+
+
+def test_token_bucket_limits_rate():
+    sut = deck_fetching.TokenBucket(rate=50, capacity=1)
+
+    start = time.monotonic()
+    for _ in range(11):
+        sut.acquire()
+
+    assert time.monotonic() - start >= 0.19
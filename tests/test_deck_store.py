@@ -0,0 +1,223 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import infiltrate.deck_store as deck_store
+import infiltrate.models.card as card
+import infiltrate.models.deck as models_deck
+
+NOW = datetime.datetime(2020, 6, 1)
+
+
+def _make_store():
+    decks = pd.DataFrame(
+        {
+            "id": ["new", "old", "middle"],
+            "date_updated": [
+                NOW - datetime.timedelta(days=1),
+                NOW - datetime.timedelta(days=20),
+                NOW - datetime.timedelta(days=5),
+            ],
+            "views": [10, 100, None],
+            "rating": [1, 2, 3],
+            "deck_type": ["throne", "expedition", "throne"],
+            "archetype": ["aggro", None, "control"],
+        }
+    )
+    deck_has_cards = pd.DataFrame(
+        {
+            "deck_id": ["old", "new", "new", "middle", "old"],
+            "set_num": [1, 1, 2, 1, 2],
+            "card_num": [1, 1, 5, 1, 5],
+            "num_played": [4, 2, 5, 1, 1],
+        }
+    )
+    return deck_store.DeckStore.from_frames(decks, deck_has_cards)
+
+
+def _get_counts(play_counts: pd.DataFrame):
+    return {
+        (row.set_num, row.card_num, row.count_in_deck): row.num_decks_with_count_or_less
+        for row in play_counts.itertuples()
+    }
+
+
+def _get_nonzero_counts(play_counts: pd.DataFrame):
+    return {key: count for key, count in _get_counts(play_counts).items() if count > 0}
+
+
+def test_from_frames_sorts_decks_by_date():
+    store = _make_store()
+    assert list(store.views) == [100, 0, 10]
+    assert list(store.deck_types) == [
+        models_deck.DeckType.expedition.value,
+        models_deck.DeckType.throne.value,
+        models_deck.DeckType.throne.value,
+    ]
+    assert store.archetypes[0] == deck_store.UNKNOWN_CODE
+    assert list(np.diff(store.indptr)) == [2, 1, 2]
+
+
+def test_get_play_counts():
+    store = _make_store()
+
+    play_counts = store.get_play_counts()
+
+    assert _get_counts(play_counts) == {
+        (1, 1, 1): 110,
+        (1, 1, 2): 110,
+        (1, 1, 3): 100,
+        (1, 1, 4): 100,
+        (2, 5, 1): 110,
+        (2, 5, 2): 10,
+        (2, 5, 3): 10,
+        (2, 5, 4): 10,
+    }
+
+
+def test_get_play_counts_window_and_filters():
+    store = _make_store()
+
+    recent = store.get_play_counts(oldest_date=NOW - datetime.timedelta(days=10))
+    throne_rating = store.get_play_counts(
+        weight=deck_store.RATING_WEIGHT, deck_types=[models_deck.DeckType.throne]
+    )
+
+    assert _get_counts(recent)[(1, 1, 1)] == 10
+    assert _get_counts(recent)[(1, 1, 3)] == 0
+    assert _get_counts(throne_rating)[(1, 1, 1)] == 4
+    assert _get_counts(throne_rating)[(2, 5, 4)] == 1
+
+
+def test_save_and_load(tmp_path):
+    store = _make_store()
+
+    store.save(str(tmp_path))
+    loaded = deck_store.DeckStore.load(str(tmp_path))
+
+    pd.testing.assert_frame_equal(loaded.get_play_counts(), store.get_play_counts())
+
+
+def test_save_replaces_loaded_store(tmp_path):
+    directory = str(tmp_path / "decks")
+    store = _make_store()
+    store.save(directory)
+    loaded = deck_store.DeckStore.load(directory)
+    smaller_store = deck_store.DeckStore(
+        **{
+            name: getattr(store, name)[:1] if name != "indptr" else store.indptr[:2]
+            for name in deck_store.DeckStore.ARRAY_NAMES
+        }
+    )
+
+    smaller_store.save(directory)
+    reloaded = deck_store.DeckStore.load(directory)
+
+    pd.testing.assert_frame_equal(loaded.get_play_counts(), store.get_play_counts())
+    assert list(reloaded.deck_ids) == list(store.deck_ids[:1])
+    assert [path.name for path in tmp_path.iterdir()] == ["decks"]
+
+
+def test_get_play_counts_half_life():
+    store = _make_store()
+
+    decayed = store.get_play_counts(half_life_days=5, now=NOW)
+
+    # The newest deck is a fifth of a half life old, and the oldest 4 half lives.
+    assert _get_counts(decayed)[(1, 1, 1)] == pytest.approx(
+        10 * 0.5 ** 0.2 + 100 * 0.5 ** 4
+    )
+    assert _get_counts(decayed)[(2, 5, 2)] == pytest.approx(10 * 0.5 ** 0.2)
+
+
+def test_playrate_cube_matches_store():
+    store = _make_store()
+
+    cube = store.get_playrate_cube([3, 10, 30], now=NOW)
+
+    for maximum_age_days in (3, 10, 30):
+        oldest_date = NOW - datetime.timedelta(days=maximum_age_days)
+        for deck_types in (None, [models_deck.DeckType.throne]):
+            expected = store.get_play_counts(
+                oldest_date=oldest_date, deck_types=deck_types
+            )
+            actual = cube.get_play_counts(maximum_age_days, deck_types)
+            assert _get_nonzero_counts(actual) == _get_nonzero_counts(expected)
+
+
+def test_playrate_cube_counts_decks_without_a_type():
+    decks = pd.DataFrame(
+        {
+            "id": ["typed", "untyped"],
+            "date_updated": [NOW - datetime.timedelta(days=1)] * 2,
+            "views": [10, 100],
+            "rating": [1, 2],
+            "deck_type": ["throne", None],
+            "archetype": ["aggro", "aggro"],
+        }
+    )
+    deck_has_cards = pd.DataFrame(
+        {
+            "deck_id": ["typed", "untyped"],
+            "set_num": [1, 1],
+            "card_num": [1, 1],
+            "num_played": [1, 1],
+        }
+    )
+    store = deck_store.DeckStore.from_frames(decks, deck_has_cards)
+
+    cube = store.get_playrate_cube([3], now=NOW)
+
+    assert _get_counts(cube.get_play_counts(3))[(1, 1, 1)] == 110
+    throne_counts = cube.get_play_counts(3, [models_deck.DeckType.throne])
+    assert _get_counts(throne_counts)[(1, 1, 1)] == 10
+    aggro_counts = cube.get_play_counts(3, archetypes=[models_deck.Archetype.aggro])
+    assert _get_counts(aggro_counts)[(1, 1, 1)] == 110
+
+
+def test_get_card_neighbours():
+    decks = pd.DataFrame(
+        {
+            "id": ["a", "b", "c"],
+            "date_updated": [NOW] * 3,
+            "views": [3, 1, 2],
+            "rating": [0] * 3,
+            "deck_type": ["throne"] * 3,
+            "archetype": [None] * 3,
+        }
+    )
+    deck_has_cards = pd.DataFrame(
+        {
+            "deck_id": ["a", "a", "b", "b", "c", "c"],
+            "set_num": [1] * 6,
+            "card_num": [1, 2, 1, 3, 2, 3],
+            "num_played": [4] * 6,
+        }
+    )
+    store = deck_store.DeckStore.from_frames(decks, deck_has_cards)
+
+    neighbours = store.get_card_neighbours(num_neighbours=2, decks_per_chunk=1)
+
+    assert neighbours.neighbour_indices.tolist() == [[1, 2], [0, 2], [1, 0]]
+    np.testing.assert_allclose(
+        neighbours.rates, [[3 / 4, 1 / 4], [3 / 5, 2 / 5], [2 / 3, 1 / 3]], rtol=1e-6
+    )
+    fit = neighbours.get_fit(np.array([True, False, False]))
+    assert fit.tolist() == pytest.approx([0, 3 / 5, 1 / 3])
+
+
+def test_get_completion_costs():
+    store = _make_store()
+    # Cards are (1, 1) and (2, 5), and the decks are old, middle, new.
+    owned_counts = store.get_card_counts({card.CardId(1, 1): 2})
+    craft_costs = np.array([50.0, np.inf])
+
+    costs, num_missing = store.get_completion_costs(
+        slice(0, len(store)), owned_counts, craft_costs
+    )
+
+    assert owned_counts.tolist() == [2, 0]
+    assert costs.tolist() == [np.inf, 0, np.inf]
+    assert num_missing.tolist() == [3, 0, 4]
@@ -0,0 +1,56 @@
+import pytest
+
+import infiltrate.instrumentation as instrumentation
+
+
+@pytest.fixture
+def registry():
+    instrumentation.REGISTRY.clear()
+    yield instrumentation.REGISTRY
+    instrumentation.REGISTRY.clear()
+
+
+def test_measure_records_rows(registry):
+    with instrumentation.measure("step", rows_in=3) as measurement:
+        measurement.rows_out = 12
+
+    stats = registry.get_stats()
+    assert len(stats) == 1
+    assert stats[0]["name"] == "step"
+    assert stats[0]["calls"] == 1
+    assert stats[0]["last_rows_in"] == 3
+    assert stats[0]["last_rows_out"] == 12
+    assert stats[0]["last_peak_bytes"] is None
+
+
+def test_measured_counts_rows(registry):
+    @instrumentation.measured(
+        "double",
+        count_rows_in=lambda values: len(values),
+        count_rows_out=lambda result, values: len(result),
+    )
+    def double(values):
+        return values * 2
+
+    double([1, 2])
+    double([1, 2, 3])
+
+    stats = registry.get_stats()[0]
+    assert stats["calls"] == 2
+    assert stats["last_rows_in"] == 3
+    assert stats["last_rows_out"] == 6
+
+
+def test_measure_records_peak_bytes_while_tracing(registry):
+    instrumentation.start_tracing_memory()
+    try:
+        with instrumentation.measure("outer"):
+            with instrumentation.measure("inner"):
+                data = bytearray(10_000_000)
+                del data
+    finally:
+        instrumentation.stop_tracing_memory()
+
+    stats = {step["name"]: step for step in registry.get_stats()}
+    assert stats["inner"]["last_peak_bytes"] >= 10_000_000
+    assert stats["outer"]["last_peak_bytes"] >= 10_000_000
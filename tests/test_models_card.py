@@ -12,7 +12,7 @@ def all_cards():
             "set_num": [0, 0, 0],
             "card_num": [0, 1, 2],
             "name": ["0", "1", "2"],
-            "rarity": [rarity.COMMON, rarity.UNCOMMON, rarity.RARE,],
+            "rarity": [rarity.COMMON.code, rarity.UNCOMMON.code, rarity.RARE.code,],
             "image_url": [
                 "https://cards.eternalwarcry.com/cards/full/Kaleb's_Favor.png",
                 "https://cards.eternalwarcry.com/cards/full/Blazing_Renegade.png",